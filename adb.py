@@ -0,0 +1,167 @@
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+import db
+import jobs
+import metrics
+
+
+def _cursor_factory():
+    # psycopg is imported with the first query, not at startup
+    import psycopg
+
+    class TimedAsyncCursor(psycopg.AsyncClientCursor):
+        """Async cursor binding parameters client-side, like psycopg2, so the SQL in queries.py, db.py and
+        jobs.py runs unchanged; records per-statement timings like dbpool.TimedCursor"""
+
+        async def execute(self, query, params=None, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await super().execute(query, params, **kwargs)
+            finally:
+                metrics.observe_query(query, params, time.perf_counter() - started)
+
+    return TimedAsyncCursor
+
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+
+async def get_pool():
+    """The process's async pool, opened on first use from the running event loop"""
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                from psycopg_pool import AsyncConnectionPool
+                pool = AsyncConnectionPool(
+                    kwargs={
+                        "host": os.getenv('PGHOST'),
+                        "dbname": os.getenv('PGDATABASE'),
+                        "user": os.getenv('PGUSER'),
+                        "password": os.getenv('PGPASSWORD'),
+                        "cursor_factory": _cursor_factory(),
+                    },
+                    min_size=int(os.getenv('PGPOOL_MIN', '1')),
+                    max_size=int(os.getenv('PGPOOL_MAX', '10')),
+                    timeout=float(os.getenv('PGPOOL_TIMEOUT', '30')),
+                    open=False,
+                )
+                await pool.open()
+                _pool = pool
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+@asynccontextmanager
+async def connection():
+    """Check out a connection; commit on success, roll back on error, always return it"""
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        # Connections are opened by the pool's own tasks; adb.pool_stats() counts them
+        metrics.record_checkout()
+        yield conn
+
+
+def pool_stats():
+    """db.pool_stats()'s keys for the async pool"""
+    if _pool is None:
+        return {"in_use": 0, "idle": 0, "checkouts": 0, "waits": 0, "timeouts": 0,
+                "connections_opened": 0, "connections_discarded": 0}
+    stats = _pool.get_stats()
+    return {
+        "in_use": stats.get("pool_size", 0) - stats.get("pool_available", 0),
+        "idle": stats.get("pool_available", 0),
+        "checkouts": stats.get("requests_num", 0),
+        "waits": stats.get("requests_queued", 0),
+        "timeouts": stats.get("requests_errors", 0),
+        "connections_opened": stats.get("connections_num", 0),
+        "connections_discarded": stats.get("connections_lost", 0) + stats.get("returns_bad", 0),
+        "min_size": stats.get("pool_min"),
+        "max_size": stats.get("pool_max"),
+        "requests_wait_ms": stats.get("requests_wait_ms", 0),
+    }
+
+
+async def run_steps(cursor, steps):
+    """db.run_steps on an async cursor"""
+    result = None
+    while True:
+        try:
+            sql, params, fetch = steps.send(result)
+        except StopIteration as done:
+            return done.value
+        await cursor.execute(sql, params)
+        result = await cursor.fetchone() if fetch == "one" else await cursor.fetchall() if fetch == "all" else None
+
+
+async def save_skills_list(skills_list, job_id=-1):
+    """db.save_skills_list for the async app"""
+    names = [db._skill_name(skill) for skill in skills_list]
+    async with connection() as conn:
+        cursor = conn.cursor()
+        skill_ids, inserted = await run_steps(cursor, db.resolve_skill_steps(names))
+        await cursor.execute(db.LINK_JOB_SKILLS, (job_id, sorted(set(skill_ids.values()))))
+    db.index_skills(inserted)
+    return {"skills": [{"id": skill_ids[name], "name": name} for name in names]}
+
+
+_schemas_ready = set()
+_schema_lock = None
+
+
+async def ensure_schema(schema):
+    """Create the tables of a module's SCHEMA (jobs, content_blocks) once per process, like
+    content_blocks.ensure_schema: on a connection of its own, committed before the schema counts
+    as ready, and before the caller checks out its connection"""
+    global _schema_lock
+    if schema in _schemas_ready:
+        return
+    if _schema_lock is None:
+        _schema_lock = asyncio.Lock()
+    async with _schema_lock:
+        if schema not in _schemas_ready:
+            async with connection() as conn:
+                await conn.execute(schema)
+            _schemas_ready.add(schema)
+
+
+async def enqueue_job(kind, payload, user_id):
+    """jobs.enqueue for the async app; worker.py runs the job"""
+    await ensure_schema(jobs.SCHEMA)
+    async with connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute(jobs.INSERT_JOB, (kind, json.dumps(payload), user_id))
+        return (await cursor.fetchone())[0]
+
+
+async def get_job(job_id, user_id):
+    await ensure_schema(jobs.SCHEMA)
+    async with connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute(jobs.SELECT_JOB, (job_id, user_id))
+        row = await cursor.fetchone()
+    if not row:
+        return None
+    return dict(zip(jobs.JOB_FIELDS, row))
+
+
+async def wait_job(job_id, user_id, timeout, poll_interval=0.5):
+    """Long-poll: the job once it has finished or `timeout` seconds have passed, holding neither
+    a worker nor a connection between polls"""
+    deadline = time.monotonic() + timeout
+    job = await get_job(job_id, user_id)
+    while job and job["status"] not in jobs.FINISHED and time.monotonic() < deadline:
+        await asyncio.sleep(min(poll_interval, max(0, deadline - time.monotonic())))
+        job = await get_job(job_id, user_id)
+    return job
+
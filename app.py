@@ -1,34 +1,101 @@
-from apiflask import APIFlask, Schema, HTTPTokenAuth, abort
-from apiflask.fields import String, Integer, List, Nested, Float
-from apiflask.validators import Length, Range
-from flask import request, g
+from apiflask import APIFlask, HTTPTokenAuth, HTTPError, abort
+from flask import request, g, Response, stream_with_context, jsonify, url_for
+from flask.json.provider import DefaultJSONProvider
 import os
-from dotenv import load_dotenv
 from datetime import datetime
 import json
 import re
-import requests
-from bs4 import BeautifulSoup
-from openai import OpenAI
-from db import get_db_connection
+import uuid
+import db
 import coe
+import content_blocks
+import httpcache
+import jsoncodec
+import jobs
+import llm
+import metrics
+import resilience
+import routing
+import semantic
+import service
+import stats
+import util
+from schemas import (
+    JobPostingSchema, SkillSelectionSchema, CourseOutlineSchema, SkillAssessmentListSchema, CourseProgressSchema,
+    TopicProgressSchema, ProgressReportSchema, TopicContentSchema, JobQuerySchema, LearningBlockQuerySchema,
+    ContentBlockPageSchema, ContentBlockQuerySchema
+)
+from users import USERS
+from prefetch import prefetcher
+import singleflight
+from singleflight import flights
 
 
-# Load environment variables
-load_dotenv()
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider on jsoncodec (orjson): the same types and key order, serialized faster"""
+
+    def dumps(self, obj, **kwargs):
+        if set(kwargs) - {"indent", "separators"}:
+            return super().dumps(obj, **kwargs)
+        return jsoncodec.dumps(obj, default=self.default, sort_keys=self.sort_keys,
+                               indent=bool(kwargs.get("indent"))).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return jsoncodec.loads(s)
+
 
 # Initialize app
 app = APIFlask(__name__, title='Learning API', version='1.0.0')
+app.json = JSONProvider(app)
 auth = HTTPTokenAuth(scheme='Bearer')
+metrics.init_app(app)
+httpcache.init_app(app)
 
-# Initialize OpenAI client
-openai_api_key=os.getenv('OPENAI_API_KEY')
-client = OpenAI(api_key=openai_api_key)
+@app.before_request
+def _tag_request():
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    g.request_id_token = util.set_request_id(g.request_id)
 
-# Simple user authentication (for demo purposes)
-USERS = {
-    'test_token': {'id': 1, 'username': 'test_user'}
-}
+@app.before_request
+def _deadline():
+    # Model calls made for this request time out when its deadline passes; X-Request-Deadline can shorten it
+    seconds = float(os.getenv('REQUEST_DEADLINE_SECONDS', '120'))
+    try:
+        seconds = min(seconds, float(request.headers.get('X-Request-Deadline', '')))
+    except ValueError:
+        pass
+    g.deadline_token = resilience.set_deadline(seconds)
+
+@app.before_request
+def _latency_budget():
+    # Clients that need a fast answer more than the best one send X-Latency-Budget: <seconds>
+    try:
+        budget = float(request.headers.get('X-Latency-Budget', ''))
+    except ValueError:
+        return
+    if budget > 0:
+        g.latency_budget_token = routing.set_request_budget(budget)
+
+@app.after_request
+def _return_request_id(response):
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+@app.teardown_request
+def _untag_request(exc):
+    token = g.pop('request_id_token', None)
+    if token is not None:
+        util.reset_request_id(token)
+    token = g.pop('latency_budget_token', None)
+    if token is not None:
+        routing.reset_request_budget(token)
+    token = g.pop('deadline_token', None)
+    if token is not None:
+        resilience.reset_deadline(token)
 
 @auth.verify_token
 def verify_token(token):
@@ -37,56 +104,6 @@ def verify_token(token):
         return True
     return True
 
-# Schema definitions
-class JobPostingSchema(Schema):
-    url = String(required=True, validate=Length(min=1))
-
-class SkillSchema(Schema):
-    id = Integer()
-    name = String()
-
-class SkillListSchema(Schema):
-    skills = List(Nested(SkillSchema))
-
-class SkillSelectionSchema(Schema):
-    skill_id = Integer(required=True)
-
-class CourseTopicSchema(Schema):
-    id = Integer()
-    title = String()
-    description = String()
-    sequence_number = Integer()
-
-class CourseOutlineSchema(Schema):
-    id = Integer()
-    skill_id = Integer()
-    title = String()
-    description = String()
-    topics = List(Nested(CourseTopicSchema))
-
-class SkillAssessmentSchema(Schema):
-    topic_id = Integer(required=True)
-    proficiency_level = Integer(required=True, validate=Range(min=1, max=5))
-
-class SkillAssessmentListSchema(Schema):
-    assessments = List(Nested(SkillAssessmentSchema))
-
-class CourseProgressSchema(Schema):
-    course_outline_id = Integer(required=True)
-
-class TopicProgressSchema(Schema):
-    topic_id = Integer(required=True)
-
-class ProgressReportSchema(Schema):
-    course_outline_id = Integer()
-    completion_percentage = Float()
-    current_topic_id = Integer()
-    next_topic_id = Integer()
-
-class TopicContentSchema(Schema):
-    topic_id = Integer()
-    content = String()
-
 # Routes
 @app.get("/")
 @app.get("/api/flight-check")
@@ -94,6 +111,18 @@ def flight_check():
       
     return coe.flight_check()
 
+@app.get("/api/metrics")
+def metrics_summary():
+    """Per call site model latency/tokens/cost, plus pool, cache and coalescing stats"""
+    return stats.summary(db.pool_stats)
+
+stats.register_collectors(db.pool_stats)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Route, SQL, connection pool and model call metrics in Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.post("/api/parse-job")
 @app.input(JobPostingSchema)
 def parse_job(json_data):
@@ -102,416 +131,303 @@ def parse_job(json_data):
     return skills_data 
     
 
+def _error_status(e):
+    """Status for an error caught by a route: keep aborts as they are, otherwise as service.error_status"""
+    if isinstance(e, HTTPError):
+        return e.status_code
+    return service.error_status(e)
+
+def _wants_async():
+    return request.args.get('async', '').lower() in ('1', 'true', 'yes')
+
+def _job_owner():
+    """Id of the user queuing or reading a job; jobs are only kept for known users"""
+    user = g.get('current_user')
+    if user is None:
+        abort(401, message="Queued jobs need a known user token")
+    return user['id']
+
+def _accepted(job_id):
+    """202 response pointing at the status endpoint of a queued job"""
+    status_url = url_for('get_job', job_id=job_id)
+    response = jsonify({"job_id": job_id, "status": "queued", "status_url": status_url})
+    response.status_code = 202
+    response.headers['Location'] = status_url
+    return response
+
 @app.post('/api/job-posting')
 @app.input(JobPostingSchema)
 #@app.output(SkillListSchema)
 @auth.login_required
-def submit_job_posting(data):
-    """Submit a job posting URL to extract skills"""
+def submit_job_posting(json_data):
+    """Submit a job posting URL to extract skills. With ?async=1, queue it and return a job id"""
     #url = data['url']
     
     # Extract job posting content
     try:
-        skills_data=coe.parse_job(data)
+        if _wants_async():
+            return _accepted(jobs.enqueue('parse_job', json_data, _job_owner()))
+
+        skills_data=coe.parse_job(json_data)
         
         return skills_data
     
     except Exception as e:
-        print(f"Error processing job posting: {str(e)}")
-        abort(500, message=f"Error processing job posting: {str(e)}")
+        util.log_error("Error processing job posting: %s", e)
+        abort(_error_status(e), message=f"Error processing job posting: {str(e)}")
+
+def _run(steps):
+    """Run service.py steps in a transaction of their own"""
+    with db.connection() as conn:
+        return db.run_steps(conn.cursor(), steps)
+
+def _generate_outline(skill_id, skill_name):
+    """Generate and store a course outline unless another worker already has.
+
+    The generation is claimed in the database first, so workers in other processes wait for
+    its outline instead of calling the model too. No connection is held while the model answers.
+    """
+    singleflight.ensure_schema()
+    outline, generated = singleflight.generate_once(
+        _run, "outline", skill_id, lambda: service.outline_of(skill_id),
+        # Generate a course outline using OpenAI
+        lambda: coe.select_skill_outline(skill_name),
+        lambda outline_data: service.store_outline(skill_id, outline_data))
+    if generated:
+        service.outline_stored(outline)
+        semantic.store(semantic.SKILLS, skill_name, skill_id=skill_id)
+    return outline
+
+def _topic_content(topic_id):
+    """Return (revision, content) of a topic's stored content, generating it once across workers if missing"""
+    content_result = _run(service.stored_topic_content(topic_id))
+    if content_result:
+        return content_result
+
+    return flights.do(("topic_content", topic_id), lambda: _generate_topic_content(topic_id))
+
+def _generate_topic_content(topic_id):
+    """Generate and store a topic's content and its blocks; claimed like _generate_outline, with no
+    connection held during the model call"""
+    topic_title, topic_description, skill_name = _run(service.topic_details(topic_id))
+
+    singleflight.ensure_schema()
+    content_result, _ = singleflight.generate_once(
+        _run, "topic_content", topic_id, lambda: service.stored_topic_content(topic_id),
+        # Generate content using OpenAI
+        lambda: llm.chat("begin_course", **coe.topic_content_request(skill_name, topic_title, topic_description)),
+        lambda content: service.store_topic_content(topic_id, content))
+    return content_result
+
+def _prefetch_topic_content(topic_id):
+    """Generate a topic's content ahead of the learner; False if it was already stored"""
+    content_blocks.ensure_schema()
+    if _run(service.stored_topic_content(topic_id)):
+        return False
+    flights.do(("topic_content", topic_id), lambda: _generate_topic_content(topic_id))
+    return True
+
+def _content_page(topic_id, cursor_value, limit):
+    """A page of a topic's content blocks, generating the content or storing its blocks on first read"""
+    params = content_blocks.page_params(topic_id, cursor_value, limit)
+    rows = _run(service.read_page(params))
+    if content_blocks.needs_blocks(params, rows):
+        revision, content = _topic_content(topic_id)
+        _run(service.store_blocks(revision, content))
+        rows = _run(service.read_page({**params, "revision": revision}))
+    return service.content_page(topic_id, rows, limit)
+
+def _select_skill_outline(skill_id):
+    """Return the course outline for a skill, generating it if needed"""
+    # Outlines never change once generated, so popular skills are served from memory
+    outline = db.cached_outline(skill_id)
+    if outline:
+        return outline
+
+    skill_name, outline = _run(service.stored_outline(skill_id))
+    if outline:
+        return outline
+
+    # ...or, with SEMANTIC_INDEX on, one that means the same thing in other words
+    similar = semantic.lookup(semantic.SKILLS, skill_name)
+    if similar and similar["skill_id"] != skill_id:
+        outline = _run(service.reused_outline(skill_id, similar["skill_id"], "semantic"))
+        if outline:
+            return outline
+
+    # Concurrent requests for the same skill wait on a single generation
+    return flights.do(("outline", skill_id), lambda: _generate_outline(skill_id, skill_name))
 
 @app.post('/api/select-skill')
 @app.input(SkillSelectionSchema)
 @app.output(CourseOutlineSchema)
 @auth.login_required
-def select_skill(data):
-    """Generate a course outline based on the selected skill"""
-    skill_id = data['skill_id']
+def select_skill(json_data):
+    """Generate a course outline based on the selected skill. With ?async=1, queue it and return a job id"""
+    skill_id = json_data['skill_id']
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get skill name
-        cursor.execute("SELECT name FROM skills WHERE id = %s", (skill_id,))
-        result = cursor.fetchone()
-        
-        if not result:
-            abort(404, message="Skill not found")
-        
-        skill_name = result[0]
-        
-        # Check if we already have a course outline for this skill
-        cursor.execute(
-            "SELECT id, title, description FROM course_outlines WHERE skill_id = %s",
-            (skill_id,)
-        )
-        existing_outline = cursor.fetchone()
-        
-        if existing_outline:
-            outline_id, title, description = existing_outline
-            
-            # Get existing topics
-            cursor.execute(
-                "SELECT id, title, description, sequence_number FROM course_topics WHERE course_outline_id = %s ORDER BY sequence_number",
-                (outline_id,)
-            )
-            topics = [
-                {
-                    "id": row[0],
-                    "title": row[1],
-                    "description": row[2],
-                    "sequence_number": row[3]
-                }
-                for row in cursor.fetchall()
-            ]
-            
-            return {
-                "id": outline_id,
-                "skill_id": skill_id,
-                "title": title,
-                "description": description,
-                "topics": topics
-            }
-        
-        # Generate a course outline using OpenAI
-        prompt = f"""
-        Create a comprehensive course outline for learning {skill_name}. 
-        The outline should include 5-10 topics that progress from beginner to advanced concepts.
-        For each topic, provide a brief description.
-        
-        Return the result as a JSON object with the following structure:
-        {{
-            "title": "Course title",
-            "description": "Overall course description",
-            "topics": [
-                {{
-                    "title": "Topic 1 title",
-                    "description": "Topic 1 description",
-                    "sequence_number": 1
-                }},
-                ...
-            ]
-        }}
-        """
-        
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that creates learning outlines."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
-        )
-        
-        outline_data = json.loads(response.choices[0].message.content)
-        
-        # Store course outline in database
-        cursor.execute(
-            "INSERT INTO course_outlines (skill_id, title, description) VALUES (%s, %s, %s) RETURNING id",
-            (skill_id, outline_data['title'], outline_data['description'])
-        )
-        outline_id = cursor.fetchone()[0]
-        
-        # Store topics
-        topics = []
-        for topic in outline_data['topics']:
-            cursor.execute(
-                "INSERT INTO course_topics (course_outline_id, title, description, sequence_number) VALUES (%s, %s, %s, %s) RETURNING id",
-                (outline_id, topic['title'], topic['description'], topic['sequence_number'])
-            )
-            topic_id = cursor.fetchone()[0]
-            topic['id'] = topic_id
-            topics.append(topic)
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
-        return {
-            "id": outline_id,
-            "skill_id": skill_id,
-            "title": outline_data['title'],
-            "description": outline_data['description'],
-            "topics": topics
-        }
+        if _wants_async():
+            return _accepted(jobs.enqueue('select_skill', {'skill_id': skill_id}, _job_owner()))
+
+        return _select_skill_outline(skill_id)
     
     except Exception as e:
-        print(f"Error generating course outline: {str(e)}")
-        abort(500, message=f"Error generating course outline: {str(e)}")
+        util.log_error("Error generating course outline: %s", e)
+        abort(_error_status(e), message=f"Error generating course outline: {str(e)}")
+
+@app.get('/api/skills/<int:skill_id>/outline')
+@app.output(CourseOutlineSchema)
+@auth.login_required
+def get_skill_outline(skill_id):
+    """select-skill as a cacheable GET: the skill's course outline, generated on first request"""
+    try:
+        return _select_skill_outline(skill_id), 200, {'Cache-Control': httpcache.SHARED}
+
+    except Exception as e:
+        util.log_error("Error generating course outline: %s", e)
+        abort(_error_status(e), message=f"Error generating course outline: {str(e)}")
 
 @app.post('/api/assess-skills')
 @app.input(SkillAssessmentListSchema)
 @app.output({}, status_code=200)
 @auth.login_required
-def assess_skills(data):
+def assess_skills(json_data):
     """Store user's self-assessment of skill levels"""
     user_id = g.current_user['id']
-    assessments = data['assessments']
+    assessments = json_data['assessments']
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        for assessment in assessments:
-            topic_id = assessment['topic_id']
-            proficiency_level = assessment['proficiency_level']
-            
-            # Get the skill_id for this topic
-            cursor.execute(
-                """
-                SELECT s.id 
-                FROM skills s
-                JOIN course_outlines co ON s.id = co.skill_id
-                JOIN course_topics ct ON co.id = ct.course_outline_id
-                WHERE ct.id = %s
-                """,
-                (topic_id,)
-            )
-            result = cursor.fetchone()
-            
-            if not result:
-                continue
-                
-            skill_id = result[0]
-            
-            # Store or update the assessment
-            cursor.execute(
-                """
-                INSERT INTO user_skill_assessments (user_id, skill_id, proficiency_level)
-                VALUES (%s, %s, %s)
-                ON CONFLICT (user_id, skill_id) 
-                DO UPDATE SET proficiency_level = %s, created_at = CURRENT_TIMESTAMP
-                """,
-                (user_id, skill_id, proficiency_level, proficiency_level)
-            )
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
+        _run(service.store_assessments(user_id, assessments))
         return {"message": "Skill assessments stored successfully"}
     
     except Exception as e:
-        print(f"Error storing skill assessments: {str(e)}")
-        abort(500, message=f"Error storing skill assessments: {str(e)}")
+        util.log_error("Error storing skill assessments: %s", e)
+        abort(_error_status(e), message=f"Error storing skill assessments: {str(e)}")
 
 @app.post('/api/begin-course')
 @app.input(CourseProgressSchema)
 @app.output(TopicContentSchema)
 @auth.login_required
-def begin_course(data):
+def begin_course(json_data):
     """Begin or resume a course and get content for the current topic"""
     user_id = g.current_user['id']
-    course_outline_id = data['course_outline_id']
+    course_outline_id = json_data['course_outline_id']
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if user already has progress for this course
-        cursor.execute(
-            "SELECT current_topic_id FROM user_course_progress WHERE user_id = %s AND course_outline_id = %s",
-            (user_id, course_outline_id)
-        )
-        result = cursor.fetchone()
-        
-        if result and result[0]:
-            # User has existing progress, get the current topic
-            topic_id = result[0]
-        else:
-            # Get the first topic of the course
-            cursor.execute(
-                "SELECT id FROM course_topics WHERE course_outline_id = %s ORDER BY sequence_number ASC LIMIT 1",
-                (course_outline_id,)
-            )
-            result = cursor.fetchone()
-            
-            if not result:
-                abort(404, message="No topics found for this course")
-                
-            topic_id = result[0]
-            
-            # Create or update progress record
-            cursor.execute(
-                """
-                INSERT INTO user_course_progress (user_id, course_outline_id, current_topic_id, completion_percentage)
-                VALUES (%s, %s, %s, 0)
-                ON CONFLICT (user_id, course_outline_id) 
-                DO UPDATE SET current_topic_id = %s, last_accessed = CURRENT_TIMESTAMP
-                """,
-                (user_id, course_outline_id, topic_id, topic_id)
-            )
-            conn.commit()
-        
-        # Check if we already have content for this topic
-        cursor.execute(
-            "SELECT content FROM topic_content WHERE topic_id = %s",
-            (topic_id,)
-        )
-        content_result = cursor.fetchone()
-        
-        if content_result:
-            content = content_result[0]
-        else:
-            # Get topic details
-            cursor.execute(
-                """
-                SELECT ct.title, ct.description, s.name
-                FROM course_topics ct
-                JOIN course_outlines co ON ct.course_outline_id = co.id
-                JOIN skills s ON co.skill_id = s.id
-                WHERE ct.id = %s
-                """,
-                (topic_id,)
-            )
-            topic_result = cursor.fetchone()
-            
-            if not topic_result:
-                abort(404, message="Topic not found")
-                
-            topic_title, topic_description, skill_name = topic_result
-            
-            # Generate content using OpenAI
-            prompt = f"""
-            Create comprehensive learning content for a topic in a course about {skill_name}.
-            
-            Topic: {topic_title}
-            Description: {topic_description}
-            
-            The content should include:
-            1. An introduction to the topic
-            2. Key concepts and explanations
-            3. Examples or code snippets where applicable
-            4. Best practices
-            5. A summary
-            
-            Format the content with Markdown.
-            """
-            
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are an expert educator creating learning content."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            
-            content = response.choices[0].message.content
-            
-            # Store the generated content
-            cursor.execute(
-                "INSERT INTO topic_content (topic_id, content) VALUES (%s, %s)",
-                (topic_id, content)
-            )
-            conn.commit()
-        
-        cursor.close()
-        conn.close()
-        
+        # Generating the topic's content stores its blocks too
+        content_blocks.ensure_schema()
+        topic_id, topic_ids = _run(service.start_course(user_id, course_outline_id))
+
+        # The learner will likely go on to the next topics; start generating them now
+        prefetcher.schedule(prefetcher.following(topic_ids, topic_id), _prefetch_topic_content)
+
+        # Only the first screen of blocks when asked for, the whole content otherwise
+        if json_data.get('page_size'):
+            page = _content_page(topic_id, None, json_data['page_size'])
+            prefetcher.record_read(topic_id)
+            return page
+
+        # Get stored content, or generate it once for all concurrent callers, with no connection held
+        revision, content = _topic_content(topic_id)
+        prefetcher.record_read(topic_id)
+
         return {
             "topic_id": topic_id,
+            "revision": revision,
             "content": content
         }
     
     except Exception as e:
-        print(f"Error beginning course: {str(e)}")
-        abort(500, message=f"Error beginning course: {str(e)}")
+        util.log_error("Error beginning course: %s", e)
+        abort(_error_status(e), message=f"Error beginning course: {str(e)}")
+
+@app.get('/api/topics/<int:topic_id>/blocks')
+@app.input(ContentBlockQuerySchema, location='query')
+@app.output(ContentBlockPageSchema)
+@auth.login_required
+def get_content_blocks(topic_id, query_data):
+    """A page of a topic's content blocks; pass next_cursor back as ?cursor= for the next page"""
+    try:
+        content_blocks.ensure_schema()
+        page = _content_page(topic_id, query_data['cursor'], query_data['limit'])
+        if not query_data['cursor']:
+            prefetcher.record_read(topic_id)
+        # A cursor names a revision whose blocks never change; the first page follows the latest one
+        cache_control = httpcache.IMMUTABLE if query_data['cursor'] else httpcache.SHARED
+        return page, 200, {'Cache-Control': cache_control}
+
+    except Exception as e:
+        util.log_error("Error reading content blocks: %s", e)
+        abort(_error_status(e), message=f"Error reading content blocks: {str(e)}")
 
 @app.post('/api/advance-topic')
 @app.input(TopicProgressSchema)
 @app.output(ProgressReportSchema)
 @auth.login_required
-def advance_topic(data):
+def advance_topic(json_data):
     """Mark current topic as complete and advance to the next topic"""
     user_id = g.current_user['id']
-    completed_topic_id = data['topic_id']
+    completed_topic_id = json_data['topic_id']
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get course outline id for this topic
-        cursor.execute(
-            "SELECT course_outline_id FROM course_topics WHERE id = %s",
-            (completed_topic_id,)
-        )
-        result = cursor.fetchone()
-        
-        if not result:
-            abort(404, message="Topic not found")
-            
-        course_outline_id = result[0]
-        
-        # Get total number of topics in the course
-        cursor.execute(
-            "SELECT COUNT(*) FROM course_topics WHERE course_outline_id = %s",
-            (course_outline_id,)
-        )
-        total_topics = cursor.fetchone()[0]
-        
-        # Get the next topic
-        cursor.execute(
-            """
-            SELECT id FROM course_topics 
-            WHERE course_outline_id = %s AND sequence_number > (
-                SELECT sequence_number FROM course_topics WHERE id = %s
-            )
-            ORDER BY sequence_number ASC LIMIT 1
-            """,
-            (course_outline_id, completed_topic_id)
-        )
-        next_topic_result = cursor.fetchone()
-        
-        if next_topic_result:
-            next_topic_id = next_topic_result[0]
-            # Calculate completion percentage
-            cursor.execute(
-                "SELECT sequence_number FROM course_topics WHERE id = %s",
-                (next_topic_id,)
-            )
-            next_sequence = cursor.fetchone()[0]
-            completion_percentage = (next_sequence - 1) / total_topics * 100
-        else:
-            # This was the last topic
-            next_topic_id = None
-            completion_percentage = 100
-        
-        # Update progress
-        cursor.execute(
-            """
-            UPDATE user_course_progress 
-            SET current_topic_id = %s, completion_percentage = %s, last_accessed = CURRENT_TIMESTAMP
-            WHERE user_id = %s AND course_outline_id = %s
-            RETURNING id
-            """,
-            (next_topic_id, completion_percentage, user_id, course_outline_id)
-        )
-        
-        if cursor.rowcount == 0:
-            # No existing progress record, create one
-            cursor.execute(
-                """
-                INSERT INTO user_course_progress (user_id, course_outline_id, current_topic_id, completion_percentage)
-                VALUES (%s, %s, %s, %s)
-                """,
-                (user_id, course_outline_id, next_topic_id, completion_percentage)
-            )
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
-        return {
-            "course_outline_id": course_outline_id,
-            "completion_percentage": completion_percentage,
-            "current_topic_id": completed_topic_id,
-            "next_topic_id": next_topic_id
-        }
+        report, topic_ids = _run(service.advance_topic(user_id, completed_topic_id))
+        prefetcher.schedule(prefetcher.following(topic_ids, completed_topic_id), _prefetch_topic_content)
+        return report
     
     except Exception as e:
-        print(f"Error advancing topic: {str(e)}")
-        abort(500, message=f"Error advancing topic: {str(e)}")
+        util.log_error("Error advancing topic: %s", e)
+        abort(_error_status(e), message=f"Error advancing topic: {str(e)}")
+
+@app.get('/api/jobs/<int:job_id>')
+@app.input(JobQuerySchema, location='query')
+@auth.login_required
+def get_job(job_id, query_data):
+    """Status and result of a queued generation job of the caller.
+
+    ?wait=N is ignored here: a long-poll would hold a worker thread for N seconds, so it is only
+    served by the async app. An unfinished job says when to poll again with Retry-After.
+    """
+    job = jobs.get(job_id, _job_owner())
+    if not job:
+        abort(404, message="Job not found")
+    if job['status'] not in jobs.FINISHED:
+        return job, 200, {'Retry-After': '1'}
+    return job
+
+# Work the background worker (worker.py) can run for the async mode of the routes above
+JOB_HANDLERS = {
+    'parse_job': coe.parse_job,
+    'select_skill': lambda payload: _select_skill_outline(payload['skill_id']),
+}
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.get('/api/learning-block/stream')
+@app.input(LearningBlockQuerySchema, location='query')
+@auth.login_required
+def stream_learning_block(query_data):
+    """Stream a subtopic's learning blocks as server-sent events, one `block` event per block"""
+    topic = query_data['topic']
+    subtopic = query_data['subtopic']
+
+    def events():
+        try:
+            count = 0
+            for block in coe.stream_learning_block(topic, subtopic):
+                yield _sse("block", block)
+                count += 1
+            yield _sse("done", {"topic": topic, "subtopic": subtopic, "blocks": count})
+        except Exception as e:
+            util.log_error("Error streaming learning block: %s", e)
+            yield _sse("error", {"message": f"Error streaming learning block: {str(e)}"})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,529 @@
+"""The API's routes and schemas served from an event loop, for many slow model calls at once.
+
+Model calls go through AsyncOpenAI and SQL through an async psycopg pool, so a single process
+holds hundreds of in-flight generations instead of one per worker thread:
+
+    uvicorn asgi:app --port 5000
+
+app.py keeps serving the same API synchronously (flask run, gunicorn, worker.py).
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from marshmallow import ValidationError
+from starlette.applications import Starlette
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.http import http_date
+import adb
+import coe
+import content_blocks
+import db
+import httpcache
+import jsoncodec
+import llm
+import metrics
+import resilience
+import routing
+import semantic
+import service
+import stats
+import util
+from schemas import (
+    JobPostingSchema, SkillSelectionSchema, CourseOutlineSchema, SkillAssessmentListSchema, CourseProgressSchema,
+    TopicProgressSchema, ProgressReportSchema, TopicContentSchema, JobQuerySchema, LearningBlockQuerySchema,
+    ContentBlockPageSchema, ContentBlockQuerySchema
+)
+from prefetch import prefetcher
+import singleflight
+from singleflight import flights
+from users import USERS
+
+
+def _json_default(value):
+    # Same encodings as Flask's JSON provider
+    if isinstance(value, datetime):
+        return http_date(value)
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class JSON(JSONResponse):
+    def render(self, content):
+        return jsoncodec.dumps(content, default=_json_default)
+
+
+def abort(status_code, message):
+    raise HTTPException(status_code, detail=message)
+
+
+def _error_status(e):
+    """Status for an error caught by a route, as in app.py"""
+    if isinstance(e, HTTPException):
+        return e.status_code
+    return service.error_status(e)
+
+
+def _fail(e, what):
+    util.log_error("Error %s: %s", what, e)
+    abort(_error_status(e), f"Error {what}: {str(e)}")
+
+
+async def _http_error(request, exc):
+    # APIFlask's error body
+    return JSON({"detail": {}, "message": exc.detail}, status_code=exc.status_code, headers=exc.headers)
+
+
+async def _json_input(request, schema):
+    body = await request.body()
+    try:
+        data = jsoncodec.loads(body) if body else {}
+    except ValueError:
+        abort(400, "The request body is not valid JSON")
+    return _validate(schema, data, "json")
+
+
+def _query_input(request, schema):
+    return _validate(schema, dict(request.query_params), "query")
+
+
+def _validate(schema, data, location):
+    try:
+        return schema().load(data)
+    except ValidationError as e:
+        raise _InvalidInput(location, e.messages)
+
+
+class _InvalidInput(Exception):
+    def __init__(self, location, messages):
+        self.location = location
+        self.messages = messages
+
+
+async def _validation_error(request, exc):
+    return JSON({"detail": {exc.location: exc.messages}, "message": "Validation error"}, status_code=422)
+
+
+def _output(schema, data, headers=None):
+    return JSON(schema().dump(data), headers=headers)
+
+
+def _current_user(request, required=True):
+    """USERS entry for the Bearer token; routes keeping per-user state need a known token"""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    user = USERS.get(token) if scheme.lower() == "bearer" else None
+    if user is None and required:
+        abort(401, "Unauthorized")
+    return user
+
+
+def _wants_async(request):
+    return request.query_params.get('async', '').lower() in ('1', 'true', 'yes')
+
+
+def _accepted(job_id):
+    """202 response pointing at the status endpoint of a queued job"""
+    status_url = app.url_path_for('get_job', job_id=job_id)
+    return JSON({"job_id": job_id, "status": "queued", "status_url": status_url}, status_code=202,
+                headers={'Location': status_url})
+
+
+async def flight_check(request):
+    return JSON(coe.flight_check())
+
+
+async def metrics_summary(request):
+    """Per call site model latency/tokens/cost, plus pool, cache and coalescing stats"""
+    return JSON(stats.summary(adb.pool_stats))
+
+
+async def prometheus_metrics(request):
+    """Route, SQL, connection pool and model call metrics in Prometheus text format"""
+    return Response(metrics.render(), media_type='text/plain; version=0.0.4')
+
+
+async def parse_job(request):
+    json_data = await _json_input(request, JobPostingSchema)
+    return JSON(await coe.aparse_job(json_data['url']))
+
+
+async def submit_job_posting(request):
+    """Submit a job posting URL to extract skills. With ?async=1, queue it and return a job id"""
+    json_data = await _json_input(request, JobPostingSchema)
+    user = _current_user(request, required=_wants_async(request))
+    try:
+        if _wants_async(request):
+            return _accepted(await adb.enqueue_job('parse_job', json_data, user['id']))
+
+        return JSON(await coe.aparse_job(json_data))
+
+    except Exception as e:
+        _fail(e, "processing job posting")
+
+
+async def _run(steps):
+    """Run service.py steps in a transaction of their own"""
+    async with adb.connection() as conn:
+        return await adb.run_steps(conn.cursor(), steps)
+
+
+async def _generate_outline(skill_id, skill_name):
+    """Generate and store a course outline unless another worker already has.
+
+    The generation is claimed in the database first, so workers in other processes wait for
+    its outline instead of calling the model too. No connection is held while the model answers.
+    """
+    await adb.ensure_schema(singleflight.CLAIMS_SCHEMA)
+    outline, generated = await singleflight.agenerate_once(
+        _run, "outline", skill_id, lambda: service.outline_of(skill_id),
+        lambda: coe.aselect_skill_outline(skill_name),
+        lambda outline_data: service.store_outline(skill_id, outline_data))
+    if generated:
+        service.outline_stored(outline)
+        await asyncio.to_thread(semantic.store, semantic.SKILLS, skill_name, skill_id=skill_id)
+    return outline
+
+
+async def _select_skill_outline(skill_id):
+    """Return the course outline for a skill, generating it if needed"""
+    outline = db.cached_outline(skill_id)
+    if outline:
+        return outline
+
+    skill_name, outline = await _run(service.stored_outline(skill_id))
+    if outline:
+        return outline
+
+    # ...or, with SEMANTIC_INDEX on, one that means the same thing in other words
+    similar = await asyncio.to_thread(semantic.lookup, semantic.SKILLS, skill_name)
+    if similar and similar["skill_id"] != skill_id:
+        outline = await _run(service.reused_outline(skill_id, similar["skill_id"], "semantic"))
+        if outline:
+            return outline
+
+    # Concurrent requests for the same skill wait on a single generation
+    return await flights.ado(("outline", skill_id), lambda: _generate_outline(skill_id, skill_name))
+
+
+async def select_skill(request):
+    """Generate a course outline based on the selected skill. With ?async=1, queue it and return a job id"""
+    json_data = await _json_input(request, SkillSelectionSchema)
+    user = _current_user(request, required=_wants_async(request))
+    skill_id = json_data['skill_id']
+
+    try:
+        if _wants_async(request):
+            return _accepted(await adb.enqueue_job('select_skill', {'skill_id': skill_id}, user['id']))
+
+        return _output(CourseOutlineSchema, await _select_skill_outline(skill_id))
+
+    except Exception as e:
+        _fail(e, "generating course outline")
+
+
+async def get_skill_outline(request):
+    """select-skill as a cacheable GET: the skill's course outline, generated on first request"""
+    _current_user(request, required=False)
+    skill_id = request.path_params['skill_id']
+    try:
+        return _output(CourseOutlineSchema, await _select_skill_outline(skill_id), {'Cache-Control': httpcache.SHARED})
+
+    except Exception as e:
+        _fail(e, "generating course outline")
+
+
+async def assess_skills(request):
+    """Store user's self-assessment of skill levels"""
+    json_data = await _json_input(request, SkillAssessmentListSchema)
+    user_id = _current_user(request)['id']
+    assessments = json_data.get('assessments', [])
+
+    try:
+        await _run(service.store_assessments(user_id, assessments))
+        return JSON({})
+
+    except Exception as e:
+        _fail(e, "storing skill assessments")
+
+
+async def _generate_topic_content(topic_id):
+    """Generate and store a topic's content and its blocks; claimed like _generate_outline, with no
+    connection held during the model call. Returns (revision, content)"""
+    topic_title, topic_description, skill_name = await _run(service.topic_details(topic_id))
+
+    await adb.ensure_schema(content_blocks.SCHEMA)
+    await adb.ensure_schema(singleflight.CLAIMS_SCHEMA)
+    content_result, _ = await singleflight.agenerate_once(
+        _run, "topic_content", topic_id, lambda: service.stored_topic_content(topic_id),
+        lambda: llm.achat("begin_course", **coe.topic_content_request(skill_name, topic_title, topic_description)),
+        lambda content: service.store_topic_content(topic_id, content))
+    return content_result
+
+
+async def _topic_content(topic_id):
+    """(revision, content) of a topic, generating it once across callers if missing"""
+    content_result = await _run(service.stored_topic_content(topic_id))
+    if content_result:
+        return content_result
+    return await flights.ado(("topic_content", topic_id), lambda: _generate_topic_content(topic_id))
+
+
+async def _prefetch_topic_content(topic_id):
+    """Generate a topic's content ahead of the learner; False if it was already stored"""
+    if await _run(service.stored_topic_content(topic_id)):
+        return False
+    await flights.ado(("topic_content", topic_id), lambda: _generate_topic_content(topic_id))
+    return True
+
+
+async def _read_page(params):
+    await adb.ensure_schema(content_blocks.SCHEMA)
+    return await _run(service.read_page(params))
+
+
+async def _content_page(topic_id, cursor_value, limit):
+    """A page of a topic's content blocks, generating the content or storing its blocks on first read"""
+    params = content_blocks.page_params(topic_id, cursor_value, limit)
+    rows = await _read_page(params)
+    if content_blocks.needs_blocks(params, rows):
+        revision, content = await _topic_content(topic_id)
+        await _run(service.store_blocks(revision, content))
+        rows = await _read_page({**params, "revision": revision})
+    return service.content_page(topic_id, rows, limit)
+
+
+async def begin_course(request):
+    """Begin or resume a course and get content for the current topic"""
+    json_data = await _json_input(request, CourseProgressSchema)
+    user_id = _current_user(request)['id']
+    course_outline_id = json_data['course_outline_id']
+
+    try:
+        topic_id, topic_ids = await _run(service.start_course(user_id, course_outline_id))
+
+        # The learner will likely go on to the next topics; start generating them now
+        prefetcher.aschedule(prefetcher.following(topic_ids, topic_id), _prefetch_topic_content)
+
+        # Only the first screen of blocks when asked for, the whole content otherwise
+        if json_data.get('page_size'):
+            page = await _content_page(topic_id, None, json_data['page_size'])
+            prefetcher.record_read(topic_id)
+            return _output(TopicContentSchema, page)
+
+        revision, content = await _topic_content(topic_id)
+        prefetcher.record_read(topic_id)
+        return _output(TopicContentSchema, {"topic_id": topic_id, "revision": revision, "content": content})
+
+    except Exception as e:
+        _fail(e, "beginning course")
+
+
+async def get_content_blocks(request):
+    """A page of a topic's content blocks; pass next_cursor back as ?cursor= for the next page"""
+    query_data = _query_input(request, ContentBlockQuerySchema)
+    _current_user(request, required=False)
+    topic_id = request.path_params['topic_id']
+    try:
+        page = await _content_page(topic_id, query_data['cursor'], query_data['limit'])
+        if not query_data['cursor']:
+            prefetcher.record_read(topic_id)
+        # A cursor names a revision whose blocks never change; the first page follows the latest one
+        cache_control = httpcache.IMMUTABLE if query_data['cursor'] else httpcache.SHARED
+        return _output(ContentBlockPageSchema, page, {'Cache-Control': cache_control})
+
+    except Exception as e:
+        _fail(e, "reading content blocks")
+
+
+async def advance_topic(request):
+    """Mark current topic as complete and advance to the next topic"""
+    json_data = await _json_input(request, TopicProgressSchema)
+    user_id = _current_user(request)['id']
+    completed_topic_id = json_data['topic_id']
+
+    try:
+        report, topic_ids = await _run(service.advance_topic(user_id, completed_topic_id))
+        prefetcher.aschedule(prefetcher.following(topic_ids, completed_topic_id), _prefetch_topic_content)
+        return _output(ProgressReportSchema, report)
+
+    except Exception as e:
+        _fail(e, "advancing topic")
+
+
+async def get_job(request):
+    """Status and result of a queued generation job of the caller; ?wait=N long-polls up to N seconds"""
+    query_data = _query_input(request, JobQuerySchema)
+    user_id = _current_user(request)['id']
+    job_id = request.path_params['job_id']
+    if query_data['wait']:
+        job = await adb.wait_job(job_id, user_id, query_data['wait'])
+    else:
+        job = await adb.get_job(job_id, user_id)
+    if not job:
+        abort(404, "Job not found")
+    return JSON(job)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_learning_block(request):
+    """Stream a subtopic's learning blocks as server-sent events, one `block` event per block"""
+    query_data = _query_input(request, LearningBlockQuerySchema)
+    _current_user(request, required=False)
+    topic = query_data['topic']
+    subtopic = query_data['subtopic']
+
+    async def events():
+        try:
+            count = 0
+            async for block in coe.astream_learning_block(topic, subtopic):
+                yield _sse("block", block)
+                count += 1
+            yield _sse("done", {"topic": topic, "subtopic": subtopic, "blocks": count})
+        except Exception as e:
+            util.log_error("Error streaming learning block: %s", e)
+            yield _sse("error", {"message": f"Error streaming learning block: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+class RequestContext:
+    """app.py's before/after request hooks as ASGI middleware: request id, deadline, latency budget and route metrics"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = Headers(scope=scope)
+        request_id = headers.get('X-Request-ID') or uuid.uuid4().hex
+        request_id_token = util.set_request_id(request_id)
+        # Model calls made for this request time out when its deadline passes; X-Request-Deadline can shorten it
+        seconds = float(os.getenv('REQUEST_DEADLINE_SECONDS', '120'))
+        try:
+            seconds = min(seconds, float(headers.get('X-Request-Deadline', '')))
+        except ValueError:
+            pass
+        deadline_token = resilience.set_deadline(seconds)
+        budget_token = None
+        try:
+            budget = float(headers.get('X-Latency-Budget', ''))
+        except ValueError:
+            budget = 0
+        if budget > 0:
+            budget_token = routing.set_request_budget(budget)
+        metrics_token = metrics.begin_request(count_connects=False)
+
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            route = scope.get("route")
+            metrics.observe_request(scope["method"], route.path if route else "unmatched", status[0],
+                                    time.perf_counter() - started)
+            metrics.end_request(metrics_token)
+            if budget_token is not None:
+                routing.reset_request_budget(budget_token)
+            resilience.reset_deadline(deadline_token)
+            util.reset_request_id(request_id_token)
+
+
+class HTTPCache:
+    """httpcache.init_app as ASGI middleware: ETags, 304s and compression for 200 JSON responses"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = None
+        chunks = []
+
+        async def cached_send(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if (message["status"] == 200 and headers.get("content-type", "").startswith("application/json")
+                        and "content-encoding" not in headers):
+                    # Hold the start until the whole body is known
+                    start = message
+                    return
+            elif start is not None:
+                chunks.append(message.get("body", b""))
+                if message.get("more_body"):
+                    return
+                request_headers = Headers(scope=scope)
+                status, body, headers = httpcache.respond(scope["method"], request_headers.get("if-none-match"),
+                                                          request_headers.get("accept-encoding"), b"".join(chunks))
+                dropped = {b"content-length", b"etag", b"content-type"} if status == 304 else {b"content-length", b"etag"}
+                raw = [(name, value) for name, value in start["headers"] if name.lower() not in dropped]
+                raw += [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+                raw += [(b"content-length", str(len(body)).encode()), (b"vary", b"Accept-Encoding")]
+                await send({**start, "status": status, "headers": raw})
+                await send({"type": "http.response.body", "body": body})
+                return
+            await send(message)
+
+        await self.app(scope, receive, cached_send)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # The pool opens with the first query, so a cold start only registers routes
+    yield
+    await adb.close_pool()
+
+
+stats.register_collectors(adb.pool_stats)
+
+app = Starlette(
+    routes=[
+        Route("/", flight_check),
+        Route("/api/flight-check", flight_check),
+        Route("/api/metrics", metrics_summary),
+        Route("/metrics", prometheus_metrics),
+        Route("/api/parse-job", parse_job, methods=["POST"]),
+        Route("/api/job-posting", submit_job_posting, methods=["POST"]),
+        Route("/api/select-skill", select_skill, methods=["POST"]),
+        Route("/api/skills/{skill_id:int}/outline", get_skill_outline),
+        Route("/api/assess-skills", assess_skills, methods=["POST"]),
+        Route("/api/begin-course", begin_course, methods=["POST"]),
+        Route("/api/topics/{topic_id:int}/blocks", get_content_blocks),
+        Route("/api/advance-topic", advance_topic, methods=["POST"]),
+        Route("/api/jobs/{job_id:int}", get_job, name="get_job"),
+        Route("/api/learning-block/stream", stream_learning_block),
+    ],
+    exception_handlers={HTTPException: _http_error, _InvalidInput: _validation_error},
+    lifespan=lifespan,
+)
+app.add_middleware(HTTPCache)
+app.add_middleware(RequestContext)
@@ -0,0 +1,106 @@
+"""Micro-benchmark the JSON work around model calls on the sample outlines in samples/.
+
+For each outline it times, in microseconds per call:
+
+- building the structured output spec the way generate_outline used to, with json.loads of its text
+  on every call, against the dict output_schemas builds once;
+- parsing the model's output text with the standard library and with jsoncodec (orjson when installed);
+- validating the parsed outline with the compiled output_schemas.OUTLINE, and parse + validate together;
+- serializing the outline as a response body, with Flask's default settings and with jsoncodec.
+
+    python benchmarks/codec.py --json before.json
+    python benchmarks/codec.py --compare before.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import jsoncodec  # noqa: E402
+import output_schemas  # noqa: E402
+
+SAMPLES_DIR = os.path.join(ROOT, "samples")
+
+
+def load_outlines():
+    """{sample name: (model output text, generate_outline result)}"""
+    outlines = {}
+    for name in sorted(os.listdir(SAMPLES_DIR)):
+        if name.startswith("outline-") and name.endswith(".json"):
+            with open(os.path.join(SAMPLES_DIR, name), "r") as file:
+                result = json.load(file)
+            # The model's output is the result without the topic ids generate_outline adds
+            output = {**result, "topics": [{k: v for k, v in topic.items() if k != "id"} for topic in result["topics"]]}
+            outlines[name[len("outline-"):-len(".json")]] = (json.dumps(output), result)
+    return outlines
+
+
+def cases(output_text, result):
+    spec_text = json.dumps(output_schemas.OUTLINE_TEXT, indent=3)
+    parsed = jsoncodec.loads(output_text)
+    return {
+        "spec json.loads per call": lambda: json.loads(spec_text),
+        "spec precompiled": lambda: output_schemas.OUTLINE_TEXT,
+        "parse json": lambda: json.loads(output_text),
+        "parse jsoncodec": lambda: jsoncodec.loads(output_text),
+        "validate": lambda: output_schemas.OUTLINE.validate(parsed),
+        "parse + validate": lambda: output_schemas.OUTLINE.parse(output_text),
+        # Flask's DefaultJSONProvider settings for a response body
+        "dump json (Flask)": lambda: json.dumps(result, ensure_ascii=True, sort_keys=True, separators=(",", ":")),
+        "dump jsoncodec": lambda: jsoncodec.dumps(result, default=str, sort_keys=True),
+    }
+
+
+def time_us(fn, number, repeat):
+    """Median microseconds per call over `repeat` batches of `number` calls"""
+    return statistics.median(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+def run(number, repeat):
+    report = {"codec": "orjson" if jsoncodec.orjson is not None else "json", "number": number, "repeat": repeat,
+              "samples": {}}
+    for name, (output_text, result) in load_outlines().items():
+        report["samples"][name] = {
+            "bytes": len(output_text.encode("utf-8")),
+            "us": {case: time_us(fn, number, repeat) for case, fn in cases(output_text, result).items()},
+        }
+    return report
+
+
+def _change(new, old):
+    if not old:
+        return ""
+    return f" ({(new - old) / old * 100:+.0f}%)"
+
+
+def print_report(report, baseline=None):
+    print(f"\njsoncodec on {report['codec']}; microseconds per call, median of {report['repeat']} x {report['number']}")
+    for name, sample in report["samples"].items():
+        base = (baseline or {}).get("samples", {}).get(name, {}).get("us", {})
+        print(f"\n{name} ({sample['bytes']} bytes of model output)")
+        for case, us in sample["us"].items():
+            print(f"  {case:<28}{us:>10.2f}{_change(us, base.get(case)):>8}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Micro-benchmark spec building, parsing, validation and serialization")
+    parser.add_argument("--number", type=int, default=2000, help="calls per timing batch")
+    parser.add_argument("--repeat", type=int, default=7, help="timing batches per case")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--compare", help="report from an earlier run to compare against")
+    args = parser.parse_args()
+
+    report = run(args.number, args.repeat)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
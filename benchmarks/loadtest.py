@@ -0,0 +1,230 @@
+"""Load test the API end to end against a local Postgres and the mock OpenAI server.
+
+Starts mock_openai.py and the app, then runs concurrent user flows
+(job-posting -> select-skill -> begin-course -> advance-topic/begin-course ...) and reports
+throughput and latency percentiles per endpoint. Save a run with --json and pass it to
+--compare on the next run to see the change.
+
+    python benchmarks/loadtest.py --users 8 --flows 80 --latency-ms 800 --json before.json
+    python benchmarks/loadtest.py --users 8 --flows 80 --latency-ms 800 --compare before.json
+
+Postgres is taken from the usual PG* environment variables.
+"""
+import argparse
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+import requests
+import mock_openai
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from telemetry import percentile  # noqa: E402
+
+HEADERS = {"Authorization": "Bearer test_token"}
+TABLES = ["user_course_progress", "user_skill_assessments", "topic_content_blocks", "topic_content", "course_topics",
+          "course_outlines", "job_skills", "skills", "generation_claims"]
+
+JOB_POSTING = """Warehouse Operations Supervisor
+We are looking for a supervisor to lead a team of 20 associates across receiving, put-away,
+picking and shipping. You will run our warehouse management system (WMS), own inventory
+control and cycle counts, drive quality assurance and safety programs (OSHA), and use LEAN 5S
+and continuous improvement to hit productivity targets. Forklift certification preferred.
+"""
+
+
+def prepare_database(reset):
+    with psycopg2.connect("") as conn, conn.cursor() as cursor:
+        with open(os.path.join(ROOT, "benchmarks", "schema.sql"), "r") as file:
+            cursor.execute(file.read())
+        if reset:
+            cursor.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE")
+
+
+def start_app(args, mock_url):
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_BASE_URL": mock_url,
+        "OPENAI_API_KEY": env.get("OPENAI_API_KEY") or "loadtest",
+        "LOG_LEVEL": env.get("LOG_LEVEL", "warning"),
+    })
+    if not args.llm_cache:
+        env["LLM_CACHE_DISABLED"] = "1"
+    if not args.semantic:
+        env["SEMANTIC_INDEX"] = "off"
+    if args.server:
+        command = shlex.split(args.server.format(port=args.app_port))
+    else:
+        command = [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(args.app_port), "--with-threads"]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                               stderr=None if args.verbose else subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{args.app_port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited with status {process.returncode}")
+        try:
+            requests.get(f"{base_url}/api/flight-check", timeout=1)
+            return process, base_url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("App did not start within 30s")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def call(self, session, base_url, endpoint, payload):
+        started = time.perf_counter()
+        try:
+            response = session.post(f"{base_url}/api/{endpoint}", json=payload, headers=HEADERS, timeout=300)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies[endpoint].append(elapsed)
+            if not ok:
+                self.errors[endpoint] += 1
+        if not ok:
+            raise RuntimeError(f"{endpoint} failed: {response.status_code if response is not None else 'no response'}")
+        return response.json()
+
+
+def run_flow(recorder, session, base_url, number, topics, read_seconds=0):
+    """One user: submit a posting, pick a skill, start the course and work through a few topics,
+    spending read_seconds on each"""
+    parsed = recorder.call(session, base_url, "job-posting", {"url": f"{JOB_POSTING}\nRequisition #{number}"})
+    skill = random.choice(parsed["skills"])
+    outline = recorder.call(session, base_url, "select-skill", {"skill_id": skill["id"]})
+    content = recorder.call(session, base_url, "begin-course", {"course_outline_id": outline["id"]})
+    topic_id = content["topic_id"]
+    for _ in range(topics):
+        time.sleep(read_seconds)
+        progress = recorder.call(session, base_url, "advance-topic", {"topic_id": topic_id})
+        if progress["next_topic_id"] is None:
+            break
+        content = recorder.call(session, base_url, "begin-course", {"course_outline_id": outline["id"]})
+        topic_id = content["topic_id"]
+
+
+def run_load(base_url, users, flows, topics, read_seconds=0):
+    recorder = Recorder()
+    local = threading.local()
+    failures = []
+
+    def worker(number):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        try:
+            run_flow(recorder, local.session, base_url, number, topics, read_seconds)
+        except Exception as e:
+            failures.append(str(e))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        list(executor.map(worker, range(flows)))
+    return recorder, time.perf_counter() - started, failures
+
+
+def summarize(recorder, wall_seconds, flows, failures):
+    endpoints = {}
+    for endpoint, latencies in recorder.latencies.items():
+        values = sorted(latencies)
+        endpoints[endpoint] = {
+            "requests": len(values),
+            "errors": recorder.errors[endpoint],
+            "throughput_rps": len(values) / wall_seconds,
+            **{f"p{p}_ms": percentile(values, p) * 1000 for p in (50, 95, 99)},
+            "max_ms": values[-1] * 1000,
+        }
+    total = sum(len(values) for values in recorder.latencies.values())
+    return {
+        "wall_seconds": wall_seconds,
+        "flows": flows,
+        "failed_flows": len(failures),
+        "flows_per_second": (flows - len(failures)) / wall_seconds,
+        "throughput_rps": total / wall_seconds,
+        "endpoints": endpoints,
+    }
+
+
+def _change(new, old):
+    if not old:
+        return ""
+    return f" ({(new - old) / old * 100:+.0f}%)"
+
+
+def print_report(report, baseline=None):
+    base = (baseline or {}).get("endpoints", {})
+    print(f"\n{report['flows']} flows in {report['wall_seconds']:.1f}s: "
+          f"{report['flows_per_second']:.2f} flows/s, {report['throughput_rps']:.1f} req/s"
+          f"{_change(report['throughput_rps'], (baseline or {}).get('throughput_rps'))}, "
+          f"{report['failed_flows']} failed")
+    print(f"{'endpoint':<16}{'requests':>9}{'errors':>8}{'req/s':>8}{'p50 ms':>16}{'p95 ms':>16}{'p99 ms':>16}")
+    for endpoint, stats in report["endpoints"].items():
+        old = base.get(endpoint, {})
+        print(f"{endpoint:<16}{stats['requests']:>9}{stats['errors']:>8}{stats['throughput_rps']:>8.1f}" + "".join(
+            f"{stats[key]:>8.0f}{_change(stats[key], old.get(key)):>8}" for key in ("p50_ms", "p95_ms", "p99_ms")))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Drive concurrent user flows against a local copy of the API")
+    parser.add_argument("--users", type=int, default=8, help="concurrent users")
+    parser.add_argument("--flows", type=int, default=40, help="user flows to run in total")
+    parser.add_argument("--topics", type=int, default=3, help="topics each user advances through")
+    parser.add_argument("--read-ms", type=float, default=0, help="time a user spends on a topic before advancing")
+    parser.add_argument("--latency-ms", type=float, default=500, help="mock model latency")
+    parser.add_argument("--jitter-ms", type=float, default=200, help="uniform +/- variation of the mock latency")
+    parser.add_argument("--mock-port", type=int, default=8765)
+    parser.add_argument("--app-port", type=int, default=5055)
+    parser.add_argument("--server", help="command starting the app on {port}, e.g. 'gunicorn -w 4 -b 127.0.0.1:{port} app:app'")
+    parser.add_argument("--base-url", help="test an already running app instead of starting one")
+    parser.add_argument("--keep-data", action="store_true", help="keep rows from earlier runs (warm caches)")
+    parser.add_argument("--llm-cache", action="store_true", help="leave the model response cache on")
+    parser.add_argument("--semantic", action="store_true", help="leave semantic reuse on")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--compare", help="report from an earlier run to compare against")
+    parser.add_argument("--verbose", action="store_true", help="show the app's log output")
+    args = parser.parse_args()
+
+    prepare_database(reset=not args.keep_data)
+    mock = mock_openai.serve(args.mock_port, args.latency_ms, args.jitter_ms)
+    process = None
+    try:
+        if args.base_url:
+            base_url = args.base_url
+        else:
+            process, base_url = start_app(args, f"http://127.0.0.1:{args.mock_port}/v1")
+        recorder, wall_seconds, failures = run_load(base_url, args.users, args.flows, args.topics, args.read_ms / 1000)
+    finally:
+        if process:
+            process.terminate()
+            process.wait(10)
+        mock.shutdown()
+
+    report = summarize(recorder, wall_seconds, args.flows, failures)
+    report["mock_calls"] = dict(mock.RequestHandlerClass.counts)
+    report["settings"] = {key: getattr(args, key) for key in ("users", "flows", "topics", "read_ms", "latency_ms", "jitter_ms", "server")}
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+    print_report(report, baseline)
+    for failure in sorted(set(failures))[:5]:
+        print(f"  failure: {failure}")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
@@ -0,0 +1,245 @@
+"""Local stand-in for the OpenAI Responses, Chat Completions and Embeddings endpoints.
+
+Answers are built from the fixtures in samples/ after an injected delay, so the API can be
+load tested offline and reproducibly:
+
+    python benchmarks/mock_openai.py --port 8765 --latency-ms 800 --jitter-ms 400
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python app.py
+"""
+import argparse
+import ast
+import base64
+import hashlib
+import json
+import os
+import random
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "samples")
+
+
+def _load_samples():
+    outlines = []
+    for name in sorted(os.listdir(SAMPLES_DIR)):
+        if name.startswith("outline-") and name.endswith(".json"):
+            with open(os.path.join(SAMPLES_DIR, name), "r") as file:
+                outline = json.load(file)
+            # The samples are generate_outline results, which give each topic an id; the model's output doesn't
+            for topic in outline["topics"]:
+                topic.pop("id", None)
+            outlines.append(outline)
+    # The skills sample is a Python literal rather than JSON
+    with open(os.path.join(SAMPLES_DIR, "skills_list-warehousejob.json"), "r") as file:
+        skills = ast.literal_eval(file.read())
+    return outlines, skills
+
+
+OUTLINES, SKILLS = _load_samples()
+
+
+def _pick(items, text):
+    """Same input, same fixture"""
+    return items[int(hashlib.sha256(text.encode()).hexdigest(), 16) % len(items)]
+
+
+def _tokens(text):
+    return max(1, len(text) // 4)
+
+
+def _learning_blocks(user_input):
+    outline = _pick(OUTLINES, user_input)
+    topic = _pick(outline["topics"], user_input)
+    blocks = []
+    for objective in topic["learning_objectives"]:
+        blocks.append({"block_type": "text", "content": f"{objective}. {outline['overview']}"})
+    for activity in topic["hands_on_practice"]:
+        blocks.append({"block_type": "text", "content": f"{activity['activity_title']}: {activity['description']}"})
+    blocks.insert(len(blocks) // 2, {"block_type": "image", "content": "https://example.com/diagram.png"})
+    return {"topic": topic["topic_name"], "subtopic": _pick(topic["subtopics"], user_input), "blocks": blocks}
+
+
+def responses_output(body):
+    """output_text for a Responses API request, by structured output name"""
+    user_input = next((item["content"] for item in body.get("input", []) if item.get("role") == "user"), "")
+    name = body.get("text", {}).get("format", {}).get("name")
+    if name == "outline_result":
+        return json.dumps(_pick(OUTLINES, user_input))
+    if name == "blocks_result":
+        return json.dumps(_learning_blocks(user_input))
+    return json.dumps(SKILLS)
+
+
+def chat_output(body):
+    """Message content for a Chat Completions request: the select-skill outline or begin-course content"""
+    prompt = body["messages"][-1]["content"]
+    outline = _pick(OUTLINES, prompt)
+    if body.get("response_format", {}).get("type") == "json_object":
+        return json.dumps({
+            "title": outline["topics"][0]["topic_name"].split(":")[0],
+            "description": outline["overview"],
+            "topics": [
+                {"title": topic["topic_name"], "description": "; ".join(topic["learning_objectives"]), "sequence_number": number}
+                for number, topic in enumerate(outline["topics"], 1)
+            ],
+        })
+    topic = _pick(outline["topics"], prompt)
+    sections = [f"# {topic['topic_name']}", outline["overview"]]
+    sections += [f"## {subtopic}\n\n" + " ".join(topic["learning_objectives"]) for subtopic in topic["subtopics"]]
+    return "\n\n".join(sections)
+
+
+def _embedding(text, dim):
+    seed = int(hashlib.sha256(text.encode()).hexdigest(), 16)
+    rng = random.Random(seed)
+    return [rng.gauss(0, 1) for _ in range(dim)]
+
+
+def _response_object(body, output_text):
+    input_text = json.dumps(body.get("input", ""))
+    return {
+        "id": f"resp_{uuid.uuid4().hex}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": body.get("model"),
+        "status": "completed",
+        "output": [{
+            "type": "message",
+            "id": f"msg_{uuid.uuid4().hex}",
+            "status": "completed",
+            "role": "assistant",
+            "content": [{"type": "output_text", "text": output_text, "annotations": []}],
+        }],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": _tokens(input_text),
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": _tokens(output_text),
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": _tokens(input_text) + _tokens(output_text),
+        },
+    }
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Set by serve()
+    latency = 0.5
+    jitter = 0.0
+    chunk_delay = 0.01
+    counts = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _delay(self):
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        try:
+            self._answer()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up (deadline, hedged duplicate that lost)
+            pass
+
+    def _answer(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        path = self.path.rstrip("/")
+        self.counts[path] = self.counts.get(path, 0) + 1
+        if path.endswith("/responses"):
+            self._delay()
+            output_text = responses_output(body)
+            if body.get("stream"):
+                return self._stream_response(body, output_text)
+            return self._send_json(_response_object(body, output_text))
+        if path.endswith("/chat/completions"):
+            self._delay()
+            content = chat_output(body)
+            prompt_tokens = _tokens(json.dumps(body["messages"]))
+            return self._send_json({
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": _tokens(content),
+                          "total_tokens": prompt_tokens + _tokens(content)},
+            })
+        if path.endswith("/embeddings"):
+            texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            dim = body.get("dimensions") or (3072 if body.get("model", "").endswith("large") else 1536)
+            data = []
+            for index, text in enumerate(texts):
+                vector = _embedding(text, dim)
+                if body.get("encoding_format") == "base64":
+                    vector = base64.b64encode(struct.pack(f"<{dim}f", *vector)).decode()
+                data.append({"object": "embedding", "index": index, "embedding": vector})
+            tokens = sum(_tokens(text) for text in texts)
+            return self._send_json({"object": "list", "data": data, "model": body.get("model"),
+                                    "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+        self._send_json({"error": {"message": f"No mock for {self.path}"}}, status=404)
+
+    def _stream_response(self, body, output_text):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for start in range(0, len(output_text), 64):
+            self._event("response.output_text.delta", {
+                "delta": output_text[start:start + 64], "item_id": "msg_mock", "output_index": 0, "content_index": 0})
+            time.sleep(self.chunk_delay)
+        self._event("response.completed", {"response": _response_object(body, output_text)})
+
+    def _event(self, event_type, payload):
+        data = json.dumps({"type": event_type, **payload})
+        self.wfile.write(f"event: {event_type}\ndata: {data}\n\n".encode())
+        self.wfile.flush()
+
+
+class _Server(ThreadingHTTPServer):
+    # Bursts of hundreds of concurrent calls from the async app overflow the default backlog of 5
+    request_queue_size = 1024
+
+
+def serve(port=8765, latency_ms=500, jitter_ms=0, chunk_ms=10):
+    """Start the mock on a background thread; returns the server (call shutdown() to stop)"""
+    handler = type("Handler", (MockOpenAIHandler,), {
+        "latency": latency_ms / 1000,
+        "jitter": jitter_ms / 1000,
+        "chunk_delay": chunk_ms / 1000,
+        "counts": {},
+    })
+    server = _Server(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-openai", daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve canned OpenAI responses from samples/ with injected latency")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=500, help="delay before each model response")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="uniform +/- variation of the delay")
+    parser.add_argument("--chunk-ms", type=float, default=10, help="delay between streamed chunks")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency_ms, args.jitter_ms, args.chunk_ms)
+    print(f"Mock OpenAI API on http://127.0.0.1:{args.port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
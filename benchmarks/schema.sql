@@ -0,0 +1,62 @@
+-- Tables the API reads and writes, for running it against a local Postgres (benchmarks/loadtest.py).
+-- generation_jobs is created by jobs.ensure_schema().
+CREATE TABLE IF NOT EXISTS skills (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS job_skills (
+    job_id INTEGER NOT NULL,
+    skill_id INTEGER NOT NULL REFERENCES skills (id),
+    PRIMARY KEY (job_id, skill_id)
+);
+CREATE TABLE IF NOT EXISTS course_outlines (
+    id SERIAL PRIMARY KEY,
+    skill_id INTEGER NOT NULL REFERENCES skills (id),
+    title TEXT NOT NULL,
+    description TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS course_topics (
+    id SERIAL PRIMARY KEY,
+    course_outline_id INTEGER NOT NULL REFERENCES course_outlines (id),
+    title TEXT NOT NULL,
+    description TEXT,
+    sequence_number INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS topic_content (
+    id SERIAL PRIMARY KEY,
+    topic_id INTEGER NOT NULL REFERENCES course_topics (id),
+    content TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS topic_content_blocks (
+    topic_content_id INTEGER NOT NULL REFERENCES topic_content (id),
+    position INTEGER NOT NULL,
+    block_type TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (topic_content_id, position)
+);
+CREATE TABLE IF NOT EXISTS user_skill_assessments (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    skill_id INTEGER NOT NULL REFERENCES skills (id),
+    proficiency_level INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (user_id, skill_id)
+);
+CREATE TABLE IF NOT EXISTS user_course_progress (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    course_outline_id INTEGER NOT NULL REFERENCES course_outlines (id),
+    current_topic_id INTEGER REFERENCES course_topics (id),
+    completion_percentage FLOAT NOT NULL DEFAULT 0,
+    last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (user_id, course_outline_id)
+);
+CREATE TABLE IF NOT EXISTS generation_claims (
+    kind TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (kind, item_id)
+);
@@ -0,0 +1,143 @@
+"""Measure cold start: import cost per module and time to the first flight-check response.
+
+Each run imports the app in a fresh interpreter with `python -X importtime`, so nothing is
+cached in-process. Heavy dependencies that should only load on first use are listed in
+--forbid; the script exits non-zero if startup imports one of them or takes longer than
+--max-ms, so it can guard against regressions:
+
+    python benchmarks/startup.py --json before.json
+    python benchmarks/startup.py --compare before.json --max-ms 800
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported by model calls, SQL, URL fetches and semantic reuse, never by startup
+LAZY_MODULES = ["openai", "psycopg2", "psycopg", "bs4", "requests", "numpy", "pinecone", "grpc"]
+
+FIRST_RESPONSE = """
+import asyncio, time
+started = time.perf_counter()
+import {module}
+app = {module}.app
+if hasattr(app, "test_client"):
+    status = app.test_client().get("/api/flight-check").status_code
+else:
+    # One request straight through the ASGI callable, without a server
+    messages = []
+    async def receive():
+        return {{"type": "http.request", "body": b"", "more_body": False}}
+    async def send(message):
+        messages.append(message)
+    scope = {{"type": "http", "asgi": {{"version": "3.0"}}, "http_version": "1.1", "method": "GET", "scheme": "http",
+             "path": "/api/flight-check", "raw_path": b"/api/flight-check", "query_string": b"", "root_path": "",
+             "headers": [], "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 80)}}
+    asyncio.run(app(scope, receive, send))
+    status = messages[0]["status"]
+elapsed = time.perf_counter() - started
+assert status == 200, status
+print(elapsed)
+"""
+
+
+def parse_importtime(stderr):
+    """{module: (self seconds, cumulative seconds)} from -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us) / 1e6, int(cumulative_us) / 1e6)
+    return modules
+
+
+def measure(module):
+    """One cold import of module: per-module costs and the time to a first flight-check response"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", FIRST_RESPONSE.format(module=module)],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr), float(result.stdout.strip().splitlines()[-1])
+
+
+def run(module, runs):
+    samples = [measure(module) for _ in range(runs)]
+    # The median of each figure across runs smooths out disk cache and scheduler noise
+    names = set().union(*(imports for imports, _ in samples))
+    modules = {}
+    for name in names:
+        values = [imports[name] for imports, _ in samples if name in imports]
+        modules[name] = (statistics.median(v[0] for v in values), statistics.median(v[1] for v in values))
+    packages = defaultdict(float)
+    for name, (self_seconds, _) in modules.items():
+        packages[name.split(".")[0]] += self_seconds
+    return {
+        "module": module,
+        "runs": runs,
+        "import_ms": modules[module][1] * 1000,
+        "first_response_ms": statistics.median(elapsed for _, elapsed in samples) * 1000,
+        "module_count": len(modules),
+        "packages_ms": {name: seconds * 1000 for name, seconds in sorted(packages.items(), key=lambda item: -item[1])},
+        "modules_ms": {name: cumulative * 1000 for name, (_, cumulative) in
+                       sorted(modules.items(), key=lambda item: -item[1][1])},
+    }
+
+
+def _change(new, old):
+    if not old:
+        return ""
+    return f" ({(new - old) / old * 100:+.0f}%)"
+
+
+def print_report(report, baseline=None, limit=15):
+    base = baseline or {}
+    print(f"\nimport {report['module']}: {report['import_ms']:.0f} ms{_change(report['import_ms'], base.get('import_ms'))}, "
+          f"first flight-check response after {report['first_response_ms']:.0f} ms"
+          f"{_change(report['first_response_ms'], base.get('first_response_ms'))}, "
+          f"{report['module_count']} modules (median of {report['runs']} runs)")
+    print(f"\n{'package (self time)':<32}{'ms':>10}")
+    for name, ms in list(report["packages_ms"].items())[:limit]:
+        print(f"{name:<32}{ms:>10.1f}{_change(ms, base.get('packages_ms', {}).get(name)):>8}")
+    print(f"\n{'module (cumulative)':<32}{'ms':>10}")
+    for name, ms in list(report["modules_ms"].items())[:limit]:
+        print(f"{name:<32}{ms:>10.1f}{_change(ms, base.get('modules_ms', {}).get(name)):>8}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report per-module import cost and cold-start time of the app")
+    parser.add_argument("--module", default="app", help="module defining `app` (app or asgi)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=15, help="rows per table")
+    parser.add_argument("--forbid", default=",".join(LAZY_MODULES),
+                        help="comma-separated packages startup must not import ('' to allow all)")
+    parser.add_argument("--max-ms", type=float, help="fail when importing the module takes longer")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--compare", help="report from an earlier run to compare against")
+    args = parser.parse_args()
+
+    report = run(args.module, args.runs)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+    print_report(report, baseline, args.limit)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+    failures = []
+    forbidden = [name for name in args.forbid.split(",") if name]
+    imported = sorted(name for name in forbidden if name in report["packages_ms"])
+    if imported:
+        failures.append(f"startup imports {', '.join(imported)}, which should load on first use")
+    if args.max_ms is not None and report["import_ms"] > args.max_ms:
+        failures.append(f"import took {report['import_ms']:.0f} ms, over the {args.max_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
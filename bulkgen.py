@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from openai import RateLimitError
+import coe
+import resilience
+import semantic
+import util
+
+
+class RateLimiter:
+    """Request and token budgets per minute, shared by all workers.
+
+    acquire() blocks until both budgets allow another call; pause() stops every
+    worker for a while after the API answers 429.
+    """
+
+    def __init__(self, requests_per_minute=30, tokens_per_minute=150000):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens):
+        # A single call larger than the whole budget would otherwise wait forever
+        tokens = min(tokens, self.tokens_per_minute)
+        with self._cond:
+            while True:
+                self._refill()
+                wait = self._paused_until - time.monotonic()
+                if wait <= 0:
+                    if self._requests >= 1 and self._tokens >= tokens:
+                        self._requests -= 1
+                        self._tokens -= tokens
+                        return
+                    wait = max(
+                        (1 - self._requests) * 60 / self.requests_per_minute,
+                        (tokens - self._tokens) * 60 / self.tokens_per_minute,
+                        0.05
+                    )
+                self._cond.wait(wait)
+
+    def settle(self, estimated, actual):
+        """Correct the token budget once a call's real size is known"""
+        with self._cond:
+            self._tokens = min(self.tokens_per_minute, self._tokens + estimated - actual)
+            self._cond.notify_all()
+
+    def pause(self, seconds):
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _estimate_tokens(*texts):
+    # ~4 characters per token is close enough for budgeting
+    return sum(len(text) for text in texts) // 4
+
+
+def subtopic_key(topic_name, subtopic):
+    return f"{topic_name} | {subtopic}"
+
+
+def outline_subtopics(outline):
+    """(topic_name, subtopic) pairs of a generate_outline result, in course order"""
+    return [
+        (topic["topic_name"], subtopic)
+        for topic in outline["topics"]
+        for subtopic in topic["subtopics"]
+    ]
+
+
+def _load_state(state_path):
+    if state_path and os.path.exists(state_path):
+        with open(state_path, "r") as file:
+            return json.load(file)
+    return {}
+
+
+def _save_state(state_path, state):
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(state, file)
+    os.replace(tmp_path, state_path)
+
+
+def generate_outline_blocks(outline, max_workers=4, limiter=None, tokens_per_call=6000,
+                            state_path=None, progress=None, max_retries=6):
+    """Generate learning blocks for every subtopic of an outline on a bounded worker pool.
+
+    Results are keyed by subtopic_key(). With state_path, finished subtopics are saved as
+    they complete and skipped on the next run, so an interrupted run resumes where it stopped.
+    progress(done, total, key) is called after each subtopic.
+    """
+    limiter = limiter or RateLimiter()
+    results = _load_state(state_path)
+    pending = [
+        (topic_name, subtopic)
+        for topic_name, subtopic in outline_subtopics(outline)
+        if subtopic_key(topic_name, subtopic) not in results
+    ]
+    # One batched lookup serves the subtopics that match previously generated ones
+    reused = semantic.lookup_many(semantic.BLOCKS, [coe.learning_block_key(*item) for item in pending])
+    for (topic_name, subtopic), found in zip(pending, reused):
+        if found:
+            results[subtopic_key(topic_name, subtopic)] = coe.learning_block_result(found["result"])
+    pending = [item for item, found in zip(pending, reused) if not found]
+    if state_path and any(reused):
+        _save_state(state_path, results)
+    total = len(results) + len(pending)
+    lock = threading.Lock()
+
+    def run(topic_name, subtopic):
+        for attempt in range(max_retries + 1):
+            limiter.acquire(tokens_per_call)
+            try:
+                # 429s are retried here, where the pause holds back every worker, and not again by resilience
+                with resilience.caller_retries_rate_limits():
+                    block_result = coe.generate_learning_block(topic_name, subtopic)
+            except RateLimitError as e:
+                limiter.settle(tokens_per_call, 0)
+                if attempt == max_retries:
+                    raise
+                delay = _retry_after(e) or min(60, 2 ** attempt) * (0.5 + random.random())
+                util.log_warning("Rate limited on '%s', backing off %.1fs", subtopic, delay)
+                limiter.pause(delay)
+                continue
+            except Exception:
+                # Nothing was generated, so the estimate goes back to the budget
+                limiter.settle(tokens_per_call, 0)
+                raise
+            limiter.settle(tokens_per_call, _estimate_tokens(topic_name, subtopic, json.dumps(block_result)))
+            return block_result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(run, topic_name, subtopic): subtopic_key(topic_name, subtopic)
+            for topic_name, subtopic in pending
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                block_result = future.result()
+            except Exception as e:
+                util.log_error("Failed to generate '%s': %s", key, e)
+                continue
+            with lock:
+                results[key] = block_result
+                if state_path:
+                    _save_state(state_path, results)
+                done = len(results)
+            if progress:
+                progress(done, total, key)
+
+    return results
+
+
+def _print_progress(done, total, key):
+    print(f"[{done}/{total}] {key}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pre-generate learning blocks for every subtopic of an outline")
+    parser.add_argument("outline", help="path to a generate_outline JSON result")
+    parser.add_argument("--state", help="resume file; defaults to <outline>.blocks.json")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rpm", type=int, default=30, help="request budget per minute")
+    parser.add_argument("--tpm", type=int, default=150000, help="token budget per minute")
+    args = parser.parse_args()
+
+    with open(args.outline, "r") as file:
+        outline = json.load(file)
+    state_path = args.state or f"{os.path.splitext(args.outline)[0]}.blocks.json"
+    results = generate_outline_blocks(
+        outline,
+        max_workers=args.workers,
+        limiter=RateLimiter(args.rpm, args.tpm),
+        state_path=state_path,
+        progress=_print_progress
+    )
+    print(f"{len(results)} of {len(outline_subtopics(outline))} subtopics generated; saved to {state_path}")
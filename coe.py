@@ -1,27 +1,91 @@
+import asyncio
 import os
-from dotenv import load_dotenv
-from openai import OpenAI
 import json
+import re
 import db
+import fetch
+import jsonstream
+import llm
+import output_schemas
+import semantic
 import util
 import uuid
-import os
-import json
-from pinecone import Pinecone
-
-# Load environment variables
-load_dotenv()
 
 outline_result=None
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 
 def flight_check():
    return {"message":{"1":"Ready to go!"}}
 
-def parse_job(desc_or_url):
-   desc_or_url="https://www.indeed.com/viewjob?jk=8b7c696f002362d0&from=shareddesktop_copy"
-    # Extract job posting content
+def job_description(desc_or_url):
+   """Job description text from pasted text, a URL, or a {"url": ...} payload"""
+   if isinstance(desc_or_url, dict):
+      desc_or_url = desc_or_url['url']
+   desc_or_url = desc_or_url.strip()
+   if re.match(r"https?://", desc_or_url):
+      # Send the model the description, not the URL or the whole page
+      return fetch.job_text(desc_or_url)
+   return desc_or_url
+
+def parse_job(desc_or_url, bypass_cache=False):
+   # Extract job posting content
+   job_text = job_description(desc_or_url)
+   request = _parse_job_request(job_text)
+   skills_list = _valid_output("parse_job", skills_result, lambda bypass: llm.respond(
+      call_site="parse_job", **request, bypass_cache=bypass), bypass_cache)
+
+   # Use the database ids so clients can pass them straight to /api/select-skill
+   return with_skill_ids(skills_list, db.save_skills_list(skills_list))
+
+async def aparse_job(desc_or_url, bypass_cache=False):
+   """parse_job for the async app: the fetch runs on a thread, the model call and the writes on the event loop"""
+   import adb
+   job_text = await asyncio.to_thread(job_description, desc_or_url)
+   request = _parse_job_request(job_text)
+   skills_list = await _avalid_output("parse_job", skills_result, lambda bypass: llm.arespond(
+      call_site="parse_job", **request, bypass_cache=bypass), bypass_cache)
+   return with_skill_ids(skills_list, await adb.save_skills_list(skills_list))
+
+def with_skill_ids(skills_list, saved):
+   for skill, saved_skill in zip(skills_list, saved["skills"]):
+      skill['id'] = saved_skill['id']
+   return {"skills": skills_list}
+
+def skills_result(output_text):
+   #skills_json = json.loads(response.choices[0].message.content)
+   skills_json = output_schemas.SKILLS.parse(output_text)
+                          
+   skills_list = skills_json.get('skills', [])
+
+   util.log_verbose("Extracted skills: %s", skills_list)
+   return skills_list
+
+def _valid_output(call_site, result, generate, bypass_cache=False):
+   """result(generate(bypass)): model output parsed and checked against its schema.
+
+   Output that doesn't match is asked for once more, past the response cache and semantic reuse
+   so the bad answer isn't served again, and the fresh answer replaces it in both.
+   """
+   try:
+      return result(generate(bypass_cache))
+   except output_schemas.OutputError as e:
+      util.log_warning("Invalid %s output, asking again: %s", call_site, e)
+   return result(generate(True))
+
+async def _avalid_output(call_site, result, agenerate, bypass_cache=False):
+   """_valid_output() for coroutine generate functions"""
+   try:
+      return result(await agenerate(bypass_cache))
+   except output_schemas.OutputError as e:
+      util.log_warning("Invalid %s output, asking again: %s", call_site, e)
+   return result(await agenerate(True))
+
+def _checked(validator, output_text):
+   """output_text, once it validates, so invalid output is never stored for semantic reuse"""
+   validator.parse(output_text)
+   return output_text
+
+def _parse_job_request(job_text):
+   """Prompt shared by parse_job and aparse_job"""
    #https://www.indeed.com/viewjob?jk=8b7c696f002362d0&from=shareddesktop_copy
    #https://tysonfoods.wd5.myworkdayjobs.com/en-US/TSN/details/Continuous-Improvement-Manager_R0361223-1?jobFamilyGroup=4506c4a2b82c017025ec5e6da234cd2f&jobFamilyGroup=4506c4a2b82c0165ff9e9b6da234e72f
 
@@ -58,28 +122,12 @@ def parse_job(desc_or_url):
    #    response_format={"type": "json_object"}
    # )
 
-   response = client.responses.create(
-   model="o3-mini",
-   input=[
-      {"role": "system", "content": sys_prompt},
-      {"role": "user", "content": desc_or_url}
-   ])
-
- 
-   
-   #skills_json = json.loads(response.choices[0].message.content)
-   skills_json = json.loads(response.output_text)   
-                          
-   skills_list = skills_json.get('skills', [])
-   for skill in skills_list:
-    skill['id'] = str(uuid.uuid4())
-
-   util.log_verbose(skills_list)
-   
-   db.save_skills_list(skills_list)
-   return {"skills": skills_list}
+   return {
+      "system_prompt": sys_prompt,
+      "user_input": job_text,
+   }
 
-def generate_outline(skill):
+def generate_outline(skill, bypass_cache=False):
         
    # Use OpenAI to extract skills from the job description
    sys_prompt = f"""
@@ -92,106 +140,26 @@ def generate_outline(skill):
    Additional Resources: Suggest case studies, industry examples, or supplemental materials such as articles, videos, open-source tools, or relevant communities, to deepen learners’ knowledge and support continued exploration.
    """
 
-   structured_output_spec = """
-   {
-      "format": {
-         "type": "json_schema",
-         "name": "outline_result",
-         "schema": {
-         "type": "object",
-         "properties": {
-            "overview": {
-               "type": "string"
-            },
-            "topics": {
-               "type": "array",
-               "items": {
-               "type": "object",
-               "properties": {
-                  "topic_name": {
-                     "type": "string"
-                  },
-                  "subtopics": {
-                     "type": "array",
-                     "items": {
-                     "type": "string"
-                     }
-                  },
-                  "learning_objectives": {
-                     "type": "array",
-                     "items": {
-                     "type": "string"
-                     }
-                  },
-                  "hands_on_practice": {
-                     "type": "array",
-                     "items": {
-                     "type": "object",
-                     "properties": {
-                        "activity_title": {
-                           "type": "string"
-                        },
-                        "description": {
-                           "type": "string"
-                        }
-                     },
-                     "required": [
-                        "activity_title",
-                        "description"
-                     ],
-                     "additionalProperties": false
-                     }
-                  }
-               },
-               "required": ["topic_name", "subtopics", "learning_objectives","hands_on_practice"],
-               "additionalProperties": false
-               }
-            },
-            "additional_resources": {
-               "type": "array",
-               "items": {
-               "type": "string"
-               }
-            }
-         },
-         "required": ["overview", "topics","additional_resources"],
-         "additionalProperties": false,
-         "strict": true
-         }
-      }
-   }
-   """
-   
-   print(json.loads(structured_output_spec))
-   response = client.responses.create(
-   model="o3-mini",
-   input=[
-      {"role": "system", "content": sys_prompt},
-      {"role": "user", "content": skill}
-   ],
-   reasoning={"effort": "medium"},
-   text=json.loads(structured_output_spec),
-   )
+   def generate(bypass):
+      # A semantically equivalent skill ("Postgres query tuning" / "PostgreSQL performance tuning") reuses its outline
+      return semantic.reuse_or_generate(semantic.OUTLINES, skill, lambda: _checked(output_schemas.OUTLINE, llm.respond(
+         call_site="generate_outline",
+         system_prompt=sys_prompt,
+         user_input=skill,
+         text=output_schemas.OUTLINE_TEXT,
+         bypass_cache=bypass,
+      )), bypass=bypass)
 
    global outline_result
-   outline_result = json.loads(response.output_text)  
+   outline_result = _valid_output("generate_outline", output_schemas.OUTLINE.parse, generate, bypass_cache)
    for topic in outline_result["topics"]:
       topic['id'] = str(uuid.uuid4())
    return outline_result
 
 
-def generate_learning_block(topic, subtopic):
+def _learning_block_request(topic, subtopic):
+   """Prompt and output spec shared by generate_learning_block and stream_learning_block"""
    user_prompt = f"""subtopic={subtopic} | topic={topic}"""
-   print(user_prompt)  
-   sys_prompt = f"""
-   You are an experienced education curriculum writer designed to generate a paragraph or two for a given skill subtopic. 
-   The content should briefly introduce the given subtopic, in context of the given topic. 
-   When given a subtopic and its parent topic, you must provide:
-   Sections of content about the subtopic in progression that covers the subtopic at high level and in total is between 2-3 paragraphs.
-   Include a URL to a relevant image somewhere in the content.
-   A section is either blocks of text or a link to a web-searched image that illustrates the content.
-   """ 
-  
    # Use OpenAI to extract skills from the job description
    sys_prompt = f"""
    You are an experienced education curriculum writer designed to generate a course learning content for any given skill subtopic for a given topic. 
@@ -203,60 +171,162 @@ def generate_learning_block(topic, subtopic):
    Try to include 1-2 images about every 5-15 paragraphs. 
    """
 
-   structured_output_spec = """
-   {
-      "format": {
-         "type": "json_schema",
-         "name": "blocks_result",
-         "schema": {
-            "type": "object",
-            "properties": {
-               "topic": {
-                  "type": "string"
-               },
-               "subtopic": {
-                  "type": "string"
-               },
-               "blocks": {
-                  "type": "array",
-                  "items": {
-                     "type": "object",
-                     "properties": {
-                        "block_type": {
-                           "enum": ["image", "text"]
-                        },
-                        "content": {
-                           "type": "string"
-                        }
-                     },
-                     "required": ["block_type", "content"],
-                     "additionalProperties": false
-                  }
-               }
-            },
-            "required": ["topic", "subtopic", "blocks"],
-            "additionalProperties": false
-         },
-         "strict": true
-      }
+   return {
+      "system_prompt": sys_prompt,
+      "user_input": user_prompt,
+      "text": output_schemas.BLOCKS_TEXT,
    }
-   """
-   response = client.responses.create(
-      model="o3-mini-2025-01-31",
-      input=[
-         {"role": "system", "content": sys_prompt},
-         {"role": "user", "content": user_prompt}
-      ],  
-      text=json.loads(structured_output_spec),
-      reasoning={"effort": "high"},
-   )
-
-   block_result = json.loads(response.output_text)  
+
+
+def learning_block_key(topic, subtopic):
+   """Text a learning block is indexed under for semantic reuse"""
+   return f"{subtopic} ({topic})"
+
+
+def generate_learning_block(topic, subtopic, bypass_cache=False):
+   request = _learning_block_request(topic, subtopic)
+   util.log_verbose("Generating learning block: %s", request["user_input"])
+
+   def generate(bypass):
+      return semantic.reuse_or_generate(
+         semantic.BLOCKS,
+         learning_block_key(topic, subtopic),
+         lambda: _checked(output_schemas.BLOCKS, llm.respond("generate_learning_block", **request, bypass_cache=bypass)),
+         bypass=bypass,
+      )
+
+   return _valid_output("generate_learning_block", learning_block_result, generate, bypass_cache)
+
+
+def learning_block_result(output_text):
+   block_result = output_schemas.BLOCKS.parse(output_text)
    for block in block_result["blocks"]:
       block['id'] = str(uuid.uuid4())
    return block_result
 
 
+def stream_learning_block(topic, subtopic, bypass_cache=False):
+   """Yield each block of generate_learning_block's result as soon as it has fully streamed in"""
+   request = _learning_block_request(topic, subtopic)
+   key = learning_block_key(topic, subtopic)
+   reused = None if bypass_cache else semantic.lookup(semantic.BLOCKS, key)
+   deltas = [reused["result"]] if reused else llm.stream_respond("stream_learning_block", **request, bypass_cache=bypass_cache)
+   parser = jsonstream.ArrayItemParser("blocks")
+   chunks = []
+   for delta in deltas:
+      chunks.append(delta)
+      for block in parser.feed(delta):
+         block['id'] = str(uuid.uuid4())
+         yield block
+   if not reused and _storable(key, "".join(chunks)):
+      semantic.store(semantic.BLOCKS, key, result="".join(chunks))
+
+
+async def astream_learning_block(topic, subtopic, bypass_cache=False):
+   """stream_learning_block for the async app"""
+   request = _learning_block_request(topic, subtopic)
+   key = learning_block_key(topic, subtopic)
+   reused = None if bypass_cache else await asyncio.to_thread(semantic.lookup, semantic.BLOCKS, key)
+   parser = jsonstream.ArrayItemParser("blocks")
+   chunks = []
+   if reused:
+      deltas = _aiter([reused["result"]])
+   else:
+      deltas = llm.astream_respond("stream_learning_block", **request, bypass_cache=bypass_cache)
+   async for delta in deltas:
+      chunks.append(delta)
+      for block in parser.feed(delta):
+         block['id'] = str(uuid.uuid4())
+         yield block
+   if not reused and _storable(key, "".join(chunks)):
+      await asyncio.to_thread(semantic.store, semantic.BLOCKS, key, result="".join(chunks))
+
+
+def _storable(key, output_text):
+   """Whether a streamed blocks_result is valid, and so worth storing for semantic reuse"""
+   try:
+      output_schemas.BLOCKS.parse(output_text)
+   except output_schemas.OutputError as e:
+      util.log_warning("Invalid stream_learning_block output for '%s', not stored: %s", key, e)
+      return False
+   return True
+
+
+async def _aiter(items):
+   for item in items:
+      yield item
+
+
+
+def select_skill_request(skill_name):
+   """llm.chat arguments for the course outline generated when a skill is selected"""
+   prompt = f"""
+    Create a comprehensive course outline for learning {skill_name}. 
+    The outline should include 5-10 topics that progress from beginner to advanced concepts.
+    For each topic, provide a brief description.
+    
+    Return the result as a JSON object with the following structure:
+    {{
+        "title": "Course title",
+        "description": "Overall course description",
+        "topics": [
+            {{
+                "title": "Topic 1 title",
+                "description": "Topic 1 description",
+                "sequence_number": 1
+            }},
+            ...
+        ]
+    }}
+    """
+   return {
+      "messages": [
+         {"role": "system", "content": "You are a helpful assistant that creates learning outlines."},
+         {"role": "user", "content": prompt}
+      ],
+      "response_format": {"type": "json_object"},
+   }
+
+
+def select_skill_outline(skill_name):
+   """The select-skill course outline of skill_name, checked against COURSE_OUTLINE"""
+   request = select_skill_request(skill_name)
+   # Chat calls aren't cached, so asking again is just another call
+   return _valid_output("select_skill", output_schemas.COURSE_OUTLINE.parse, lambda bypass: llm.chat("select_skill", **request))
+
+
+async def aselect_skill_outline(skill_name):
+   """select_skill_outline() for the async app"""
+   request = select_skill_request(skill_name)
+   return await _avalid_output("select_skill", output_schemas.COURSE_OUTLINE.parse,
+                               lambda bypass: llm.achat("select_skill", **request))
+
+
+def topic_content_request(skill_name, topic_title, topic_description):
+   """llm.chat arguments for a topic's Markdown learning content"""
+   prompt = f"""
+    Create comprehensive learning content for a topic in a course about {skill_name}.
+    
+    Topic: {topic_title}
+    Description: {topic_description}
+    
+    The content should include:
+    1. An introduction to the topic
+    2. Key concepts and explanations
+    3. Examples or code snippets where applicable
+    4. Best practices
+    5. A summary
+    
+    Format the content with Markdown.
+    """
+   return {
+      "messages": [
+         {"role": "system", "content": "You are an expert educator creating learning content."},
+         {"role": "user", "content": prompt}
+      ],
+   }
+
+
 
 def get_last_outline():
 
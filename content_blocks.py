@@ -0,0 +1,141 @@
+"""A topic's learning content stored as ordered blocks and read a page at a time.
+
+Every generation of a topic's content is a topic_content row (a revision). Its blocks are stored under
+that revision and never change afterwards, so a cursor (revision and position) keeps paging the same
+content even when the topic is regenerated; a request without a cursor starts at the latest revision.
+"""
+import base64
+import re
+import threading
+import db
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS topic_content_blocks (
+    topic_content_id INTEGER NOT NULL REFERENCES topic_content (id),
+    position INTEGER NOT NULL,
+    block_type TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (topic_content_id, position)
+);
+"""
+
+# Splitting is deterministic, so a concurrent backfill of the same revision stores the same rows
+INSERT_BLOCKS = """
+INSERT INTO topic_content_blocks (topic_content_id, position, block_type, content)
+SELECT %s, position, block_type, content
+FROM unnest(%s::int[], %s::text[], %s::text[]) AS b(position, block_type, content)
+ON CONFLICT DO NOTHING
+"""
+
+# The requested (or latest) revision of a topic and up to `limit` of its blocks after a position, in one
+# round trip: no rows for an unknown revision, one row with NULL block columns when none are stored
+PAGE = """
+WITH revision AS (
+    SELECT id FROM topic_content
+    WHERE topic_id = %(topic_id)s AND (%(revision)s::int IS NULL OR id = %(revision)s::int)
+    ORDER BY id DESC LIMIT 1
+)
+SELECT r.id, b.position, b.block_type, b.content
+FROM revision r
+LEFT JOIN LATERAL (
+    SELECT position, block_type, content FROM topic_content_blocks
+    WHERE topic_content_id = r.id AND position > %(after)s
+    ORDER BY position LIMIT %(limit)s
+) b ON true
+ORDER BY b.position
+"""
+
+_HEADING = re.compile(r" {0,3}#{1,3}\s")
+_FENCE = re.compile(r" {0,3}(```|~~~)")
+_IMAGE = re.compile(r'!\[[^\]]*\]\(\s*(\S+?)(?:\s+"[^"]*")?\s*\)')
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def ensure_schema():
+    """Create the table once per process, on a connection of its own that commits before the table
+    counts as ready. Call it before checking out the request's connection: a second connection taken
+    while holding one could wait forever on a pool whose other connections wait on this request."""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            with db.connection() as conn:
+                conn.cursor().execute(SCHEMA)
+            _schema_ready = True
+
+
+def split_markdown(content):
+    """Markdown as generate_learning_block-style blocks: a text block per section, starting at each
+    heading outside code fences, and an image block per image on a line of its own"""
+    blocks = []
+    lines = []
+    fenced = False
+
+    def flush():
+        text = "\n".join(lines).strip()
+        if text:
+            blocks.append({"block_type": "text", "content": text})
+        lines.clear()
+
+    for line in content.splitlines():
+        if _FENCE.match(line):
+            fenced = not fenced
+        elif not fenced:
+            image = _IMAGE.fullmatch(line.strip())
+            if image:
+                flush()
+                blocks.append({"block_type": "image", "content": image.group(1)})
+                continue
+            if _HEADING.match(line):
+                flush()
+        lines.append(line)
+    flush()
+    return blocks
+
+
+def insert_params(revision, content):
+    """INSERT_BLOCKS parameters storing a revision's content as blocks"""
+    blocks = split_markdown(content)
+    return (revision, list(range(len(blocks))), [block["block_type"] for block in blocks],
+            [block["content"] for block in blocks])
+
+
+def encode_cursor(revision, position):
+    return base64.urlsafe_b64encode(f"{revision}:{position}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(revision, position) of an encode_cursor() value; ValueError if it is not one"""
+    try:
+        revision, position = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split(":")
+        return int(revision), int(position)
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+def page_params(topic_id, cursor, limit):
+    """PAGE parameters; one block more than the page is read to tell whether another page follows"""
+    revision, after = decode_cursor(cursor) if cursor else (None, -1)
+    return {"topic_id": topic_id, "revision": revision, "after": after, "limit": limit + 1}
+
+
+def needs_blocks(params, rows):
+    """Whether a first page found content without stored blocks (no content yet, or stored before blocks were)"""
+    return params["revision"] is None and (not rows or rows[0][1] is None)
+
+
+def page(topic_id, rows, limit):
+    """Response for PAGE's rows, or None when the cursor's revision no longer exists"""
+    if not rows:
+        return None
+    revision = rows[0][0]
+    blocks = [
+        {"id": f"{revision}-{position}", "position": position, "block_type": block_type, "content": content}
+        for _, position, block_type, content in rows[:limit]
+        if position is not None
+    ]
+    next_cursor = encode_cursor(revision, blocks[-1]["position"]) if len(rows) > limit else None
+    return {"topic_id": topic_id, "revision": revision, "blocks": blocks, "next_cursor": next_cursor}
@@ -1,57 +1,312 @@
 import os
-import psycopg2
-from dotenv import load_dotenv
+import threading
+import cache
 import util
+from skills_index import SkillIndex, skill_index
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # psycopg2 is imported with the first query, not at startup
+                import dbpool
+                pool = dbpool.ConnectionPool(
+                    minconn=int(os.getenv('PGPOOL_MIN', '1')),
+                    maxconn=int(os.getenv('PGPOOL_MAX', '10')),
+                    timeout=float(os.getenv('PGPOOL_TIMEOUT', '30')),
+                )
+                try:
+                    pool.fill()
+                except dbpool.psycopg2.Error as e:
+                    util.log_warning("Could not pre-open database connections: %s", e)
+                _pool = pool
+    return _pool
 
-# Load environment variables
-load_dotenv()
 
 def get_db_connection():
-    """Create a connection to the Neon PostgreSQL database"""
-    conn = psycopg2.connect(
-        host=os.getenv('PGHOST'),
-        database=os.getenv('PGDATABASE'),
-        user=os.getenv('PGUSER'),
-        password=os.getenv('PGPASSWORD')
-    )
-    return conn
-
-def save_skills_list(skills_list):
+    """Check out a pooled connection to the Neon PostgreSQL database.
+
+    Calling close() on it returns it to the pool; prefer `with db.connection() as conn:`.
+    """
+    return get_pool().getconn()
+
+
+def connection():
+    """Context manager over a pooled connection"""
+    return get_pool().connection()
+
+
+def pool_stats():
+    """Connection pool counters; all zero until the first query opens the pool, so a metrics
+    scrape never connects to the database"""
+    if _pool is None:
+        return {"in_use": 0, "idle": 0, "checkouts": 0, "waits": 0, "timeouts": 0,
+                "connections_opened": 0, "connections_discarded": 0}
+    return _pool.stats()
+
+
+# Steps: SQL written once for both apps. A steps generator yields fetch_one/fetch_all/execute
+# statements and is sent each one's result (a row or None, a list of rows, None); run_steps below
+# and adb.run_steps execute them on a psycopg2 or async psycopg cursor and return its return value.
+
+def fetch_one(sql, params=None):
+    return sql, params, "one"
+
+
+def fetch_all(sql, params=None):
+    return sql, params, "all"
+
+
+def execute(sql, params=None):
+    return sql, params, None
+
+
+def run_steps(cursor, steps):
+    """Run a steps generator's statements on a psycopg2 cursor; returns what the generator returns"""
+    result = None
+    while True:
+        try:
+            sql, params, fetch = steps.send(result)
+        except StopIteration as done:
+            return done.value
+        cursor.execute(sql, params)
+        result = cursor.fetchone() if fetch == "one" else cursor.fetchall() if fetch == "all" else None
+
+
+def _skill_name(skill):
+   # parse_job hands over the model's skill objects; plain names are accepted too
+   if isinstance(skill, dict):
+      return skill['skill']
+   return skill
+
+UPSERT_SKILLS = """
+      WITH input AS (
+         SELECT DISTINCT unnest(%s::text[]) AS name
+      ),
+      existing AS (
+         SELECT DISTINCT ON (s.name) s.id, s.name
+         FROM skills s
+         JOIN input i ON s.name = i.name
+         ORDER BY s.name, s.id
+      ),
+      inserted AS (
+         INSERT INTO skills (name)
+         SELECT i.name FROM input i
+         WHERE NOT EXISTS (SELECT 1 FROM existing e WHERE e.name = i.name)
+         ON CONFLICT DO NOTHING
+         RETURNING id, name
+      )
+      SELECT id, name FROM existing
+      UNION ALL
+      SELECT id, name FROM inserted
+      """
+
+SKILLS_BY_NAME = "SELECT DISTINCT ON (name) id, name FROM skills WHERE name = ANY(%s) ORDER BY name, id"
+
+LINK_JOB_SKILLS = """
+      INSERT INTO job_skills (job_id, skill_id)
+      SELECT %s, unnest(%s::bigint[])
+      ON CONFLICT DO NOTHING
+      """
+
+def upsert_skill_steps(names):
+   """Steps: insert any missing skill names and return a {name: id} mapping in one statement"""
+   names = list(dict.fromkeys(names))
+   if not names:
+      return {}
+   rows = yield fetch_all(UPSERT_SKILLS, (names,))
+   skill_ids = {name: skill_id for skill_id, name in rows}
+
+   # A concurrent writer can win the insert race; pick up its rows
+   missing = [name for name in names if name not in skill_ids]
+   if missing:
+      rows = yield fetch_all(SKILLS_BY_NAME, (missing,))
+      skill_ids.update({name: skill_id for skill_id, name in rows})
+   return skill_ids
+
+def upsert_skills(cursor, names):
+   return run_steps(cursor, upsert_skill_steps(names))
+
+def link_job_skills(cursor, job_id, skill_ids):
+   # Sorted, so concurrent postings lock job_skills rows in the same order and cannot deadlock
+   cursor.execute(LINK_JOB_SKILLS, (job_id, sorted(skill_ids)))
+
+# Outlines are never reordered once written, so topic order is safe to keep in-process.
+# course_outline_id -> tuple of topic ids in sequence order
+_topic_orders = cache.LRUCache(maxsize=int(os.getenv('TOPIC_ORDER_CACHE_SIZE', '2048')))
+# topic_id -> course_outline_id
+_topic_outlines = cache.LRUCache(maxsize=int(os.getenv('TOPIC_ORDER_CACHE_SIZE', '2048')) * 16)
+
+
+def cache_topic_order(course_outline_id, topic_ids):
+    _topic_orders.set(course_outline_id, tuple(topic_ids))
+    for topic_id in topic_ids:
+        _topic_outlines.set(topic_id, course_outline_id)
+
+
+def topic_order(course_outline_id):
+    """Cached ordered topic ids of an outline, or None"""
+    return _topic_orders.get(course_outline_id)
+
+
+def outline_of_topic(topic_id):
+    """(course_outline_id, ordered topic ids) for a topic if both are cached, else (None, None)"""
+    course_outline_id = _topic_outlines.get(topic_id)
+    if course_outline_id is None:
+        return None, None
+    topic_ids = _topic_orders.get(course_outline_id)
+    if topic_ids is None:
+        return None, None
+    return course_outline_id, topic_ids
+
+
+def invalidate_topic_order(course_outline_id):
+    topic_ids = _topic_orders.get(course_outline_id)
+    _topic_orders.invalidate(course_outline_id)
+    for topic_id in topic_ids or ():
+        _topic_outlines.invalidate(topic_id)
+
+
+def topic_cache_stats():
+    return {"orders": _topic_orders.stats(), "topics": _topic_outlines.stats()}
+
+
+# skill_id -> course outline dict as returned by /api/select-skill
+_outlines = cache.LRUCache(maxsize=int(os.getenv('OUTLINE_CACHE_SIZE', '512')))
+
+
+def cached_outline(skill_id):
+    return _outlines.get(skill_id)
+
+
+def cache_outline(outline):
+    """Cache an outline by skill and remember its topic order"""
+    _outlines.set(outline["skill_id"], outline)
+    cache_topic_order(outline["id"], [topic["id"] for topic in outline["topics"]])
+
+
+def reuse_outline(skill_id, outline):
+    """An equivalent skill's outline served as skill_id's, and cached under skill_id so its next
+    requests skip the similarity lookups"""
+    outline = {**outline, "skill_id": skill_id}
+    cache_outline(outline)
+    return outline
+
+
+def outline_from_row(skill_id, row):
+    """(skill name, outline or None) from a queries.OUTLINE_FOR_SKILL row, caching the outline"""
+    if not row:
+        return None, None
+
+    skill_name, outline_id, title, description, topics = row
+    if outline_id is None:
+        return skill_name, None
+
+    outline = {
+        "id": outline_id,
+        "skill_id": skill_id,
+        "title": title,
+        "description": description,
+        "topics": topics
+    }
+    cache_outline(outline)
+    return skill_name, outline
+
+
+def invalidate_outline(skill_id):
+    outline = _outlines.get(skill_id)
+    _outlines.invalidate(skill_id)
+    if outline:
+        invalidate_topic_order(outline["id"])
+
+
+def outline_cache_stats():
+    return _outlines.stats()
+
+
+def plan_skills(names):
+   """Split names into ({name: id} matched in skill_index, {name: batch sibling}, names to upsert).
+
+   Only names with the same canonical key are merged, within the batch onto the first of them.
+   Names that merely look alike are logged as possible aliases and kept as separate skills.
+   """
+   skill_ids = {}
+   batch = SkillIndex(skill_index.threshold)
+   aliases = {}
+   for name in dict.fromkeys(names):
+      match = skill_index.match(name)
+      if match:
+         skill_ids[name] = match[0]
+         continue
+      sibling = batch.match(name, count=False)
+      if sibling:
+         aliases[name] = sibling[0]
+         continue
+      batch.add(name, name)
+      similar = skill_index.similar(name)
+      if similar:
+         util.log_info("Possible skill alias: %s ~ skill %s (%s, similarity %.2f)", name, similar[0], similar[1], similar[2])
+
+   new_names = [name for name in dict.fromkeys(names) if name not in skill_ids and name not in aliases]
+   return skill_ids, aliases, new_names
+
+def finish_skills(skill_ids, aliases, inserted):
+   """Add the upserted skills and point aliases at their representative's id"""
+   skill_ids.update(inserted)
+   for name, representative in aliases.items():
+      skill_ids[name] = skill_ids[representative]
+   return skill_ids
+
+def index_skills(inserted):
+   """Index upserted skills once their transaction has committed.
+
+   Indexed earlier, another request could link a skill row it cannot see yet and fail the foreign key check.
+   """
+   for name, skill_id in inserted.items():
+      skill_index.add(skill_id, name)
+
+def load_skill_index():
+   """Steps: index skills rows not seen yet, at most every few minutes (SkillIndex.needs_load)"""
+   if skill_index.needs_load():
+      skill_index.load_rows((yield fetch_all(*skill_index.load_query())))
+
+def resolve_skill_steps(names):
+   """Steps: map each name to a skill id, reusing skills with the same canonical key before inserting.
+
+   Only names with no existing match are upserted. Returns ({name: id}, {name: id} upserted, for index_skills).
+   """
+   yield from load_skill_index()
+   skill_ids, aliases, new_names = plan_skills(names)
+   inserted = yield from upsert_skill_steps(new_names)
+   return finish_skills(skill_ids, aliases, inserted), inserted
+
+def resolve_skills(cursor, names):
+   return run_steps(cursor, resolve_skill_steps(names))
+
+def save_skills_list(skills_list, job_id=-1):
+   """Resolve all skills (reusing canonical matches) and link them to the job in one transaction.
+
+   Returns {"skills": [{"id", "name"}, ...]} in input order.
+   """
    try:
-           # Store skills in database
-      skills_data = []
-      for skill_name in skills_list:
-         job_id=-1
-         # Check if skill already exists
-         conn = get_db_connection()
+      names = [_skill_name(skill) for skill in skills_list]
+      with connection() as conn:
          cursor = conn.cursor()
-         cursor.execute("SELECT id FROM skills WHERE name = %s", (skill_name,))
-         result = cursor.fetchone()
-         
-         if result:
-               skill_id = result[0]
-         else:
-               cursor.execute(
-                  "INSERT INTO skills (name) VALUES (%s) RETURNING id",
-                  (skill_name,)
-               )
-               skill_id = cursor.fetchone()[0]
-         
-         # Link skill to job posting
-         cursor.execute(
-               "INSERT INTO job_skills (job_id, skill_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
-               (job_id, skill_id)
-         )
-         skills_data.append({"id": skill_id, "name": skill_name})
-      
-      conn.commit()
-      cursor.close()
-      conn.close()
-      
+         skill_ids, inserted = resolve_skills(cursor, names)
+         link_job_skills(cursor, job_id, set(skill_ids.values()))
+      index_skills(inserted)
+
+      skills_data = [{"id": skill_ids[name], "name": name} for name in names]
       return {"skills": skills_data}
-   
+
    except Exception as e:
-      util.log(util.LogLevel.Error, str(e))
+      util.log_error("Saving skills failed: %s", e)
       raise e
 
 
@@ -0,0 +1,212 @@
+"""Thread-safe psycopg2 connection pool behind db.connection(); imported on first use"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+import psycopg2
+import psycopg2.extensions
+import metrics
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """Cursor that records per-statement timings and logs slow statements"""
+
+    def _timed(self, method, sql, params):
+        started = time.perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            metrics.observe_query(sql, params, time.perf_counter() - started)
+
+    def execute(self, sql, params=None):
+        return self._timed(super().execute, sql, params)
+
+    def executemany(self, sql, params_seq):
+        return self._timed(super().executemany, sql, params_seq)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out before the timeout"""
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """psycopg2 connection whose close() hands it back to its pool"""
+    pool = None
+    last_used = 0.0
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.putconn(self)
+        else:
+            super().close()
+
+    def discard(self):
+        self.pool = None
+        super().close()
+
+
+class ConnectionPool:
+    """Thread-safe pool of connections to the Neon PostgreSQL database"""
+
+    def __init__(self, minconn=1, maxconn=10, timeout=30.0, health_check_after=30.0):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+        self._idle = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "connections_opened": 0,
+            "connections_discarded": 0,
+            "checkout_seconds_total": 0.0,
+            "checkout_seconds_max": 0.0,
+        }
+
+    def _connect(self):
+        conn = psycopg2.connect(
+            host=os.getenv('PGHOST'),
+            database=os.getenv('PGDATABASE'),
+            user=os.getenv('PGUSER'),
+            password=os.getenv('PGPASSWORD'),
+            connection_factory=PooledConnection,
+            cursor_factory=TimedCursor
+        )
+        conn.pool = self
+        conn.last_used = time.monotonic()
+        with self._cond:
+            self._stats["connections_opened"] += 1
+        return conn
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        if time.monotonic() - conn.last_used < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _drop(self, conn):
+        try:
+            conn.discard()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._stats["connections_discarded"] += 1
+
+    def getconn(self):
+        """Check out a healthy connection, waiting up to `timeout` seconds"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        with self._cond:
+            waited = False
+            while not self._idle and self._in_use >= self.maxconn:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                if not waited:
+                    self._stats["waits"] += 1
+                    waited = True
+                self._cond.wait(remaining)
+            conn = self._idle.pop() if self._idle else None
+            self._in_use += 1
+
+        opened = False
+        try:
+            while conn is not None and not self._healthy(conn):
+                self._drop(conn)
+                with self._cond:
+                    conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._connect()
+                opened = True
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        conn.pool = self
+        metrics.record_checkout(opened)
+        elapsed = time.monotonic() - started
+        with self._cond:
+            self._stats["checkouts"] += 1
+            self._stats["checkout_seconds_total"] += elapsed
+            self._stats["checkout_seconds_max"] = max(self._stats["checkout_seconds_max"], elapsed)
+        return conn
+
+    def putconn(self, conn):
+        """Return a connection to the pool, rolling back any open transaction"""
+        if conn.pool is not self:
+            return
+        conn.pool = None
+        keep = not conn.closed
+        if keep and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                keep = False
+        if keep:
+            conn.last_used = time.monotonic()
+        else:
+            self._drop(conn)
+
+        with self._cond:
+            self._in_use -= 1
+            pooled = keep and len(self._idle) < self.maxconn
+            if pooled:
+                self._idle.append(conn)
+            self._cond.notify()
+        if keep and not pooled:
+            self._drop(conn)
+
+    def fill(self):
+        """Open connections until the pool holds at least `minconn`"""
+        while True:
+            with self._cond:
+                if len(self._idle) + self._in_use >= self.minconn:
+                    return
+            conn = self._connect()
+            conn.pool = None
+            with self._cond:
+                self._idle.append(conn)
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._drop(conn)
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection; commit on success, roll back on error, always return it"""
+        conn = self.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.putconn(conn)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["in_use"] = self._in_use
+            stats["idle"] = len(self._idle)
+            stats["min_size"] = self.minconn
+            stats["max_size"] = self.maxconn
+        checkouts = stats["checkouts"]
+        stats["checkout_seconds_avg"] = stats["checkout_seconds_total"] / checkouts if checkouts else 0.0
+        return stats
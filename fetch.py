@@ -0,0 +1,256 @@
+import ipaddress
+import json
+import os
+import re
+import socket
+import threading
+from contextvars import ContextVar
+from urllib.parse import urljoin, urlsplit
+import cache
+
+USER_AGENT = "Mozilla/5.0 (compatible; ChefEdBot/1.0)"
+TIMEOUT = (3.05, 15)  # (connect, read) seconds
+MAX_REDIRECTS = 5
+# Job posting pages are rarely over a few hundred KB; anything much bigger isn't one
+MAX_BYTES = int(os.getenv('FETCH_MAX_BYTES', str(2 * 1024 * 1024)))
+
+# Where the big job boards keep the description; tried in order before falling back to <main>/<body>
+DESCRIPTION_SELECTORS = [
+    "#jobDescriptionText",                               # Indeed
+    "[data-automation-id='jobPostingDescription']",      # Workday
+    ".show-more-less-html__markup",                      # LinkedIn
+    "#content .posting-page",                            # Lever
+    "#content #app_body",                                # Greenhouse
+    "[class*='job-description']",
+    "[id*='job-description']",
+    "[class*='jobDescription']",
+    "main",
+    "article",
+]
+
+BOILERPLATE_TAGS = ["script", "style", "noscript", "svg", "header", "footer", "nav", "form", "iframe", "aside", "button"]
+
+_session = None
+_session_lock = threading.Lock()
+# url -> {"etag", "last_modified", "text"}: the extracted description, revalidated with conditional GETs
+_pages = cache.LRUCache(maxsize=256)
+_stats = {"requests": 0, "not_modified": 0, "bytes": 0, "blocked": 0}
+_stats_lock = threading.Lock()
+# (hostname, address) check_url approved for the request being sent
+_pinned = ContextVar("pinned", default=None)
+
+
+class FetchError(ValueError):
+    """A job posting URL that isn't fetched: not public, unreachable, an HTTP error, too many redirects
+    or too large"""
+
+
+def _count(**counts):
+    with _stats_lock:
+        for name, value in counts.items():
+            _stats[name] += value
+
+
+def _pinned_adapter_class():
+    from requests.adapters import HTTPAdapter
+
+    class PinnedAdapter(HTTPAdapter):
+        """Connects to the address check_url approved instead of resolving the host again, which a DNS
+        answer changed in between (rebinding) could point inside the network. TLS still sends and
+        verifies the hostname."""
+
+        def _pool(self, scheme, host, port, pool_kwargs):
+            pinned = _pinned.get()
+            if pinned is None or pinned[0] != host:
+                raise FetchError(f"{host} was not checked before connecting")
+            if scheme == "https":
+                pool_kwargs = {**pool_kwargs, "server_hostname": host, "assert_hostname": host}
+            return self.poolmanager.connection_from_host(pinned[1], port, scheme, pool_kwargs=pool_kwargs)
+
+        def send(self, request, **kwargs):
+            # The connection is made to an address, so name the host the request is for
+            request.headers["Host"] = urlsplit(request.url).netloc.rpartition("@")[2]
+            return super().send(request, **kwargs)
+
+        def get_connection(self, url, proxies=None):
+            parts = urlsplit(url)
+            return self._pool(parts.scheme, parts.hostname, parts.port or _default_port(parts.scheme), {})
+
+        def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+            # requests >= 2.32 asks for the pool here rather than through get_connection
+            host_params, pool_kwargs = self.build_connection_pool_key_attributes(request, verify, cert)
+            return self._pool(host_params["scheme"], host_params["host"], host_params["port"], pool_kwargs)
+
+    return PinnedAdapter
+
+
+def _default_port(scheme):
+    return 443 if scheme == "https" else 80
+
+
+def get_session():
+    """Shared requests session with pooled keep-alive connections, retries on 5xx, and connections pinned
+    to the checked address"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                # requests and bs4 are only imported once a posting is given as a URL
+                import requests
+                from urllib3.util.retry import Retry
+                session = requests.Session()
+                # A proxy from the environment would resolve the host itself, past check_url
+                session.trust_env = False
+                retries = Retry(total=2, backoff_factor=0.5, status_forcelist=[502, 503, 504], allowed_methods=["GET"])
+                adapter = _pinned_adapter_class()(pool_connections=10, pool_maxsize=20, max_retries=retries)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({"User-Agent": USER_AGENT, "Accept": "text/html,application/xhtml+xml"})
+                _session = session
+    return _session
+
+
+def _public(address):
+    return address.is_global and not address.is_multicast
+
+
+def check_url(url):
+    """The address to connect to for url; FetchError unless url is http(s) and its host resolves only
+    to public addresses.
+
+    Postings are fetched on behalf of anonymous callers, so loopback, private, link-local (cloud
+    metadata) and other reserved addresses are refused rather than reached from inside the network.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise FetchError(f"Not an http(s) URL: {url}")
+    try:
+        infos = socket.getaddrinfo(parts.hostname, parts.port or _default_port(parts.scheme), type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError) as e:
+        raise FetchError(f"Cannot resolve {parts.hostname}: {e}")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if not _public(address):
+            _count(blocked=1)
+            raise FetchError(f"{parts.hostname} resolves to a non-public address")
+    return infos[0][4][0]
+
+
+def _get(url, headers, timeout):
+    """GET url, following at most MAX_REDIRECTS redirects and checking every hop with check_url"""
+    import requests
+    for _ in range(MAX_REDIRECTS + 1):
+        token = _pinned.set((urlsplit(url).hostname, check_url(url)))
+        try:
+            response = get_session().get(url, headers=headers, timeout=timeout, stream=True, allow_redirects=False)
+        except requests.RequestException as e:
+            raise FetchError(f"Cannot fetch {url}: {e}")
+        finally:
+            _pinned.reset(token)
+        _count(requests=1)
+        if not response.is_redirect:
+            return response
+        response.close()
+        url = urljoin(url, response.headers["Location"])
+    raise FetchError(f"More than {MAX_REDIRECTS} redirects")
+
+
+def _read(response):
+    """The body of a streamed response, refusing pages over MAX_BYTES"""
+    import requests
+    chunks = []
+    size = 0
+    with response:
+        try:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if size > MAX_BYTES:
+                    raise FetchError(f"Page is larger than {MAX_BYTES} bytes")
+                chunks.append(chunk)
+        except requests.RequestException as e:
+            raise FetchError(f"Cannot read {response.url}: {e}")
+    _count(bytes=size)
+    return b"".join(chunks)
+
+
+def job_text(url, timeout=TIMEOUT):
+    """The job description at url, revalidating a previously extracted one with ETag / Last-Modified"""
+    cached = _pages.get(url)
+    headers = {}
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    response = _get(url, headers, timeout)
+    if response.status_code == 304 and cached:
+        response.close()
+        _count(not_modified=1)
+        return cached["text"]
+    if not response.ok:
+        response.close()
+        raise FetchError(f"Job posting returned HTTP {response.status_code}")
+
+    # bs4 reads the charset from the page itself when the headers don't give one
+    text = extract_job_text(_read(response), from_encoding=response.encoding if "charset" in
+                            response.headers.get("Content-Type", "") else None)
+    _pages.set(url, {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "text": text,
+    })
+    return text
+
+
+def _json_ld_description(soup):
+    """Description from schema.org JobPosting metadata, which most job boards embed"""
+    from bs4 import BeautifulSoup
+    for script in soup.find_all("script", type="application/ld+json"):
+        try:
+            data = json.loads(script.string or "")
+        except ValueError:
+            continue
+        for item in data if isinstance(data, list) else [data]:
+            if isinstance(item, dict) and item.get("@type") == "JobPosting" and item.get("description"):
+                title = item.get("title", "")
+                description = BeautifulSoup(item["description"], "html.parser").get_text("\n")
+                return f"{title}\n{description}" if title else description
+    return None
+
+
+def _compact(text):
+    lines = []
+    seen = set()
+    for line in text.splitlines():
+        line = re.sub(r"\s+", " ", line).strip()
+        if line and line not in seen:
+            seen.add(line)
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def extract_job_text(html, max_chars=12000, from_encoding=None):
+    """Strip a job posting page (text, or bytes in from_encoding) down to the description text"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser", from_encoding=from_encoding)
+    text = _json_ld_description(soup)
+
+    if not text:
+        for tag in soup(BOILERPLATE_TAGS):
+            tag.decompose()
+        node = None
+        for selector in DESCRIPTION_SELECTORS:
+            node = soup.select_one(selector)
+            if node and len(node.get_text(strip=True)) > 200:
+                break
+            node = None
+        node = node or soup.body or soup
+        text = node.get_text("\n")
+
+    return _compact(text)[:max_chars]
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,139 @@
+"""HTTP caching for generated content: strong ETags, 304 Not Modified and gzip/brotli compression.
+
+Outlines and topic content don't change once generated, so the same JSON is sent over and over.
+Every 200 JSON response gets an ETag hashed from its body; a GET whose If-None-Match matches is
+answered with an empty 304. Bodies of COMPRESS_MIN_BYTES or more are compressed for clients that
+accept it, and the compressed bytes of recent bodies are kept by ETag, so hot content is compressed
+once rather than on every request. Brotli is used when the `brotli` package is installed.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from cache import LRUCache
+
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+
+# Cache-Control for content addressed by an immutable revision (a block page's cursor)
+IMMUTABLE = "public, max-age=31536000, immutable"
+# ...and for the current version of shared content, which a regeneration could replace
+SHARED = f"public, max-age={int(os.getenv('HTTP_CACHE_MAX_AGE', '300'))}"
+
+_compressed = LRUCache(maxsize=int(os.getenv('COMPRESS_CACHE_SIZE', '256')))
+_counts = {"responses": 0, "not_modified": 0, "compressed": 0, "bytes_in": 0, "bytes_out": 0}
+_counts_lock = threading.Lock()
+_encoders = None
+
+
+def _get_encoders():
+    """{content coding: compress function}, best first"""
+    global _encoders
+    if _encoders is None:
+        encoders = {}
+        try:
+            import brotli
+            encoders["br"] = lambda body: brotli.compress(body, quality=5)
+        except ImportError:
+            pass
+        # mtime=0 so the same body always compresses to the same bytes
+        encoders["gzip"] = lambda body: gzip.compress(body, compresslevel=6, mtime=0)
+        _encoders = encoders
+    return _encoders
+
+
+def _coding(accept_encoding):
+    """The preferred coding a client accepts (highest q, then br over gzip), or None"""
+    qualities = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for coding in _get_encoders():
+        quality = qualities.get(coding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def _matches(if_none_match, digest):
+    """Whether If-None-Match names this body in any of its encodings"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"').partition("-")[0] == digest:
+            return True
+    return False
+
+
+def respond(method, if_none_match, accept_encoding, body):
+    """(status, body, headers) for a 200 JSON body: 304 for a GET or HEAD whose If-None-Match matches,
+    otherwise the body, compressed when it is large enough and the client accepts it.
+
+    Each encoding is its own representation, so its ETag carries the coding as a suffix.
+    """
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    coding = _coding(accept_encoding) if len(body) >= COMPRESS_MIN_BYTES else None
+    headers = {}
+
+    if method in ("GET", "HEAD") and _matches(if_none_match, digest):
+        headers["ETag"] = f'"{digest}-{coding}"' if coding else f'"{digest}"'
+        with _counts_lock:
+            _counts["responses"] += 1
+            _counts["not_modified"] += 1
+            _counts["bytes_in"] += len(body)
+        return 304, b"", headers
+
+    size = len(body)
+    if coding:
+        compressed = _compressed.get((digest, coding))
+        if compressed is None:
+            compressed = _get_encoders()[coding](body)
+            _compressed.set((digest, coding), compressed)
+        if len(compressed) < size:
+            body = compressed
+            headers["Content-Encoding"] = coding
+    headers["ETag"] = f'"{digest}-{coding}"' if "Content-Encoding" in headers else f'"{digest}"'
+    with _counts_lock:
+        _counts["responses"] += 1
+        _counts["compressed"] += "Content-Encoding" in headers
+        _counts["bytes_in"] += size
+        _counts["bytes_out"] += len(body)
+    return 200, body, headers
+
+
+def stats():
+    with _counts_lock:
+        counts = dict(_counts)
+    return {**counts, "compressed_cache": _compressed.stats()}
+
+
+def init_app(app):
+    """Add ETags, 304s and compression to the app's 200 JSON responses"""
+    from flask import request
+
+    @app.after_request
+    def _cache(response):
+        if (response.status_code != 200 or response.is_streamed or response.mimetype != "application/json"
+                or "Content-Encoding" in response.headers):
+            return response
+        status, body, headers = respond(request.method, request.headers.get("If-None-Match"),
+                                        request.headers.get("Accept-Encoding"), response.get_data())
+        response.status_code = status
+        response.set_data(body)
+        response.headers.update(headers)
+        response.vary.add("Accept-Encoding")
+        if status == 304:
+            del response.headers["Content-Type"]
+        return response
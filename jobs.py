@@ -0,0 +1,159 @@
+import json
+import os
+import socket
+import threading
+import time
+import db
+import util
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS generation_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload JSONB NOT NULL,
+    -- The user who queued the job; only they can read it
+    user_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    result JSONB,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+CREATE INDEX IF NOT EXISTS generation_jobs_queued ON generation_jobs (id) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS generation_jobs_owner ON generation_jobs (user_id, id);
+"""
+
+INSERT_JOB = "INSERT INTO generation_jobs (kind, payload, user_id) VALUES (%s, %s, %s) RETURNING id"
+
+JOB_FIELDS = ("id", "kind", "status", "result", "error", "attempts", "created_at", "started_at", "finished_at")
+SELECT_JOB = f"SELECT {', '.join(JOB_FIELDS)} FROM generation_jobs WHERE id = %s AND user_id = %s"
+
+FINISHED = ('succeeded', 'failed')
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def ensure_schema():
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            with db.connection() as conn:
+                conn.cursor().execute(SCHEMA)
+            _schema_ready = True
+
+
+def enqueue(kind, payload, user_id):
+    """Queue a generation job for a user and return its id"""
+    ensure_schema()
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(INSERT_JOB, (kind, json.dumps(payload), user_id))
+        return cursor.fetchone()[0]
+
+
+def get(job_id, user_id):
+    """A job the user queued, or None (also for another user's job)"""
+    ensure_schema()
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(SELECT_JOB, (job_id, user_id))
+        row = cursor.fetchone()
+    if not row:
+        return None
+    return dict(zip(JOB_FIELDS, row))
+
+
+def claim(worker):
+    """Atomically take the oldest queued job; concurrent workers skip each other's rows"""
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            UPDATE generation_jobs
+            SET status = 'running', started_at = CURRENT_TIMESTAMP, attempts = attempts + 1, worker = %s
+            WHERE id = (
+                SELECT id FROM generation_jobs
+                WHERE status = 'queued'
+                ORDER BY id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id, kind, payload
+            """,
+            (worker,)
+        )
+        return cursor.fetchone()
+
+
+def complete(job_id, result):
+    with db.connection() as conn:
+        conn.cursor().execute(
+            """
+            UPDATE generation_jobs
+            SET status = 'succeeded', result = %s, error = NULL, finished_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+            """,
+            (json.dumps(result, default=str), job_id)
+        )
+
+
+def fail(job_id, error):
+    with db.connection() as conn:
+        conn.cursor().execute(
+            "UPDATE generation_jobs SET status = 'failed', error = %s, finished_at = CURRENT_TIMESTAMP WHERE id = %s",
+            (error, job_id)
+        )
+
+
+def requeue_stale(stale_after, max_attempts):
+    """Put back jobs whose worker died mid-run; give up on ones that keep dying"""
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            UPDATE generation_jobs
+            SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+                error = CASE WHEN attempts >= %s THEN 'Worker stopped before finishing' ELSE error END,
+                finished_at = CASE WHEN attempts >= %s THEN CURRENT_TIMESTAMP ELSE NULL END
+            WHERE status = 'running' AND started_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+            """,
+            (max_attempts, max_attempts, max_attempts, stale_after)
+        )
+        return cursor.rowcount
+
+
+def run_worker(handlers, poll_interval=1.0, stale_after=600, max_attempts=3, stop_event=None):
+    """Claim and run jobs until stop_event is set. handlers maps job kind -> fn(payload) -> result"""
+    ensure_schema()
+    worker = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    last_requeue = 0.0
+    util.log_info("Job worker %s started for %s", worker, sorted(handlers))
+
+    while stop_event is None or not stop_event.is_set():
+        if time.monotonic() - last_requeue > stale_after / 4:
+            requeued = requeue_stale(stale_after, max_attempts)
+            if requeued:
+                util.log_warning("Requeued %s stale jobs", requeued)
+            last_requeue = time.monotonic()
+
+        job = claim(worker)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+
+        job_id, kind, payload = job
+        handler = handlers.get(kind)
+        if handler is None:
+            fail(job_id, f"No handler for job kind '{kind}'")
+            continue
+        try:
+            complete(job_id, handler(payload))
+        except Exception as e:
+            util.log_error("Job %s (%s) failed: %s", job_id, kind, e)
+            fail(job_id, str(e))
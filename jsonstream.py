@@ -0,0 +1,62 @@
+import json
+import jsoncodec
+
+
+class ArrayItemParser:
+    """Incrementally parse a streamed JSON object and emit the items of one top-level array.
+
+    Feed it text chunks as they arrive; each call returns the array items that became
+    complete, e.g. the entries of "blocks" in a blocks_result response.
+    """
+
+    def __init__(self, array_key):
+        self.array_key = array_key
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string = []
+        self._last_string = None
+        self._array_depth = None
+        self._item = []
+        self._item_depth = None
+
+    def feed(self, chunk):
+        items = []
+        for ch in chunk:
+            if self._item_depth is not None:
+                self._item.append(ch)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = json.loads('"' + ''.join(self._string) + '"')
+                    continue
+                if self._depth == 1:
+                    self._string.append(ch)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string = []
+            elif ch in '{[':
+                if ch == '[' and self._depth == 1 and self._last_string == self.array_key:
+                    self._array_depth = 2
+                self._depth += 1
+                if self._array_depth is not None and self._depth == self._array_depth + 1 and self._item_depth is None:
+                    self._item_depth = self._depth
+                    self._item = [ch]
+            elif ch in '}]':
+                self._depth -= 1
+                if self._item_depth is not None and self._depth == self._item_depth - 1:
+                    items.append(jsoncodec.loads(''.join(self._item)))
+                    self._item = []
+                    self._item_depth = None
+                elif self._array_depth is not None and self._depth == self._array_depth - 1:
+                    self._array_depth = None
+                    self._last_string = None
+        return items
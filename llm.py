@@ -0,0 +1,290 @@
+import os
+import threading
+import time
+import cache
+from resilience import upstream
+from routing import router
+from telemetry import llm_calls
+
+# Built on first use, so importing this module (and starting the app) costs no openai import or cache file
+_client = None
+_async_client = None
+_response_cache = None
+_lock = threading.Lock()
+
+
+def get_client():
+    """The process's OpenAI client; retries and timeouts are handled per call by resilience.upstream"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                from openai import OpenAI
+                _client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
+    return _client
+
+
+def get_async_client():
+    """AsyncOpenAI client for the async app (asgi.py); one holds hundreds of concurrent requests on an event loop"""
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                from openai import AsyncOpenAI
+                _async_client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
+    return _async_client
+
+
+def _build_cache():
+    if os.getenv('LLM_CACHE_DISABLED') == '1':
+        return None
+    ttl = float(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 3600)))
+    memory = cache.LRUCache(maxsize=int(os.getenv('LLM_CACHE_SIZE', '256')), ttl=ttl)
+    persistent = cache.SQLiteCache(
+        os.getenv('LLM_CACHE_PATH') or cache.default_cache_path('chefed_llm_cache.sqlite'),
+        ttl=ttl,
+        max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', '10000'))
+    )
+    return cache.LLMCache(memory, persistent)
+
+
+def get_response_cache():
+    """The model response cache, or None when LLM_CACHE_DISABLED=1"""
+    global _response_cache
+    if _response_cache is None:
+        with _lock:
+            if _response_cache is None:
+                _response_cache = _build_cache() or False
+    return _response_cache or None
+
+
+def _lookup(model, system_prompt, user_input, text, reasoning, bypass_cache):
+    """Return (cache key, cached output_text or None, cache status for telemetry)"""
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return None, None, "disabled"
+    effort = reasoning.get("effort") if reasoning else None
+    key = cache.LLMCache.key(model, effort, system_prompt, user_input, text)
+    if bypass_cache:
+        response_cache.bypassed()
+        return key, None, "bypass"
+    cached = response_cache.get(key)
+    return key, cached, "hit" if cached is not None else "miss"
+
+
+def _route(call_site, model, system_prompt, user_input, text, reasoning, bypass_cache):
+    """Pick the model and effort for a call: (route, reasoning, cached output_text from a better option or None)"""
+    route = router.choose(call_site, model, reasoning.get("effort") if reasoning else None)
+    if model is None:
+        reasoning = {**(reasoning or {}), "effort": route.effort} if route.effort else None
+    # A stored answer from a better option beats a fresh one from a faster option
+    response_cache = get_response_cache()
+    if response_cache is not None and not bypass_cache:
+        for option in route.preferred:
+            key = cache.LLMCache.key(option.model, option.effort, system_prompt, user_input, text)
+            cached = response_cache.get(key)
+            if cached is not None:
+                return route._replace(model=option.model, effort=option.effort), reasoning, cached
+    return route, reasoning, None
+
+
+def _params(model, system_prompt, user_input, text, reasoning, **kwargs):
+    if text is not None:
+        kwargs["text"] = text
+    if reasoning is not None:
+        kwargs["reasoning"] = reasoning
+    return dict(
+        model=model,
+        input=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_input}
+        ],
+        **kwargs
+    )
+
+
+def _create(call_site, model, system_prompt, user_input, text, reasoning, **kwargs):
+    params = _params(model, system_prompt, user_input, text, reasoning, **kwargs)
+    # A stream can only be retried until it is handed to the caller, so it is never hedged
+    return upstream.call(call_site, model, lambda timeout: get_client().responses.create(timeout=timeout, **params),
+                         hedge=not kwargs.get("stream"))
+
+
+async def _acreate(call_site, model, system_prompt, user_input, text, reasoning, **kwargs):
+    params = _params(model, system_prompt, user_input, text, reasoning, **kwargs)
+    return await upstream.acall(call_site, model, lambda timeout: get_async_client().responses.create(timeout=timeout, **params),
+                                hedge=not kwargs.get("stream"))
+
+
+def _prepare(call_site, model, system_prompt, user_input, text, reasoning, bypass_cache):
+    """Route and look up a call: (route, reasoning, cache key, cache status, cached output_text or None)"""
+    started = time.perf_counter()
+    route, reasoning, cached = _route(call_site, model, system_prompt, user_input, text, reasoning, bypass_cache)
+    if cached is not None:
+        llm_calls.record(call_site, route.model, time.perf_counter() - started, cache_status="hit")
+        return route, reasoning, None, "hit", cached
+    key, cached, cache_status = _lookup(route.model, system_prompt, user_input, text, reasoning, bypass_cache)
+    if cached is not None:
+        llm_calls.record(call_site, route.model, time.perf_counter() - started, cache_status=cache_status)
+    return route, reasoning, key, cache_status, cached
+
+
+def _completed(call_site, route, started, usage, cache_status, key, output_text):
+    duration = time.perf_counter() - started
+    router.observe(call_site, route, duration)
+    llm_calls.record(call_site, route.model, duration, usage=usage, cache_status=cache_status)
+    if key is not None:
+        get_response_cache().set(key, output_text)
+
+
+def respond(call_site, system_prompt, user_input, text=None, reasoning=None, model=None, bypass_cache=False):
+    """Call the Responses API and return output_text, served from the response cache when possible.
+
+    Without a model, the call site's routing policy picks the model and reasoning effort that fit
+    its latency budget. Every call is recorded in telemetry under call_site. Pass bypass_cache=True
+    to force a fresh generation; the fresh result still refreshes the cache.
+    """
+    started = time.perf_counter()
+    route, reasoning, key, cache_status, cached = _prepare(call_site, model, system_prompt, user_input, text, reasoning, bypass_cache)
+    if cached is not None:
+        return cached
+
+    try:
+        response = _create(call_site, route.model, system_prompt, user_input, text, reasoning)
+    except Exception as e:
+        llm_calls.record(call_site, route.model, time.perf_counter() - started, cache_status=cache_status, error=e)
+        raise
+    _completed(call_site, route, started, response.usage, cache_status, key, response.output_text)
+    return response.output_text
+
+
+async def arespond(call_site, system_prompt, user_input, text=None, reasoning=None, model=None, bypass_cache=False):
+    """respond() on the AsyncOpenAI client, for the async app"""
+    started = time.perf_counter()
+    route, reasoning, key, cache_status, cached = _prepare(call_site, model, system_prompt, user_input, text, reasoning, bypass_cache)
+    if cached is not None:
+        return cached
+
+    try:
+        response = await _acreate(call_site, route.model, system_prompt, user_input, text, reasoning)
+    except Exception as e:
+        llm_calls.record(call_site, route.model, time.perf_counter() - started, cache_status=cache_status, error=e)
+        raise
+    _completed(call_site, route, started, response.usage, cache_status, key, response.output_text)
+    return response.output_text
+
+
+def _delta(event, chunks):
+    """Output text of a stream event (or None), raising on a failed stream; returns the usage on completion"""
+    if event.type == "response.output_text.delta":
+        chunks.append(event.delta)
+        return event.delta, None
+    if event.type == "response.completed":
+        return None, event.response.usage
+    if event.type in ("response.failed", "response.incomplete"):
+        raise RuntimeError(f"Streamed response ended with {event.type}")
+    return None, None
+
+
+def stream_respond(call_site, system_prompt, user_input, text=None, reasoning=None, model=None, bypass_cache=False):
+    """Like respond(), but yield output text deltas as the model produces them.
+
+    A cached response is yielded as a single chunk; a completed stream is written to the cache.
+    """
+    started = time.perf_counter()
+    route, reasoning, key, cache_status, cached = _prepare(call_site, model, system_prompt, user_input, text, reasoning, bypass_cache)
+    if cached is not None:
+        yield cached
+        return
+
+    chunks = []
+    usage = None
+    try:
+        stream = _create(call_site, route.model, system_prompt, user_input, text, reasoning, stream=True)
+        for event in stream:
+            delta, completed = _delta(event, chunks)
+            usage = completed or usage
+            if delta is not None:
+                yield delta
+    except Exception as e:
+        llm_calls.record(call_site, route.model, time.perf_counter() - started, cache_status=cache_status, error=e)
+        raise
+    _completed(call_site, route, started, usage, cache_status, key, "".join(chunks))
+
+
+async def astream_respond(call_site, system_prompt, user_input, text=None, reasoning=None, model=None, bypass_cache=False):
+    """stream_respond() on the AsyncOpenAI client, for the async app"""
+    started = time.perf_counter()
+    route, reasoning, key, cache_status, cached = _prepare(call_site, model, system_prompt, user_input, text, reasoning, bypass_cache)
+    if cached is not None:
+        yield cached
+        return
+
+    chunks = []
+    usage = None
+    try:
+        stream = await _acreate(call_site, route.model, system_prompt, user_input, text, reasoning, stream=True)
+        async for event in stream:
+            delta, completed = _delta(event, chunks)
+            usage = completed or usage
+            if delta is not None:
+                yield delta
+    except Exception as e:
+        llm_calls.record(call_site, route.model, time.perf_counter() - started, cache_status=cache_status, error=e)
+        raise
+    _completed(call_site, route, started, usage, cache_status, key, "".join(chunks))
+
+
+def chat(call_site, messages, response_format=None, model=None):
+    """Chat Completions call recorded in telemetry under call_site; returns the message content.
+
+    Without a model, the call site's routing policy picks one.
+    """
+    kwargs = {}
+    if response_format is not None:
+        kwargs["response_format"] = response_format
+    route = router.choose(call_site, model)
+    started = time.perf_counter()
+    try:
+        response = upstream.call(call_site, route.model, lambda timeout: get_client().chat.completions.create(
+            model=route.model, messages=messages, timeout=timeout, **kwargs))
+    except Exception as e:
+        llm_calls.record(call_site, route.model, time.perf_counter() - started, cache_status="uncached", error=e)
+        raise
+    _completed(call_site, route, started, response.usage, "uncached", None, None)
+    return response.choices[0].message.content
+
+
+async def achat(call_site, messages, response_format=None, model=None):
+    """chat() on the AsyncOpenAI client, for the async app"""
+    kwargs = {}
+    if response_format is not None:
+        kwargs["response_format"] = response_format
+    route = router.choose(call_site, model)
+    started = time.perf_counter()
+    try:
+        response = await upstream.acall(call_site, route.model, lambda timeout: get_async_client().chat.completions.create(
+            model=route.model, messages=messages, timeout=timeout, **kwargs))
+    except Exception as e:
+        llm_calls.record(call_site, route.model, time.perf_counter() - started, cache_status="uncached", error=e)
+        raise
+    _completed(call_site, route, started, response.usage, "uncached", None, None)
+    return response.choices[0].message.content
+
+
+def embed(call_site, model, texts):
+    """Embedding vectors (lists of floats) for texts, in one request; recorded in telemetry under call_site"""
+    started = time.perf_counter()
+    try:
+        response = upstream.call(call_site, model, lambda timeout: get_client().embeddings.create(
+            model=model, input=list(texts), timeout=timeout))
+    except Exception as e:
+        llm_calls.record(call_site, model, time.perf_counter() - started, cache_status="uncached", error=e)
+        raise
+    llm_calls.record(call_site, model, time.perf_counter() - started, usage=response.usage, cache_status="uncached")
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+def cache_stats():
+    response_cache = get_response_cache()
+    return response_cache.stats() if response_cache is not None else {"enabled": False}
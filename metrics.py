@@ -0,0 +1,212 @@
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import lru_cache
+import util
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25)
+
+SLOW_QUERY_SECONDS = float(os.getenv('SLOW_QUERY_MS', '500')) / 1000
+
+# Per-request database usage; None outside a request (workers, scripts)
+_request_db = ContextVar("request_db", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, {'le': bound})} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, {'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Request latency by route", ("method", "route", "status"))
+db_query_duration = Histogram(
+    "db_query_duration_seconds", "SQL statement latency by statement", ("statement",))
+db_slow_queries = Counter(
+    "db_slow_queries_total", "SQL statements slower than SLOW_QUERY_MS", ("statement",))
+db_checkouts_per_request = Histogram(
+    "db_connection_checkouts_per_request", "Pooled connections checked out per request", ("route",), COUNT_BUCKETS)
+db_connects_per_request = Histogram(
+    "db_connections_opened_per_request", "New database connections opened per request", ("route",), COUNT_BUCKETS)
+
+_metrics = [http_request_duration, db_query_duration, db_slow_queries, db_checkouts_per_request, db_connects_per_request]
+# Callables returning extra exposition lines (pool stats, LLM telemetry, ...)
+_collectors = []
+
+
+def register_collector(collector):
+    _collectors.append(collector)
+
+
+@lru_cache(maxsize=1024)
+def statement_label(sql):
+    """Low-cardinality label for a SQL string, e.g. 'SELECT course_topics'"""
+    match = re.search(r"\b(select\b.*?\bfrom|insert\s+into|update|delete\s+from)\s+(\w+)", sql, re.I | re.S)
+    if not match:
+        return sql.split(None, 1)[0].upper() if sql.strip() else "EMPTY"
+    return f"{match.group(1).split()[0].upper()} {match.group(2)}"
+
+
+def redact(params):
+    """Describe parameters by type and size only, so slow-query logs never carry user data"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: redact(value) for key, value in params.items()}
+    if isinstance(params, tuple):
+        return tuple(redact(value) for value in params)
+    if isinstance(params, (str, bytes, list)):
+        return f"<{type(params).__name__} len={len(params)}>"
+    return f"<{type(params).__name__}>"
+
+
+def observe_query(sql, params, elapsed):
+    """Record a statement's latency and log it when slow; shared by the sync and async cursors"""
+    text = sql.decode() if isinstance(sql, bytes) else str(sql)
+    label = statement_label(text)
+    db_query_duration.observe(elapsed, label)
+    if elapsed >= SLOW_QUERY_SECONDS:
+        db_slow_queries.inc(label)
+        util.log_warning(
+            "Slow query (%.0f ms): %s", elapsed * 1000, ' '.join(text.split()),
+            statement=label, params=redact(params))
+
+
+def record_checkout(opened=None):
+    """Called by the connection pool for every checkout; opened is True for a new connection, None when
+    the pool can't tell"""
+    usage = _request_db.get()
+    if usage is not None:
+        usage["checkouts"] += 1
+        if opened and usage["opened"] is not None:
+            usage["opened"] += 1
+
+
+def begin_request(count_connects=True):
+    """Start counting a request's database usage; returns a token for end_request.
+
+    Without count_connects only checkouts are observed: a pool that opens connections in the
+    background (psycopg_pool) can't attribute them to a request.
+    """
+    return _request_db.set({"checkouts": 0, "opened": 0 if count_connects else None})
+
+
+def observe_request(method, route, status, elapsed):
+    http_request_duration.observe(elapsed, method, route, str(status))
+    usage = _request_db.get()
+    if usage is not None:
+        db_checkouts_per_request.observe(usage["checkouts"], route)
+        if usage["opened"] is not None:
+            db_connects_per_request.observe(usage["opened"], route)
+
+
+def end_request(token):
+    _request_db.reset(token)
+
+
+def init_app(app):
+    """Time every route and count its database connections"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_db_token = begin_request()
+
+    @app.after_request
+    def _observe(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            observe_request(request.method, route, response.status_code, time.perf_counter() - started)
+        return response
+
+    @app.teardown_request
+    def _reset(exc):
+        token = g.pop("metrics_db_token", None)
+        if token is not None:
+            end_request(token)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+
+def gauge_lines(name, help, samples, metric_type="gauge"):
+    """Exposition lines for values computed elsewhere; samples is a list of (labels dict, value)"""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        if value is None:
+            continue
+        lines.append(f"{name}{_labels(labels.keys(), labels.values())} {value}")
+    return lines
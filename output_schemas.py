@@ -0,0 +1,249 @@
+"""JSON schemas of the model's structured output, built and compiled once at import.
+
+The *_TEXT dicts are the `text` parameter of a Responses API call; they never change, so the same
+objects are passed to every call (and hash to the same response-cache keys as before). Each schema
+is also compiled into a validator: a tree of small checks, one per schema node, so validating an
+outline is a walk over the parsed value rather than an interpretation of the schema. A mismatch
+raises OutputError naming the first offending value by its path, e.g.
+
+    $.topics[2].hands_on_practice[0]: missing required property 'description'
+
+which is specific enough to log, and to decide that the output is worth asking for again.
+"""
+import jsoncodec
+
+
+class OutputError(ValueError):
+    """Model output that is not valid JSON or doesn't match its schema"""
+
+    def __init__(self, path, message):
+        super().__init__(f"{path}: {message}")
+        self.path = path
+        self.message = message
+
+
+class _Mismatch(Exception):
+    # Raised by the compiled checks; each enclosing array or object adds its step to the path on the
+    # way out, so no path is built while the value is valid
+    def __init__(self, message):
+        self.message = message
+        self.steps = []
+
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+}
+
+
+def _describe(value):
+    if value is None:
+        return "null"
+    for name, types in _TYPES.items():
+        if isinstance(value, types) and not (isinstance(value, bool) and name != "boolean"):
+            return name
+    return type(value).__name__
+
+
+def _compile(schema):
+    """A function checking a parsed value against schema, raising _Mismatch"""
+    if "enum" in schema:
+        allowed = schema["enum"]
+        allowed_set = frozenset(allowed)
+
+        def check_enum(value):
+            if not isinstance(value, (str, int, float, bool)) or value not in allowed_set:
+                raise _Mismatch(f"expected one of {allowed}, got {value!r}")
+        return check_enum
+
+    kind = schema.get("type")
+    if kind == "object":
+        return _compile_object(schema)
+    if kind == "array":
+        return _compile_array(schema)
+    if kind in _TYPES:
+        types = _TYPES[kind]
+        # bool is an int subclass, but true is not a number in JSON
+        exclude_bool = kind != "boolean"
+
+        def check_type(value):
+            if not isinstance(value, types) or (exclude_bool and isinstance(value, bool)):
+                raise _Mismatch(f"expected {kind}, got {_describe(value)}")
+        return check_type
+    return lambda value: None
+
+
+def _compile_object(schema):
+    properties = [(name, _compile(subschema)) for name, subschema in schema.get("properties", {}).items()]
+    required = tuple(schema.get("required", ()))
+    known = frozenset(schema.get("properties", {}))
+    closed = schema.get("additionalProperties") is False
+
+    def check_object(value):
+        if not isinstance(value, dict):
+            raise _Mismatch(f"expected object, got {_describe(value)}")
+        for name in required:
+            if name not in value:
+                raise _Mismatch(f"missing required property '{name}'")
+        if closed and not known.issuperset(value):
+            unexpected = sorted(name for name in value if name not in known)
+            raise _Mismatch(f"unexpected property '{unexpected[0]}'")
+        for name, check in properties:
+            if name in value:
+                try:
+                    check(value[name])
+                except _Mismatch as e:
+                    e.steps.append(f".{name}")
+                    raise
+    return check_object
+
+
+def _compile_array(schema):
+    check_item = _compile(schema.get("items", {}))
+
+    def check_array(value):
+        if not isinstance(value, list):
+            raise _Mismatch(f"expected array, got {_describe(value)}")
+        for index, item in enumerate(value):
+            try:
+                check_item(item)
+            except _Mismatch as e:
+                e.steps.append(f"[{index}]")
+                raise
+    return check_array
+
+
+class Validator:
+    """A schema compiled for validating parsed model output"""
+
+    def __init__(self, name, schema):
+        self.name = name
+        self.schema = schema
+        self._check = _compile(schema)
+
+    def validate(self, value):
+        """value, or OutputError at the first part of it that doesn't match the schema"""
+        try:
+            self._check(value)
+        except _Mismatch as e:
+            raise OutputError("$" + "".join(reversed(e.steps)), e.message) from None
+        return value
+
+    def parse(self, output_text):
+        """Model output text parsed and validated"""
+        try:
+            value = jsoncodec.loads(output_text)
+        except ValueError as e:
+            raise OutputError("$", f"invalid JSON ({e})") from None
+        return self.validate(value)
+
+
+def _text_format(name, schema, **format_options):
+    return {"format": {"type": "json_schema", "name": name, "schema": schema, **format_options}}
+
+
+_STRING = {"type": "string"}
+_STRINGS = {"type": "array", "items": _STRING}
+
+OUTLINE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "overview": _STRING,
+        "topics": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "topic_name": _STRING,
+                    "subtopics": _STRINGS,
+                    "learning_objectives": _STRINGS,
+                    "hands_on_practice": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "activity_title": _STRING,
+                                "description": _STRING,
+                            },
+                            "required": ["activity_title", "description"],
+                            "additionalProperties": False,
+                        },
+                    },
+                },
+                "required": ["topic_name", "subtopics", "learning_objectives", "hands_on_practice"],
+                "additionalProperties": False,
+            },
+        },
+        "additional_resources": _STRINGS,
+    },
+    "required": ["overview", "topics", "additional_resources"],
+    "additionalProperties": False,
+    # Kept where it has always been sent, inside the schema, so cached outlines keep their keys
+    "strict": True,
+}
+
+BLOCK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "block_type": {"enum": ["image", "text"]},
+        "content": _STRING,
+    },
+    "required": ["block_type", "content"],
+    "additionalProperties": False,
+}
+
+BLOCKS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "topic": _STRING,
+        "subtopic": _STRING,
+        "blocks": {"type": "array", "items": BLOCK_SCHEMA},
+    },
+    "required": ["topic", "subtopic", "blocks"],
+    "additionalProperties": False,
+}
+
+# parse_job and select_skill ask for a JSON object in the prompt rather than by schema, so only the
+# fields the code reads are checked
+SKILLS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "skills": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"skill": _STRING, "category": _STRING, "explanation": _STRING},
+                "required": ["skill"],
+            },
+        },
+    },
+}
+
+COURSE_OUTLINE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": _STRING,
+        "description": _STRING,
+        "topics": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"title": _STRING, "description": _STRING, "sequence_number": {"type": "integer"}},
+                "required": ["title", "description", "sequence_number"],
+            },
+        },
+    },
+    "required": ["title", "description", "topics"],
+}
+
+OUTLINE_TEXT = _text_format("outline_result", OUTLINE_SCHEMA)
+BLOCKS_TEXT = _text_format("blocks_result", BLOCKS_SCHEMA, strict=True)
+
+OUTLINE = Validator("outline_result", OUTLINE_SCHEMA)
+BLOCKS = Validator("blocks_result", BLOCKS_SCHEMA)
+SKILLS = Validator("skills", SKILLS_SCHEMA)
+COURSE_OUTLINE = Validator("course_outline", COURSE_OUTLINE_SCHEMA)
@@ -0,0 +1,161 @@
+import asyncio
+import contextvars
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import util
+
+
+class Prefetcher:
+    """Generate the content of the topics a learner is about to reach, in the background.
+
+    At most `max_concurrency` generations run at once and at most `max_queued` topics wait; beyond
+    that a prefetch is dropped rather than queued, since it is only a guess. A topic already queued
+    or generating is not scheduled again, and a reader arriving meanwhile joins the same generation
+    through the single-flight key of the generate function. Reads of prefetched topics are counted
+    so hit and waste ratios show whether `depth` is right.
+    """
+
+    def __init__(self, depth=1, max_concurrency=2, max_queued=16, max_unread=4096):
+        self.depth = depth
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_queued
+        self.max_unread = max_unread
+        self._pending = set()
+        # Readers that arrived while their topic was still being prefetched
+        self._joined = set()
+        # Prefetched topics nobody has read yet, oldest first
+        self._unread = OrderedDict()
+        # Topics whose content is known to be stored already, so no prefetch is queued to find out
+        self._stored = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._semaphore = None
+        self._tasks = set()
+        self._counts = {"scheduled": 0, "skipped": 0, "dropped": 0, "already_stored": 0,
+                        "generated": 0, "failed": 0, "hits": 0, "hits_in_flight": 0, "wasted": 0}
+
+    def following(self, topic_ids, topic_id):
+        """Up to `depth` topics after topic_id in an outline's topic order"""
+        topic_ids = list(topic_ids or ())
+        if self.depth <= 0 or topic_id not in topic_ids:
+            return []
+        index = topic_ids.index(topic_id)
+        return topic_ids[index + 1:index + 1 + self.depth]
+
+    def _claim(self, topic_ids):
+        claimed = []
+        with self._lock:
+            for topic_id in topic_ids:
+                if topic_id in self._pending or topic_id in self._unread or topic_id in self._stored:
+                    self._counts["skipped"] += 1
+                elif len(self._pending) >= self.max_queued:
+                    self._counts["dropped"] += 1
+                else:
+                    self._pending.add(topic_id)
+                    self._counts["scheduled"] += 1
+                    claimed.append(topic_id)
+        return claimed
+
+    def _finish(self, topic_id, generated):
+        with self._lock:
+            self._pending.discard(topic_id)
+            joined = topic_id in self._joined
+            self._joined.discard(topic_id)
+            if not generated:
+                self._counts["already_stored"] += 1
+                self._remember_stored(topic_id)
+                return
+            self._counts["generated"] += 1
+            if joined:
+                self._counts["hits_in_flight"] += 1
+                return
+            self._unread[topic_id] = True
+            while len(self._unread) > self.max_unread:
+                self._unread.popitem(last=False)
+                self._counts["wasted"] += 1
+
+    def _remember_stored(self, topic_id):
+        self._stored[topic_id] = True
+        self._stored.move_to_end(topic_id)
+        while len(self._stored) > self.max_unread:
+            self._stored.popitem(last=False)
+
+    def _failed(self, topic_id, e):
+        util.log_warning("Prefetching content of topic %s failed: %s", topic_id, e)
+        with self._lock:
+            self._pending.discard(topic_id)
+            self._joined.discard(topic_id)
+            self._counts["failed"] += 1
+
+    def _run(self, topic_id, generate):
+        try:
+            generated = generate(topic_id)
+        except Exception as e:
+            self._failed(topic_id, e)
+        else:
+            self._finish(topic_id, generated)
+
+    def schedule(self, topic_ids, generate):
+        """Run generate(topic_id) for each topic on the prefetch threads; it returns False when
+        the content was already stored"""
+        for topic_id in self._claim(topic_ids):
+            if self._executor is None:
+                with self._lock:
+                    if self._executor is None:
+                        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="prefetch")
+            self._executor.submit(self._run, topic_id, generate)
+
+    async def _arun(self, topic_id, agenerate):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            try:
+                generated = await agenerate(topic_id)
+            except Exception as e:
+                self._failed(topic_id, e)
+            else:
+                self._finish(topic_id, generated)
+
+    def aschedule(self, topic_ids, agenerate):
+        """schedule() for coroutines, as tasks on the running event loop"""
+        loop = asyncio.get_running_loop()
+        for topic_id in self._claim(topic_ids):
+            # A fresh context, so the request's deadline and latency budget don't apply to the prefetch
+            task = contextvars.Context().run(loop.create_task, self._arun(topic_id, agenerate))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def record_read(self, topic_id):
+        """Count a learner reaching a topic's content"""
+        with self._lock:
+            if self._unread.pop(topic_id, None):
+                self._counts["hits"] += 1
+            elif topic_id in self._pending:
+                self._joined.add(topic_id)
+                return
+            self._remember_stored(topic_id)
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+            unread = len(self._unread)
+        generated = counts["generated"]
+        read = counts["hits"] + counts["hits_in_flight"]
+        return {
+            "depth": self.depth,
+            "max_concurrency": self.max_concurrency,
+            **counts,
+            "unread": unread,
+            # Share of generated prefetches a learner went on to read, and of those nobody has read (yet)
+            "hit_ratio": read / generated if generated else None,
+            "waste_ratio": (generated - read) / generated if generated else None,
+        }
+
+
+prefetcher = Prefetcher(
+    depth=int(os.getenv('PREFETCH_DEPTH', '1')),
+    max_concurrency=int(os.getenv('PREFETCH_CONCURRENCY', '2')),
+    max_queued=int(os.getenv('PREFETCH_MAX_QUEUED', '16')),
+)
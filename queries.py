@@ -0,0 +1,121 @@
+"""SQL shared by the sync (app.py) and async (asgi.py) routes; %s-style parameters work with both drivers"""
+
+# Skill name and its stored outline, if any, with topics in order: (name, outline id, title, description, topics json)
+OUTLINE_FOR_SKILL = """
+SELECT s.name, co.id, co.title, co.description,
+       COALESCE((
+           SELECT json_agg(json_build_object(
+                      'id', ct.id,
+                      'title', ct.title,
+                      'description', ct.description,
+                      'sequence_number', ct.sequence_number
+                  ) ORDER BY ct.sequence_number)
+           FROM course_topics ct
+           WHERE ct.course_outline_id = co.id
+       ), '[]'::json)
+FROM skills s
+LEFT JOIN LATERAL (
+    SELECT id, title, description FROM course_outlines
+    WHERE skill_id = s.id ORDER BY id LIMIT 1
+) co ON true
+WHERE s.id = %s
+"""
+
+INSERT_OUTLINE = "INSERT INTO course_outlines (skill_id, title, description) VALUES (%s, %s, %s) RETURNING id"
+
+INSERT_TOPIC = "INSERT INTO course_topics (course_outline_id, title, description, sequence_number) VALUES (%s, %s, %s, %s) RETURNING id"
+
+# Latest revision of a topic's content: (id, content)
+TOPIC_CONTENT = "SELECT id, content FROM topic_content WHERE topic_id = %s ORDER BY id DESC LIMIT 1"
+
+# Title, description and skill name of a topic, for generating its content
+TOPIC_DETAILS = """
+SELECT ct.title, ct.description, s.name
+FROM course_topics ct
+JOIN course_outlines co ON ct.course_outline_id = co.id
+JOIN skills s ON co.skill_id = s.id
+WHERE ct.id = %s
+"""
+
+# Serializes generation across workers until the current transaction ends: (singleflight namespace, key)
+ADVISORY_XACT_LOCK = "SELECT pg_advisory_xact_lock(%s, %s)"
+
+INSERT_TOPIC_CONTENT = "INSERT INTO topic_content (topic_id, content) VALUES (%s, %s) RETURNING id"
+
+# Skill of each assessed topic
+TOPIC_SKILLS = """
+SELECT ct.id, co.skill_id
+FROM course_topics ct
+JOIN course_outlines co ON co.id = ct.course_outline_id
+WHERE ct.id = ANY(%s)
+"""
+
+# One rating per skill; params: user id, skill ids, proficiency levels
+UPSERT_ASSESSMENTS = """
+INSERT INTO user_skill_assessments (user_id, skill_id, proficiency_level)
+SELECT %s, skill_id, proficiency_level
+FROM unnest(%s::int[], %s::int[]) AS a(skill_id, proficiency_level)
+ON CONFLICT (user_id, skill_id)
+DO UPDATE SET proficiency_level = EXCLUDED.proficiency_level, created_at = CURRENT_TIMESTAMP
+"""
+
+CURRENT_TOPIC = "SELECT current_topic_id FROM user_course_progress WHERE user_id = %s AND course_outline_id = %s"
+
+# Ordered topic ids of an outline
+TOPIC_ORDER = "SELECT COALESCE(array_agg(id ORDER BY sequence_number), '{}') FROM course_topics WHERE course_outline_id = %s"
+
+FIRST_TOPIC = "SELECT id FROM course_topics WHERE course_outline_id = %s ORDER BY sequence_number ASC LIMIT 1"
+
+# Start (or restart) a course at its first topic
+START_COURSE = """
+INSERT INTO user_course_progress (user_id, course_outline_id, current_topic_id, completion_percentage)
+VALUES (%s, %s, %s, 0)
+ON CONFLICT (user_id, course_outline_id)
+DO UPDATE SET current_topic_id = %s, last_accessed = CURRENT_TIMESTAMP
+"""
+
+# Progress for a topic whose outline order is known in-process
+SAVE_PROGRESS = """
+INSERT INTO user_course_progress (user_id, course_outline_id, current_topic_id, completion_percentage)
+VALUES (%s, %s, %s, %s)
+ON CONFLICT (user_id, course_outline_id)
+DO UPDATE SET current_topic_id = EXCLUDED.current_topic_id,
+              completion_percentage = EXCLUDED.completion_percentage,
+              last_accessed = CURRENT_TIMESTAMP
+"""
+
+# Resolve the outline, its topic order, the next topic and the percentage, and upsert progress, in a single round trip
+# topic_id is cast: array_position() is polymorphic, so an untyped parameter (server-side binding) has no type to resolve
+ADVANCE_TOPIC = """
+WITH topic AS (
+    SELECT course_outline_id FROM course_topics WHERE id = %(topic_id)s::int
+),
+ordered AS (
+    SELECT t.course_outline_id,
+           array_agg(ct.id ORDER BY ct.sequence_number) AS topic_ids
+    FROM topic t
+    JOIN course_topics ct ON ct.course_outline_id = t.course_outline_id
+    GROUP BY t.course_outline_id
+),
+positioned AS (
+    SELECT course_outline_id, topic_ids,
+           array_position(topic_ids, %(topic_id)s::int) AS position,
+           cardinality(topic_ids) AS total
+    FROM ordered
+),
+progress AS (
+    SELECT course_outline_id, topic_ids,
+           CASE WHEN position < total THEN topic_ids[position + 1] END AS next_topic_id,
+           CASE WHEN position < total THEN position::float / total * 100 ELSE 100 END AS completion_percentage
+    FROM positioned
+),
+upserted AS (
+    INSERT INTO user_course_progress (user_id, course_outline_id, current_topic_id, completion_percentage)
+    SELECT %(user_id)s, course_outline_id, next_topic_id, completion_percentage FROM progress
+    ON CONFLICT (user_id, course_outline_id)
+    DO UPDATE SET current_topic_id = EXCLUDED.current_topic_id,
+                  completion_percentage = EXCLUDED.completion_percentage,
+                  last_accessed = CURRENT_TIMESTAMP
+)
+SELECT course_outline_id, topic_ids, next_topic_id, completion_percentage FROM progress
+"""
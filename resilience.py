@@ -0,0 +1,348 @@
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+import util
+from telemetry import llm_calls
+
+DEFAULT_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '120'))
+MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+# Call sites that may send a duplicate request when the first is slower than their recent p95; "*" for all
+HEDGED_CALL_SITES = set(filter(None, os.getenv('LLM_HEDGE_CALL_SITES', '').split(',')))
+HEDGE_MIN_SAMPLES = 20
+
+# Absolute time.monotonic() by which the current request must be answered
+_deadline = ContextVar("deadline", default=None)
+# True while the caller retries rate limits itself (bulkgen paces them against a shared budget)
+_caller_retries_rate_limits = ContextVar("caller_retries_rate_limits", default=False)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def set_deadline(seconds):
+    """Give the current context `seconds` to finish; returns a token for reset_deadline. Never extends an earlier deadline"""
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    return _deadline.set(deadline if current is None else min(current, deadline))
+
+
+def reset_deadline(token):
+    _deadline.reset(token)
+
+
+@contextmanager
+def deadline(seconds):
+    token = set_deadline(seconds)
+    try:
+        yield
+    finally:
+        reset_deadline(token)
+
+
+def remaining():
+    """Seconds left before the current deadline, or None without one"""
+    current = _deadline.get()
+    return None if current is None else current - time.monotonic()
+
+
+@contextmanager
+def caller_retries_rate_limits():
+    """Raise 429s to the caller instead of retrying them, so they are retried by one layer only"""
+    token = _caller_retries_rate_limits.set(True)
+    try:
+        yield
+    finally:
+        _caller_retries_rate_limits.reset(token)
+
+
+def _timeout():
+    left = remaining()
+    if left is None:
+        return DEFAULT_TIMEOUT
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded before the model call")
+    return min(left, DEFAULT_TIMEOUT)
+
+
+def _retryable(error):
+    # openai is imported by the first model call anyway; importing it here keeps it out of startup
+    import openai
+    return isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError,
+                              openai.InternalServerError))
+
+
+def _retried_here(error):
+    import openai
+    return _retryable(error) and not (isinstance(error, openai.RateLimitError) and _caller_retries_rate_limits.get())
+
+
+def _unhealthy(error):
+    import openai
+    # Rate limits mean we are sending too much, not that the upstream is down
+    return _retryable(error) and not isinstance(error, openai.RateLimitError)
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after")) if response is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """Closed -> open after `failures` consecutive upstream failures; half-open after `reset_after` seconds,
+    when one trial call decides between closed and open again"""
+
+    def __init__(self, failures=5, reset_after=30.0):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+        self.counts = defaultdict(int)
+
+    def available(self):
+        """True unless open; does not claim the half-open trial"""
+        with self._lock:
+            return self.state != "open" or time.monotonic() - self._opened_at >= self.reset_after
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_after:
+                    self.counts["rejected"] += 1
+                    raise CircuitOpenError("Model API circuit is open")
+                self.state = "half_open"
+                self._trial = False
+            if self.state == "half_open":
+                if self._trial:
+                    self.counts["rejected"] += 1
+                    raise CircuitOpenError("Model API circuit is half-open; trial call in flight")
+                self._trial = True
+
+    def success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._trial = False
+            if self.state != "closed":
+                util.log_info("Model API circuit closed")
+            self.state = "closed"
+
+    def failure(self, unhealthy):
+        with self._lock:
+            self._trial = False
+            if not unhealthy:
+                # The upstream answered; a bad request says nothing about its health
+                if self.state == "half_open":
+                    self.state = "closed"
+                return
+            self._consecutive += 1
+            if self.state == "half_open" or self._consecutive >= self.failures:
+                if self.state != "open":
+                    self.counts["opened"] += 1
+                    util.log_warning("Model API circuit opened after %d failures", self._consecutive)
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def cancelled(self):
+        """The call was abandoned before an answer; a half-open breaker may try again"""
+        with self._lock:
+            self._trial = False
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self._consecutive, **self.counts}
+
+
+class Resilience:
+    """Deadline-bounded timeouts, jittered retries, hedging and a circuit breaker per model for upstream calls"""
+
+    def __init__(self, max_retries=MAX_RETRIES, hedged_call_sites=HEDGED_CALL_SITES,
+                 breaker_failures=5, breaker_reset=30.0):
+        self.max_retries = max_retries
+        self.hedged_call_sites = hedged_call_sites
+        self._breaker_args = (breaker_failures, breaker_reset)
+        self._breakers = {}
+        self._executor = ThreadPoolExecutor(max_workers=int(os.getenv('LLM_HEDGE_THREADS', '16')), thread_name_prefix="llm-hedge")
+        self._counts = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def breaker(self, model):
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = self._breakers[model] = CircuitBreaker(*self._breaker_args)
+            return breaker
+
+    def available(self, model):
+        with self._lock:
+            breaker = self._breakers.get(model)
+        return breaker is None or breaker.available()
+
+    def _count(self, call_site, name):
+        with self._lock:
+            self._counts[call_site][name] += 1
+
+    def _attempt(self, model, fn):
+        breaker = self.breaker(model)
+        breaker.before_call()
+        try:
+            result = fn(_timeout())
+        except Exception as e:
+            breaker.failure(_unhealthy(e))
+            raise
+        breaker.success()
+        return result
+
+    def _hedge_delay(self, call_site):
+        if "*" not in self.hedged_call_sites and call_site not in self.hedged_call_sites:
+            return None
+        return llm_calls.latency(call_site, 95, min_samples=HEDGE_MIN_SAMPLES)
+
+    def _hedged(self, call_site, model, fn, delay):
+        """Run fn; if it has not finished after `delay`, race a duplicate and take the first success"""
+        primary = self._executor.submit(contextvars.copy_context().run, self._attempt, model, fn)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        left = remaining()
+        if left is not None and left <= 0:
+            return primary.result()
+        self._count(call_site, "hedges")
+        hedge = self._executor.submit(contextvars.copy_context().run, self._attempt, model, fn)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                # The loser keeps running to completion; its answer is discarded
+                self._count(call_site, "hedge_wins" if future is hedge else "primary_wins")
+                return result
+        raise error
+
+    def call(self, call_site, model, fn, idempotent=True, hedge=True):
+        """fn(timeout) with retries for idempotent calls, optional hedging and the model's circuit breaker"""
+        attempts = self.max_retries + 1 if idempotent else 1
+        for attempt in range(attempts):
+            try:
+                delay = self._hedge_delay(call_site) if hedge and idempotent else None
+                if delay is not None:
+                    return self._hedged(call_site, model, fn, delay)
+                return self._attempt(model, fn)
+            except (DeadlineExceeded, CircuitOpenError):
+                self._count(call_site, "failed_fast")
+                raise
+            except Exception as e:
+                time.sleep(self._backoff(call_site, e, attempt, attempts))
+
+    async def _aattempt(self, model, fn):
+        breaker = self.breaker(model)
+        breaker.before_call()
+        try:
+            result = await fn(_timeout())
+        except asyncio.CancelledError:
+            # A hedge that lost the race (or a client that went away) says nothing about the upstream's health
+            breaker.cancelled()
+            raise
+        except Exception as e:
+            breaker.failure(_unhealthy(e))
+            raise
+        breaker.success()
+        return result
+
+    async def _ahedged(self, call_site, model, fn, delay):
+        """_hedged() on the event loop; the losing request is cancelled rather than left running"""
+        primary = asyncio.ensure_future(self._aattempt(model, fn))
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        left = remaining()
+        if done or (left is not None and left <= 0):
+            return await primary
+        self._count(call_site, "hedges")
+        hedge = asyncio.ensure_future(self._aattempt(model, fn))
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is not None:
+                        error = future.exception()
+                        continue
+                    self._count(call_site, "hedge_wins" if future is hedge else "primary_wins")
+                    return future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+        raise error
+
+    async def acall(self, call_site, model, fn, idempotent=True, hedge=True):
+        """call() for the async app: fn(timeout) returns an awaitable and backoff sleeps do not block the loop"""
+        attempts = self.max_retries + 1 if idempotent else 1
+        for attempt in range(attempts):
+            try:
+                delay = self._hedge_delay(call_site) if hedge and idempotent else None
+                if delay is not None:
+                    return await self._ahedged(call_site, model, fn, delay)
+                return await self._aattempt(model, fn)
+            except (DeadlineExceeded, CircuitOpenError):
+                self._count(call_site, "failed_fast")
+                raise
+            except Exception as e:
+                backoff = self._backoff(call_site, e, attempt, attempts)
+                await asyncio.sleep(backoff)
+
+    def _backoff(self, call_site, error, attempt, attempts):
+        """Seconds to wait before retrying after `error`; re-raises it (or DeadlineExceeded) when there is no retry"""
+        left = remaining()
+        if _retryable(error) and left is not None and left <= 0:
+            raise DeadlineExceeded("Request deadline exceeded waiting for the model") from error
+        if not _retried_here(error) or attempt == attempts - 1:
+            raise error
+        # Full jitter, but never sleep past the deadline
+        backoff = _retry_after(error) or random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+        if left is not None and backoff >= left:
+            raise DeadlineExceeded("Request deadline leaves no time to retry the model call") from error
+        self._count(call_site, "retries")
+        util.log_warning("Retrying %s in %.1fs after %s", call_site, backoff, type(error).__name__)
+        return backoff
+
+    def stats(self):
+        with self._lock:
+            counts = {site: dict(values) for site, values in self._counts.items()}
+            breakers = dict(self._breakers)
+        for values in counts.values():
+            hedges = values.get("hedges", 0)
+            values["hedge_win_rate"] = values.get("hedge_wins", 0) / hedges if hedges else None
+        return {
+            "circuit_breakers": {model: breaker.stats() for model, breaker in breakers.items()},
+            "call_sites": counts,
+            "hedged_call_sites": sorted(self.hedged_call_sites),
+        }
+
+
+upstream = Resilience(
+    breaker_failures=int(os.getenv('LLM_BREAKER_FAILURES', '5')),
+    breaker_reset=float(os.getenv('LLM_BREAKER_RESET', '30')),
+)
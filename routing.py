@@ -0,0 +1,156 @@
+import json
+import os
+import random
+import threading
+from collections import defaultdict, deque, namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+import resilience
+import util
+from telemetry import percentile
+
+# A model and reasoning effort (None for models without reasoning)
+Option = namedtuple("Option", ["model", "effort"])
+# The option a call will use, why it was chosen, and the better options whose cached answers may be served instead
+Route = namedtuple("Route", ["model", "effort", "reason", "preferred"])
+
+
+class Policy:
+    """Options for a call site from best to fastest, and the latency budget (seconds) a call should fit in"""
+
+    def __init__(self, options, budget=None):
+        self.options = [Option(*option) for option in options]
+        self.budget = budget
+
+    def to_dict(self):
+        return {"options": [list(option) for option in self.options], "budget": self.budget}
+
+
+# Defaults per call site; LLM_ROUTES (JSON, same shape as Policy.to_dict()) overrides them
+POLICIES = {
+    "parse_job": Policy([("o3-mini", None), ("o3-mini", "low"), ("gpt-4o-mini", None)], budget=30),
+    "generate_outline": Policy([("o3-mini", "medium"), ("o3-mini", "low"), ("gpt-4o-mini", None)], budget=60),
+    "generate_learning_block": Policy(
+        [("o3-mini-2025-01-31", "high"), ("o3-mini-2025-01-31", "medium"), ("o3-mini-2025-01-31", "low")], budget=120),
+    "stream_learning_block": Policy(
+        [("o3-mini-2025-01-31", "high"), ("o3-mini-2025-01-31", "medium"), ("o3-mini-2025-01-31", "low")], budget=120),
+    "select_skill": Policy([("gpt-3.5-turbo", None), ("gpt-4o-mini", None)], budget=20),
+    "begin_course": Policy([("gpt-3.5-turbo", None), ("gpt-4o-mini", None)], budget=30),
+}
+
+# Seconds the current request can wait for a model answer; None means the policy budget applies
+_request_budget = ContextVar("request_budget", default=None)
+
+
+def set_request_budget(seconds):
+    """Tighten the latency budget of every model call in the current context; returns a token for reset_request_budget"""
+    return _request_budget.set(seconds)
+
+
+def reset_request_budget(token):
+    _request_budget.reset(token)
+
+
+@contextmanager
+def latency_budget(seconds):
+    token = set_request_budget(seconds)
+    try:
+        yield
+    finally:
+        reset_request_budget(token)
+
+
+def _load_policies():
+    policies = dict(POLICIES)
+    overrides = os.getenv('LLM_ROUTES')
+    if overrides:
+        for call_site, policy in json.loads(overrides).items():
+            policies[call_site] = Policy(policy["options"], policy.get("budget"))
+    return policies
+
+
+class Router:
+    """Picks the best option for a call site whose recent p95 latency fits the latency budget.
+
+    Options without enough history are assumed to fit. A small share of calls still goes to a
+    better option that was skipped, so a model that has recovered is noticed again.
+    """
+
+    def __init__(self, policies, window=50, min_samples=5, probe_rate=0.05):
+        self.policies = policies
+        self.window = window
+        self.min_samples = min_samples
+        self.probe_rate = probe_rate
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+        self._decisions = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def budget(self, call_site):
+        policy = self.policies.get(call_site)
+        budgets = [b for b in (policy.budget if policy else None, _request_budget.get(), resilience.remaining())
+                   if b is not None]
+        return min(budgets) if budgets else None
+
+    def estimate(self, call_site, option):
+        """Recent p95 latency of an option, or None while there are too few samples"""
+        with self._lock:
+            values = sorted(self._latencies[(call_site, option)])
+        return percentile(values, 95) if len(values) >= self.min_samples else None
+
+    def choose(self, call_site, model=None, effort=None):
+        if model is not None:
+            route = Route(model, effort, "pinned", [])
+        else:
+            policy = self.policies.get(call_site)
+            if policy is None:
+                raise ValueError(f"No routing policy for call site '{call_site}' and no model given")
+            route = self._choose(call_site, policy)
+        with self._lock:
+            self._decisions[(call_site, route.model, route.effort, route.reason)] += 1
+        util.log_verbose("Routing %s to %s (effort %s): %s", call_site, route.model, route.effort, route.reason)
+        return route
+
+    def _choose(self, call_site, policy):
+        budget = self.budget(call_site)
+        # Skip models whose circuit is open while another one is available
+        options = [option for option in policy.options if resilience.upstream.available(option.model)] or policy.options
+        skipped = "circuit_open" if options[0] != policy.options[0] else None
+        if budget is None:
+            return Route(*options[0], skipped or "primary", [])
+        for index, option in enumerate(options):
+            estimate = self.estimate(call_site, option)
+            if estimate is None or estimate <= budget:
+                if index and random.random() < self.probe_rate:
+                    return Route(*options[index - 1], "probe", options[:index - 1])
+                return Route(*option, "over_budget" if index else skipped or "primary", options[:index])
+        # Nothing fits; the fastest option comes closest
+        return Route(*options[-1], "fastest", options[:-1])
+
+    def observe(self, call_site, route, duration):
+        """Record the latency of a completed upstream call"""
+        with self._lock:
+            self._latencies[(call_site, Option(route.model, route.effort))].append(duration)
+
+    def stats(self):
+        with self._lock:
+            decisions = dict(self._decisions)
+            latencies = {key: sorted(values) for key, values in self._latencies.items()}
+        report = {}
+        for (call_site, model, effort, reason), count in sorted(decisions.items(), key=lambda item: str(item[0])):
+            site = report.setdefault(call_site, {"decisions": [], "options": []})
+            site["decisions"].append({"model": model, "effort": effort, "reason": reason, "count": count})
+        for (call_site, option), values in latencies.items():
+            site = report.setdefault(call_site, {"decisions": [], "options": []})
+            site["options"].append({"model": option.model, "effort": option.effort, "samples": len(values),
+                                    "p50": percentile(values, 50), "p95": percentile(values, 95)})
+        for call_site, site in report.items():
+            policy = self.policies.get(call_site)
+            site["budget"] = policy.budget if policy else None
+        return report
+
+    def decision_counts(self):
+        with self._lock:
+            return dict(self._decisions)
+
+
+router = Router(_load_policies())
@@ -0,0 +1,90 @@
+from apiflask import Schema
+from apiflask.fields import String, Integer, List, Nested, Float
+from apiflask.validators import Length, Range
+from marshmallow import ValidationError
+import content_blocks
+
+# Request and response schemas, shared by the sync (app.py) and async (asgi.py) apps
+
+class JobPostingSchema(Schema):
+    url = String(required=True, validate=Length(min=1))
+
+class SkillSchema(Schema):
+    id = Integer()
+    name = String()
+
+class SkillListSchema(Schema):
+    skills = List(Nested(SkillSchema))
+
+class SkillSelectionSchema(Schema):
+    skill_id = Integer(required=True)
+
+class CourseTopicSchema(Schema):
+    id = Integer()
+    title = String()
+    description = String()
+    sequence_number = Integer()
+
+class CourseOutlineSchema(Schema):
+    id = Integer()
+    skill_id = Integer()
+    title = String()
+    description = String()
+    topics = List(Nested(CourseTopicSchema))
+
+class SkillAssessmentSchema(Schema):
+    topic_id = Integer(required=True)
+    proficiency_level = Integer(required=True, validate=Range(min=1, max=5))
+
+class SkillAssessmentListSchema(Schema):
+    assessments = List(Nested(SkillAssessmentSchema))
+
+class CourseProgressSchema(Schema):
+    course_outline_id = Integer(required=True)
+    # Return the first page_size content blocks instead of the whole content
+    page_size = Integer(validate=Range(min=1, max=100))
+
+class TopicProgressSchema(Schema):
+    topic_id = Integer(required=True)
+
+class ProgressReportSchema(Schema):
+    course_outline_id = Integer()
+    completion_percentage = Float()
+    current_topic_id = Integer()
+    next_topic_id = Integer()
+
+class ContentBlockSchema(Schema):
+    id = String()
+    position = Integer()
+    block_type = String()
+    content = String()
+
+class TopicContentSchema(Schema):
+    topic_id = Integer()
+    content = String()
+    revision = Integer()
+    blocks = List(Nested(ContentBlockSchema))
+    next_cursor = String(allow_none=True)
+
+class ContentBlockPageSchema(Schema):
+    topic_id = Integer()
+    revision = Integer()
+    blocks = List(Nested(ContentBlockSchema))
+    next_cursor = String(allow_none=True)
+
+def _valid_cursor(value):
+    try:
+        content_blocks.decode_cursor(value)
+    except ValueError:
+        raise ValidationError("Not a next_cursor returned by this endpoint.")
+
+class ContentBlockQuerySchema(Schema):
+    limit = Integer(load_default=10, validate=Range(min=1, max=100))
+    cursor = String(load_default=None, validate=_valid_cursor)
+
+class JobQuerySchema(Schema):
+    wait = Integer(load_default=0, validate=Range(min=0, max=25))
+
+class LearningBlockQuerySchema(Schema):
+    topic = String(required=True, validate=Length(min=1))
+    subtopic = String(required=True, validate=Length(min=1))
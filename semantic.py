@@ -0,0 +1,72 @@
+import os
+import threading
+import cache
+
+# Namespaces of the reuse index
+OUTLINES = "outlines"
+BLOCKS = "learning_blocks"
+SKILLS = "skills"
+
+
+_reuse = None
+_reuse_lock = threading.Lock()
+
+
+def _build_reuse():
+    # Off unless asked for: a wrong match serves another topic's content
+    backend = os.getenv('SEMANTIC_INDEX', 'off')
+    if backend == 'off':
+        return None
+    from semantic_index import HashingEmbedder, LocalIndex, OpenAIEmbedder, PineconeIndex, SemanticReuse
+    # The hashing embedder compares spelling, not meaning, so it has to be chosen explicitly
+    if os.getenv('SEMANTIC_EMBEDDER', 'openai') == 'hashing':
+        embedder = HashingEmbedder()
+    else:
+        embedder = OpenAIEmbedder(os.getenv('SEMANTIC_EMBEDDING_MODEL', 'text-embedding-3-small'))
+    if backend == 'pinecone':
+        index = PineconeIndex(os.getenv('PINECONE_INDEX', 'chefed'))
+    else:
+        index = LocalIndex(os.getenv('SEMANTIC_INDEX_PATH') or cache.default_cache_path('chefed_semantic_index.npz'), embedder.dim,
+                           save_delay=float(os.getenv('SEMANTIC_SAVE_SECONDS', '5')))
+    return SemanticReuse(embedder, index, threshold=float(os.getenv('SEMANTIC_THRESHOLD', '0.95')))
+
+
+def get_reuse():
+    """The configured SemanticReuse, or None when SEMANTIC_INDEX is unset or off"""
+    global _reuse
+    if _reuse is None:
+        with _reuse_lock:
+            if _reuse is None:
+                _reuse = _build_reuse() or False
+    return _reuse or None
+
+
+def lookup_many(namespace, texts):
+    reuse = get_reuse()
+    return reuse.find(namespace, texts) if reuse else [None] * len(texts)
+
+
+def lookup(namespace, text):
+    return lookup_many(namespace, [text])[0]
+
+
+def store(namespace, text, **metadata):
+    reuse = get_reuse()
+    if reuse:
+        reuse.store(namespace, text, **metadata)
+
+
+def reuse_or_generate(namespace, text, generate, bypass=False):
+    """generate()'s output text, or the stored output for a semantically equivalent text"""
+    if not bypass:
+        found = lookup(namespace, text)
+        if found:
+            return found["result"]
+    result = generate()
+    store(namespace, text, result=result)
+    return result
+
+
+def stats():
+    reuse = get_reuse()
+    return reuse.stats() if reuse else {"enabled": False}
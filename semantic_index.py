@@ -0,0 +1,331 @@
+"""Embedders, vector indexes and SemanticReuse behind semantic.py; NumPy is only imported with this module"""
+import atexit
+import hashlib
+import json
+import os
+import threading
+from collections import defaultdict, namedtuple
+import numpy as np
+import cache
+import llm
+import util
+from skills_index import canonical_key, distinguishing_terms, trigrams
+
+Match = namedtuple("Match", ["id", "score", "metadata"])
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class HashingEmbedder:
+    """Deterministic local embedder: hashed word and trigram features of the canonical text.
+
+    Compares spelling, not meaning: "Windows Server 2016" and "Windows Server 2019" score close
+    to 1. Only for tests and benchmarks; reuse in production needs a real embedding model.
+    """
+
+    def __init__(self, dim=256):
+        self.dim = dim
+
+    def _features(self, text):
+        key = canonical_key(text)
+        return key.split() + sorted(trigrams(key))
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big")
+                vectors[row, digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        return _normalize(vectors)
+
+
+class OpenAIEmbedder:
+    """OpenAI embeddings, one request per batch of texts"""
+
+    DIMENSIONS = {"text-embedding-3-small": 1536, "text-embedding-3-large": 3072}
+
+    def __init__(self, model="text-embedding-3-small"):
+        self.model = model
+        self.dim = self.DIMENSIONS.get(model, 1536)
+
+    def embed(self, texts):
+        return _normalize(llm.embed("semantic_reuse", self.model, texts))
+
+
+class _Namespace:
+    def __init__(self, dim):
+        self.ids = []
+        self.rows = {}
+        self.metadata = []
+        # Grown by doubling; only the first len(ids) rows are live
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+
+    def upsert(self, item_id, vector, metadata):
+        row = self.rows.get(item_id)
+        if row is None:
+            row = self.rows[item_id] = len(self.ids)
+            self.ids.append(item_id)
+            self.metadata.append(metadata)
+            if row == len(self.vectors):
+                grown = np.zeros((max(16, 2 * row), self.vectors.shape[1]), dtype=np.float32)
+                grown[:row] = self.vectors
+                self.vectors = grown
+        else:
+            self.metadata[row] = metadata
+        self.vectors[row] = vector
+
+
+class LocalIndex:
+    """Exact cosine-similarity index in NumPy, persisted to a single .npz file.
+
+    Each process keeps the whole index in memory and picks up entries saved by other
+    processes when the file changes. Concurrent saves can drop each other's latest
+    entries, which only costs a regeneration.
+
+    Writing the file costs as much as the whole index, so save() only schedules a write
+    `save_delay` seconds later: the stores in between share it, and the file is written
+    from a snapshot outside the lock that queries take. Pending entries are also written
+    at exit.
+    """
+
+    def __init__(self, path, dim, save_delay=5.0):
+        self.path = path
+        self.dim = dim
+        self.save_delay = save_delay
+        self._namespaces = {}
+        self._lock = threading.Lock()
+        # One write at a time, so an older snapshot never replaces a newer one
+        self._write_lock = threading.Lock()
+        self._mtime = None
+        self._dirty = False
+        self._save_timer = None
+        self._reload()
+        atexit.register(self.flush)
+
+    def _reload(self):
+        """Merge entries from the file on disk if it changed since we last read or wrote it"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with np.load(self.path) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta["dim"] != self.dim:
+                    util.log_warning("Ignoring semantic index %s: dimension %s, expected %s", self.path, meta["dim"], self.dim)
+                    self._mtime = mtime
+                    return
+                for name, entries in meta["namespaces"].items():
+                    vectors = data[f"vectors_{name}"]
+                    namespace = self._namespaces.setdefault(name, _Namespace(self.dim))
+                    for row, (item_id, metadata) in enumerate(entries):
+                        if item_id not in namespace.rows:
+                            namespace.upsert(item_id, vectors[row], metadata)
+        except (OSError, ValueError, KeyError) as e:
+            util.log_warning("Could not read semantic index %s: %s", self.path, e)
+        self._mtime = mtime
+
+    def upsert(self, namespace, items):
+        """Add or replace (id, vector, metadata) items"""
+        with self._lock:
+            target = self._namespaces.setdefault(namespace, _Namespace(self.dim))
+            for item_id, vector, metadata in items:
+                target.upsert(item_id, vector, metadata)
+            self._dirty = True
+
+    def query(self, namespace, vectors, top_k=1):
+        """Best top_k matches for each query vector, as lists of Match ordered by score"""
+        vectors = _normalize(vectors)
+        with self._lock:
+            self._reload()
+            target = self._namespaces.get(namespace)
+            count = len(target.ids) if target else 0
+            if not count:
+                return [[] for _ in range(len(vectors))]
+            scores = vectors @ target.vectors[:count].T
+            k = min(top_k, count)
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            results = []
+            for i, rows in enumerate(top):
+                rows = rows[np.argsort(-scores[i, rows])]
+                results.append([Match(target.ids[row], float(scores[i, row]), target.metadata[row]) for row in rows])
+            return results
+
+    def save(self):
+        """Write upserted entries to disk within save_delay seconds"""
+        if self.save_delay <= 0:
+            self.flush()
+            return
+        with self._lock:
+            if not self._dirty or self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(self.save_delay, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        """Write upserted entries to disk now"""
+        with self._write_lock:
+            with self._lock:
+                if self._save_timer is not None:
+                    self._save_timer.cancel()
+                    self._save_timer = None
+                if not self._dirty:
+                    return
+                self._reload()
+                arrays = {}
+                meta = {"dim": self.dim, "namespaces": {}}
+                for name, namespace in self._namespaces.items():
+                    # Rows are overwritten in place by upserts, so the snapshot takes a copy
+                    arrays[f"vectors_{name}"] = namespace.vectors[:len(namespace.ids)].copy()
+                    meta["namespaces"][name] = list(zip(namespace.ids, namespace.metadata))
+                self._dirty = False
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "wb") as file:
+                    np.savez(file, meta=np.array(json.dumps(meta)), **arrays)
+                os.replace(tmp_path, self.path)
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                util.log_warning("Could not save semantic index %s: %s", self.path, e)
+                with self._lock:
+                    self._dirty = True
+                return
+            with self._lock:
+                self._mtime = mtime
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "local", "path": self.path, "entries": {name: len(ns.ids) for name, ns in self._namespaces.items()}}
+
+
+class PineconeIndex:
+    """LocalIndex's interface on a Pinecone index created with the embedder's dimension and the cosine metric"""
+
+    MAX_METADATA_BYTES = 40000
+
+    def __init__(self, index_name, api_key=None):
+        from pinecone import Pinecone
+        self.index_name = index_name
+        self._index = Pinecone(api_key=api_key or os.getenv('PINECONE_API_KEY')).Index(index_name)
+
+    def upsert(self, namespace, items):
+        vectors = []
+        for item_id, vector, metadata in items:
+            if len(json.dumps(metadata)) > self.MAX_METADATA_BYTES:
+                util.log_warning("Not indexing %s in Pinecone: metadata over %d bytes", item_id, self.MAX_METADATA_BYTES)
+                continue
+            vectors.append({"id": item_id, "values": np.asarray(vector).tolist(), "metadata": metadata})
+        if vectors:
+            self._index.upsert(vectors=vectors, namespace=namespace)
+
+    def query(self, namespace, vectors, top_k=1):
+        # Pinecone takes one query vector per request
+        results = []
+        for vector in _normalize(vectors):
+            response = self._index.query(namespace=namespace, vector=vector.tolist(), top_k=top_k, include_metadata=True)
+            results.append([Match(match.id, match.score, dict(match.metadata or {})) for match in response.matches])
+        return results
+
+    def save(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def stats(self):
+        return {"backend": "pinecone", "index": self.index_name}
+
+
+class SemanticReuse:
+    """Finds previously generated results for texts that mean the same thing as a new request"""
+
+    def __init__(self, embedder, index, threshold=0.95):
+        self.embedder = embedder
+        self.index = index
+        self.threshold = threshold
+        self._embeddings = cache.LRUCache(maxsize=2048)
+        self._counts = defaultdict(lambda: {"lookups": 0, "hits": 0, "refused": 0, "stored": 0, "errors": 0})
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def item_id(text):
+        return hashlib.sha256(canonical_key(text).encode()).hexdigest()[:32]
+
+    def _count(self, namespace, name, amount=1):
+        with self._lock:
+            self._counts[namespace][name] += amount
+
+    def embed(self, texts):
+        """Embed texts in one batch, skipping texts embedded recently"""
+        vectors = [self._embeddings.get(text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            for i, vector in zip(missing, self.embedder.embed([texts[i] for i in missing])):
+                self._embeddings.set(texts[i], vector)
+                vectors[i] = vector
+        return np.stack(vectors) if vectors else np.zeros((0, self.embedder.dim), dtype=np.float32)
+
+    @staticmethod
+    def equivalent(text, stored_text):
+        """False when the texts differ in numbers or negation/direction words, which embeddings blur.
+
+        "Windows Server 2016" and "... 2019", or inbound and outbound cycle counting, embed close
+        together but need different results.
+        """
+        if stored_text is None:
+            return False
+        return distinguishing_terms(canonical_key(text)) == distinguishing_terms(canonical_key(stored_text))
+
+    def find(self, namespace, texts, threshold=None):
+        """Metadata of the closest stored item for each text, or None where nothing is close enough"""
+        threshold = self.threshold if threshold is None else threshold
+        if not texts:
+            return []
+        self._count(namespace, "lookups", len(texts))
+        try:
+            results = self.index.query(namespace, self.embed(texts), top_k=3)
+        except Exception as e:
+            # Reuse is an optimization; generation goes ahead without it
+            self._count(namespace, "errors")
+            util.log_warning("Semantic lookup failed: %s", e)
+            return [None] * len(texts)
+        found = []
+        for text, matches in zip(texts, results):
+            match = None
+            for candidate in matches:
+                if candidate.score < threshold:
+                    break
+                if self.equivalent(text, candidate.metadata.get("text")):
+                    match = candidate
+                    break
+                self._count(namespace, "refused")
+            if match:
+                util.log_verbose("Reusing %s result for '%s' (score %.3f)", namespace, text, match.score, match_text=match.metadata.get("text"))
+            found.append(match.metadata if match else None)
+        self._count(namespace, "hits", sum(1 for metadata in found if metadata is not None))
+        return found
+
+    def store(self, namespace, text, **metadata):
+        try:
+            vector = self.embed([text])[0]
+            self.index.upsert(namespace, [(self.item_id(text), vector, {"text": text, **metadata})])
+            self.index.save()
+        except Exception as e:
+            self._count(namespace, "errors")
+            util.log_warning("Could not index %s result for '%s': %s", namespace, text, e)
+            return
+        self._count(namespace, "stored")
+
+    def stats(self):
+        with self._lock:
+            counts = {name: dict(values) for name, values in self._counts.items()}
+        for values in counts.values():
+            values["hit_rate"] = values["hits"] / values["lookups"] if values["lookups"] else 0.0
+        return {"threshold": self.threshold, "index": self.index.stats(), "namespaces": counts}
@@ -0,0 +1,232 @@
+"""Route logic shared by app.py (Flask, psycopg2) and asgi.py (Starlette, async psycopg).
+
+SQL is written here once as steps (see db.run_steps), so both apps run the same statements in
+the same order; each app only adds its own I/O around them: connections, model calls,
+single-flight and prefetch scheduling.
+"""
+import content_blocks
+import db
+import fetch
+import queries
+import resilience
+import stats
+from singleflight import OUTLINE_LOCK, TOPIC_CONTENT_LOCK
+
+
+class NotFound(Exception):
+    """The skill, topic or course a route asked for does not exist; both apps answer 404"""
+
+
+def error_status(e):
+    """Status for an error caught by a route: 404 for a missing row, 400 for a job posting URL that
+    isn't fetched, 503/504 when the model API is unavailable"""
+    if isinstance(e, NotFound):
+        return 404
+    if isinstance(e, fetch.FetchError):
+        return 400
+    if isinstance(e, resilience.CircuitOpenError):
+        return 503
+    if isinstance(e, resilience.DeadlineExceeded):
+        return 504
+    return 500
+
+
+def load_outline(skill_id):
+    """Steps: (skill name, stored course outline or None); (None, None) for an unknown skill"""
+    row = yield db.fetch_one(queries.OUTLINE_FOR_SKILL, (skill_id,))
+    return db.outline_from_row(skill_id, row)
+
+
+def outline_of(skill_id):
+    """Steps: the skill's stored outline, or None"""
+    _, outline = yield from load_outline(skill_id)
+    return outline
+
+
+def reused_outline(skill_id, other_skill_id, reason):
+    """Steps: another skill's stored outline served as skill_id's, counted under `reason`; None if it has none"""
+    _, outline = yield from load_outline(other_skill_id)
+    if not outline:
+        return None
+    stats.outline_reuse[reason] += 1
+    return db.reuse_outline(skill_id, outline)
+
+
+def stored_outline(skill_id):
+    """Steps: (skill name, outline) from the skill's stored outline or that of the same skill spelled
+    differently; the outline is None when one has to be generated"""
+    skill_name, outline = yield from load_outline(skill_id)
+    if not skill_name:
+        raise NotFound("Skill not found")
+    if outline:
+        return skill_name, outline
+
+    # The same skill spelled differently ("SQL server performance-tuning") may already have one
+    yield from db.load_skill_index()
+    equivalent = db.skill_index.match(skill_name, exclude=skill_id, count=False)
+    if equivalent:
+        outline = yield from reused_outline(skill_id, equivalent[0], "equivalent_skill")
+    return skill_name, outline
+
+
+def store_outline(skill_id, outline_data):
+    """Steps: store a generated outline and its topics unless another worker stored one first.
+
+    Returns (outline, True) for ours, or (theirs, False).
+    """
+    # Only a worker that took over an expired claim can get here second; held until commit,
+    # it then finds the first worker's outline
+    yield db.execute(queries.ADVISORY_XACT_LOCK, (OUTLINE_LOCK, skill_id))
+    _, outline = yield from load_outline(skill_id)
+    if outline:
+        return outline, False
+
+    row = yield db.fetch_one(queries.INSERT_OUTLINE, (skill_id, outline_data['title'], outline_data['description']))
+    outline_id = row[0]
+    topics = []
+    for topic in outline_data['topics']:
+        row = yield db.fetch_one(queries.INSERT_TOPIC, (outline_id, topic['title'], topic['description'], topic['sequence_number']))
+        topic['id'] = row[0]
+        topics.append(topic)
+
+    outline = {
+        "id": outline_id,
+        "skill_id": skill_id,
+        "title": outline_data['title'],
+        "description": outline_data['description'],
+        "topics": topics
+    }
+    return outline, True
+
+
+def outline_stored(outline):
+    """Serve a newly stored outline from memory from now on"""
+    db.invalidate_outline(outline["skill_id"])
+    db.cache_outline(outline)
+
+
+def stored_topic_content(topic_id):
+    """Steps: (revision, content) of a topic's latest content, or None"""
+    return (yield db.fetch_one(queries.TOPIC_CONTENT, (topic_id,)))
+
+
+def topic_details(topic_id):
+    """Steps: (title, description, skill name) of a topic, for generating its content"""
+    row = yield db.fetch_one(queries.TOPIC_DETAILS, (topic_id,))
+    if not row:
+        raise NotFound("Topic not found")
+    return row
+
+
+def store_blocks(revision, content):
+    """Steps: store a content revision as blocks for paged reads"""
+    yield db.execute(content_blocks.INSERT_BLOCKS, content_blocks.insert_params(revision, content))
+
+
+def store_topic_content(topic_id, content):
+    """Steps: store generated content and its blocks unless another worker stored some first.
+
+    Returns ((revision, content), True) for ours, or (theirs, False).
+    """
+    yield db.execute(queries.ADVISORY_XACT_LOCK, (TOPIC_CONTENT_LOCK, topic_id))
+    stored = yield from stored_topic_content(topic_id)
+    if stored:
+        return stored, False
+
+    # The same content as blocks, for paged reads
+    row = yield db.fetch_one(queries.INSERT_TOPIC_CONTENT, (topic_id, content))
+    yield from store_blocks(row[0], content)
+    return (row[0], content), True
+
+
+def read_page(params):
+    """Steps: content_blocks.PAGE rows for content_blocks.page_params"""
+    return (yield db.fetch_all(content_blocks.PAGE, params))
+
+
+def content_page(topic_id, rows, limit):
+    result = content_blocks.page(topic_id, rows, limit)
+    if result is None:
+        raise NotFound("Content not found")
+    return result
+
+
+def topic_order(course_outline_id):
+    """Steps: ordered topic ids of an outline, from memory once read"""
+    topic_ids = db.topic_order(course_outline_id)
+    if topic_ids is None:
+        row = yield db.fetch_one(queries.TOPIC_ORDER, (course_outline_id,))
+        topic_ids = row[0]
+        db.cache_topic_order(course_outline_id, topic_ids)
+    return topic_ids
+
+
+def start_course(user_id, course_outline_id):
+    """Steps: (current topic id, ordered topic ids) of a course, starting it at its first topic if needed"""
+    # Check if user already has progress for this course
+    result = yield db.fetch_one(queries.CURRENT_TOPIC, (user_id, course_outline_id))
+    if result and result[0]:
+        topic_id = result[0]
+    else:
+        result = yield db.fetch_one(queries.FIRST_TOPIC, (course_outline_id,))
+        if not result:
+            raise NotFound("No topics found for this course")
+
+        topic_id = result[0]
+        yield db.execute(queries.START_COURSE, (user_id, course_outline_id, topic_id, topic_id))
+
+    topic_ids = yield from topic_order(course_outline_id)
+    return topic_id, topic_ids
+
+
+def advance_topic(user_id, completed_topic_id):
+    """Steps: mark a topic complete and move on to the next; returns (progress report, ordered topic ids)"""
+    course_outline_id, topic_ids = db.outline_of_topic(completed_topic_id)
+    if topic_ids:
+        # Known outline: work out the next topic here and write progress in one statement
+        index = topic_ids.index(completed_topic_id)
+        if index + 1 < len(topic_ids):
+            next_topic_id = topic_ids[index + 1]
+            completion_percentage = (index + 1) / len(topic_ids) * 100
+        else:
+            # This was the last topic
+            next_topic_id = None
+            completion_percentage = 100
+        yield db.execute(queries.SAVE_PROGRESS, (user_id, course_outline_id, next_topic_id, completion_percentage))
+    else:
+        # Resolve the outline, its topic order, the next topic and the percentage,
+        # and upsert progress, in a single round trip
+        result = yield db.fetch_one(queries.ADVANCE_TOPIC, {"topic_id": completed_topic_id, "user_id": user_id})
+        if not result:
+            raise NotFound("Topic not found")
+
+        course_outline_id, topic_ids, next_topic_id, completion_percentage = result
+        db.cache_topic_order(course_outline_id, topic_ids)
+
+    report = {
+        "course_outline_id": course_outline_id,
+        "completion_percentage": completion_percentage,
+        "current_topic_id": completed_topic_id,
+        "next_topic_id": next_topic_id
+    }
+    return report, topic_ids
+
+
+def store_assessments(user_id, assessments):
+    """Steps: store a user's proficiency ratings, one per skill"""
+    topic_ids = list({assessment['topic_id'] for assessment in assessments})
+    if not topic_ids:
+        return
+
+    # Resolve every topic to its skill at once
+    topic_skills = dict((yield db.fetch_all(queries.TOPIC_SKILLS, (topic_ids,))))
+
+    # The last rating of a skill in the payload wins; unknown topics are skipped
+    skill_levels = {}
+    for assessment in assessments:
+        skill_id = topic_skills.get(assessment['topic_id'])
+        if skill_id is not None:
+            skill_levels[skill_id] = assessment['proficiency_level']
+
+    if skill_levels:
+        yield db.execute(queries.UPSERT_ASSESSMENTS, (user_id, list(skill_levels), list(skill_levels.values())))
@@ -0,0 +1,238 @@
+import asyncio
+import os
+import threading
+import time
+from collections import defaultdict
+import db
+import resilience
+
+# Advisory lock namespaces (first int4 of pg_advisory_xact_lock)
+OUTLINE_LOCK = 1
+TOPIC_CONTENT_LOCK = 2
+
+# A worker claims a generation here before calling the model, so workers in other processes wait
+# for its result instead of generating their own; a claim is released with the stored result
+CLAIMS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS generation_claims (
+    -- flights kind ("outline", "topic_content") and the skill or topic id
+    kind TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    -- The holder's deadline; a claim left behind by a crashed worker is taken over after it
+    expires_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (kind, item_id)
+);
+"""
+
+# A row when the claim is ours (new, or taken over from an expired holder); params: kind, item id, seconds
+CLAIM = """
+INSERT INTO generation_claims (kind, item_id, expires_at)
+VALUES (%s, %s, clock_timestamp() + make_interval(secs => %s))
+ON CONFLICT (kind, item_id) DO UPDATE SET expires_at = EXCLUDED.expires_at
+WHERE generation_claims.expires_at < clock_timestamp()
+RETURNING expires_at
+"""
+
+RELEASE = "DELETE FROM generation_claims WHERE kind = %s AND item_id = %s"
+
+# How long a generation without a request deadline (prefetch, worker.py jobs) may hold its claim
+CLAIM_SECONDS = float(os.getenv('GENERATION_CLAIM_SECONDS', '150'))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key so only one of them does the work.
+
+    Keys are (kind, id) tuples; counters are kept per kind.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        # Coroutine calls of the async app, as futures on its event loop
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {"leaders": 0, "coalesced": 0, "coalesced_db": 0})
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats[key[0]]["leaders"] += 1
+            else:
+                self._stats[key[0]]["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key, fn):
+        """do() for coroutines: callers awaiting the same key share one run of fn()"""
+        with self._lock:
+            future = self._async_calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._async_calls[key] = asyncio.get_running_loop().create_future()
+                self._stats[key[0]]["leaders"] += 1
+            else:
+                self._stats[key[0]]["coalesced"] += 1
+
+        if not leader:
+            # shield: a follower going away must not cancel the leader's result for the others
+            return await asyncio.shield(future)
+
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Followers see it; retrieving it here keeps asyncio from logging it as never retrieved
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                del self._async_calls[key]
+
+    def record_db_coalesced(self, kind):
+        """Count a call that was served another worker's stored result instead of generating it"""
+        with self._lock:
+            self._stats[kind]["coalesced_db"] += 1
+
+    def in_flight(self):
+        with self._lock:
+            return list(self._calls) + list(self._async_calls)
+
+    def stats(self):
+        with self._lock:
+            return {kind: dict(counts) for kind, counts in self._stats.items()}
+
+
+flights = SingleFlight()
+
+
+_claims_ready = False
+_claims_lock = threading.Lock()
+
+
+def ensure_schema():
+    """Create generation_claims once per process, like content_blocks.ensure_schema"""
+    global _claims_ready
+    if _claims_ready:
+        return
+    with _claims_lock:
+        if not _claims_ready:
+            with db.connection() as conn:
+                conn.cursor().execute(CLAIMS_SCHEMA)
+            _claims_ready = True
+
+
+def claim(kind, item_id, load, seconds):
+    """Steps: (stored result, False) once load() finds one, else (None, True) if this worker claimed
+    its generation for `seconds`, or (None, False) while another worker holds the claim"""
+    stored = yield from load()
+    if stored:
+        return stored, False
+    claimed = yield db.fetch_one(CLAIM, (kind, item_id, seconds))
+    if not claimed:
+        return None, False
+    # The previous holder may have stored its result and released the claim just before ours
+    stored = yield from load()
+    if stored:
+        yield db.execute(RELEASE, (kind, item_id))
+        return stored, False
+    return None, True
+
+
+def release(kind, item_id):
+    """Steps: give up a claim, so a waiting worker takes the generation over"""
+    yield db.execute(RELEASE, (kind, item_id))
+
+
+def _store_and_release(steps, kind, item_id):
+    result = yield from steps
+    yield from release(kind, item_id)
+    return result
+
+
+def _claim_seconds(kind, item_id):
+    """Time left to generate: the request's deadline, or CLAIM_SECONDS without one"""
+    remaining = resilience.remaining()
+    if remaining is None:
+        return CLAIM_SECONDS
+    if remaining <= 0:
+        raise resilience.DeadlineExceeded(f"Deadline passed waiting for another worker's {kind} {item_id}")
+    return remaining
+
+
+def generate_once(run, kind, item_id, load, generate, store, poll_interval=0.25):
+    """Generate a result once across processes: claim it before calling generate().
+
+    run(steps) runs db steps in a transaction; load() gives steps returning the stored result or
+    None, and store(result) steps storing generate()'s result and returning (result, True), or
+    (another worker's result, False). While another worker holds the claim, this one polls for
+    its result and returns (result, False) without generating. The claim lasts until the
+    holder's deadline, which generate() runs under; a claim released after a failed generation,
+    or expired, is taken over.
+    """
+    while True:
+        seconds = _claim_seconds(kind, item_id)
+        stored, claimed = run(claim(kind, item_id, load, seconds))
+        if stored:
+            flights.record_db_coalesced(kind)
+            return stored, False
+        if claimed:
+            break
+        time.sleep(poll_interval)
+
+    try:
+        with resilience.deadline(seconds):
+            result = generate()
+    except BaseException:
+        run(release(kind, item_id))
+        raise
+    return run(_store_and_release(store(result), kind, item_id))
+
+
+async def agenerate_once(run, kind, item_id, load, agenerate, store, poll_interval=0.25):
+    """generate_once() for the async app: run(steps) and agenerate() are coroutines"""
+    while True:
+        seconds = _claim_seconds(kind, item_id)
+        stored, claimed = await run(claim(kind, item_id, load, seconds))
+        if stored:
+            flights.record_db_coalesced(kind)
+            return stored, False
+        if claimed:
+            break
+        await asyncio.sleep(poll_interval)
+
+    try:
+        with resilience.deadline(seconds):
+            result = await agenerate()
+    except BaseException:
+        # Shielded, so a cancelled request still hands the claim on
+        await asyncio.shield(run(release(kind, item_id)))
+        raise
+    return await run(_store_and_release(store(result), kind, item_id))
@@ -0,0 +1,152 @@
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+
+def canonical_key(name):
+    """Normalized form of a skill name: case, accents, punctuation and spacing folded away.
+
+    "SQL Server Performance Tuning" and "SQL server performance-tuning" share a key.
+    + and # are kept so C, C++ and C# stay distinct.
+    """
+    text = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii").lower()
+    text = text.replace("&", " and ")
+    text = re.sub(r"[^a-z0-9+#]+", " ", text)
+    return " ".join(text.split())
+
+
+def trigrams(key):
+    """pg_trgm-style trigrams: each word padded with two leading blanks and one trailing blank"""
+    grams = set()
+    for word in key.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+# Words that reverse or narrow what a name is about
+_QUALIFIERS = frozenset("""
+    not no non without except anti
+    inbound outbound incoming outgoing input output import export upstream downstream
+    upload download ingress egress inflow outflow send receive sending receiving
+    buy sell buying selling payable payables receivable receivables
+    pre post before after beginner intermediate advanced frontend backend
+""".split())
+
+
+def distinguishing_terms(key):
+    """Numbers and negation or direction words of a canonical key.
+
+    Names that differ in these ("Python 2" / "Python 3", "inbound" / "outbound") are different
+    things however much of the rest they share.
+    """
+    return frozenset(re.findall(r"\d+", key)) | (_QUALIFIERS.intersection(key.split()))
+
+
+class SkillIndex:
+    """In-process index of skill names by canonical key, with trigram lookup of near-duplicates"""
+
+    def __init__(self, threshold=0.75):
+        self.threshold = threshold
+        self._by_key = {}
+        self._grams = {}
+        self._postings = defaultdict(set)
+        self._lock = threading.Lock()
+        # Highest id read from the skills table; ids added by this process don't move it, or rows
+        # other workers inserted with lower ids would never be read
+        self._loaded_id = 0
+        self._loaded_at = None
+        self.counts = {"lookups": 0, "exact": 0, "new": 0, "similar": 0}
+
+    def add(self, skill_id, name):
+        key = canonical_key(name)
+        with self._lock:
+            # Keep the oldest skill for a key so every alias points at the same outline
+            if key in self._by_key:
+                return
+            self._by_key[key] = skill_id
+            grams = trigrams(key)
+            self._grams[skill_id] = (key, grams)
+            for gram in grams:
+                self._postings[gram].add(skill_id)
+
+    def match(self, name, exclude=None, count=True):
+        """(skill_id, "exact", 1.0) for an existing skill with the same canonical key, or None.
+
+        Only case, accent, punctuation and spacing differences are merged; near-duplicates are
+        reported by similar() for review, never reused here.
+        """
+        key = canonical_key(name)
+        with self._lock:
+            skill_id = self._by_key.get(key)
+            result = (skill_id, "exact", 1.0) if skill_id is not None and skill_id != exclude else None
+            if count:
+                self.counts["lookups"] += 1
+                self.counts["exact" if result else "new"] += 1
+        return result
+
+    def similar(self, name, exclude=None):
+        """(skill_id, name key, score) for the closest skill by trigram similarity above threshold, or None.
+
+        "MySQL Performance Tuning" and "SQL Server Performance Tuning" look alike but are different
+        skills, so a result is a candidate alias to review, not a match.
+        """
+        key = canonical_key(name)
+        grams = trigrams(key)
+        terms = distinguishing_terms(key)
+        shared = defaultdict(int)
+        best = None
+        with self._lock:
+            for gram in grams:
+                for candidate in self._postings.get(gram, ()):
+                    shared[candidate] += 1
+            for candidate, overlap in shared.items():
+                candidate_key, candidate_grams = self._grams[candidate]
+                score = overlap / (len(grams) + len(candidate_grams) - overlap)
+                # "Python 2" vs "Python 3" look alike but are different skills
+                if candidate == exclude or candidate_key == key or score < self.threshold or distinguishing_terms(candidate_key) != terms:
+                    continue
+                if best is None or score > best[2]:
+                    best = (candidate, candidate_key, score)
+            if best:
+                self.counts["similar"] += 1
+        return best
+
+    def needs_load(self, refresh_after=300):
+        """True when new skills rows should be read (never loaded, or last read over refresh_after seconds ago)"""
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= refresh_after
+
+    def load_query(self, overlap=1000):
+        """(sql, params) selecting the skills rows not read yet.
+
+        Ids are taken in insert order but committed in any order, so a row can appear below the
+        highest id already read; the last `overlap` ids are read again to pick those up.
+        """
+        after = max(0, self._loaded_id - overlap) if self._loaded_id else 0
+        return "SELECT id, name FROM skills WHERE id > %s ORDER BY id", (after,)
+
+    def load_rows(self, rows):
+        for skill_id, name in rows:
+            self.add(skill_id, name)
+        if rows:
+            self._loaded_id = max(self._loaded_id, max(skill_id for skill_id, _ in rows))
+        self._loaded_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+            stats["indexed"] = len(self._by_key)
+        stats["reuse_rate"] = stats["exact"] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
+
+
+skill_index = SkillIndex(threshold=float(os.getenv('SKILL_ALIAS_THRESHOLD', '0.75')))
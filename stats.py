@@ -0,0 +1,93 @@
+import threading
+import db
+import fetch
+import httpcache
+import llm
+import metrics
+import resilience
+import routing
+import semantic
+from prefetch import prefetcher
+from singleflight import flights
+from telemetry import llm_calls
+
+# Outlines served from another skill's outline instead of being generated, shared by both apps
+outline_reuse = {"equivalent_skill": 0, "semantic": 0}
+
+
+def summary(pool_stats):
+    """/api/metrics: per call site model latency/tokens/cost, plus pool, cache and coalescing stats"""
+    return {
+        "llm": llm_calls.summary(),
+        "db_pool": pool_stats(),
+        "llm_cache": llm.cache_stats(),
+        "single_flight": flights.stats(),
+        "outline_cache": db.outline_cache_stats(),
+        "topic_order_cache": db.topic_cache_stats(),
+        "skill_reuse": {
+            **db.skill_index.stats(),
+            "outlines_from_equivalent_skill": outline_reuse["equivalent_skill"],
+            "outlines_from_similar_skill": outline_reuse["semantic"],
+        },
+        "semantic_reuse": semantic.stats(),
+        "routing": routing.router.stats(),
+        "upstream": resilience.upstream.stats(),
+        "job_posting_fetch": fetch.stats(),
+        "http_cache": httpcache.stats(),
+        "prefetch": prefetcher.stats(),
+    }
+
+
+def _pool_metrics(stats):
+    lines = metrics.gauge_lines("db_pool_connections", "Pooled connections by state",
+                                [({"state": "in_use"}, stats["in_use"]), ({"state": "idle"}, stats["idle"])])
+    for name in ("checkouts", "waits", "timeouts", "connections_opened", "connections_discarded"):
+        lines += metrics.gauge_lines(f"db_pool_{name}_total", f"Connection pool {name.replace('_', ' ')}",
+                                     [({}, stats[name])], "counter")
+    return lines
+
+
+def _llm_metrics():
+    summary = llm_calls.summary()
+    lines = []
+    for name in ("calls", "errors", "input_tokens", "output_tokens", "reasoning_tokens"):
+        lines += metrics.gauge_lines(f"llm_{name}_total", f"Model call {name.replace('_', ' ')}",
+                                     [({"call_site": site}, stats.get(name, 0)) for site, stats in summary.items()], "counter")
+    lines += metrics.gauge_lines("llm_cost_usd_total", "Estimated model spend in USD",
+                                 [({"call_site": site}, stats["cost_usd"]) for site, stats in summary.items()], "counter")
+    lines += metrics.gauge_lines("llm_call_duration_seconds", "Recent upstream model latency", [
+        ({"call_site": site, "quantile": quantile}, stats["latency_seconds"][f"p{int(quantile * 100)}"])
+        for site, stats in summary.items()
+        for quantile in (0.5, 0.95, 0.99)
+    ], "summary")
+    lines += metrics.gauge_lines("llm_route_decisions_total", "Model routing decisions by chosen model, effort and reason", [
+        ({"call_site": site, "model": model, "effort": effort or "none", "reason": reason}, count)
+        for (site, model, effort, reason), count in sorted(routing.router.decision_counts().items(), key=str)
+    ], "counter")
+    upstream = resilience.upstream.stats()
+    states = {"closed": 0, "half_open": 1, "open": 2}
+    lines += metrics.gauge_lines("llm_circuit_state", "Model API circuit breaker state (0 closed, 1 half-open, 2 open)",
+                                 [({"model": model}, states[breaker["state"]]) for model, breaker in upstream["circuit_breakers"].items()])
+    for name in ("retries", "hedges", "hedge_wins", "primary_wins", "failed_fast"):
+        lines += metrics.gauge_lines(f"llm_{name}_total", f"Model calls: {name.replace('_', ' ')}",
+                                     [({"call_site": site}, counts.get(name, 0)) for site, counts in upstream["call_sites"].items()], "counter")
+    return lines
+
+
+_registered = False
+_register_lock = threading.Lock()
+
+
+def register_collectors(pool_stats):
+    """Add the connection pool (db.pool_stats or adb.pool_stats) and model call collectors to /metrics.
+
+    Both apps call this at import; only the first call registers, so a process importing app.py
+    and asgi.py doesn't render every series twice.
+    """
+    global _registered
+    with _register_lock:
+        if _registered:
+            return
+        _registered = True
+    metrics.register_collector(lambda: _pool_metrics(pool_stats()))
+    metrics.register_collector(_llm_metrics)
@@ -0,0 +1,123 @@
+import threading
+from collections import defaultdict, deque
+
+# USD per 1M tokens: (input, cached input, output). Reasoning tokens are billed as output.
+PRICES = {
+    "o3-mini": (1.10, 0.55, 4.40),
+    "gpt-3.5-turbo": (0.50, 0.50, 1.50),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "text-embedding-3-small": (0.02, 0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.13, 0.0),
+}
+
+
+def _price(model):
+    # Dated snapshots (o3-mini-2025-01-31) share their base model's price
+    for name in sorted(PRICES, key=len, reverse=True):
+        if model.startswith(name):
+            return PRICES[name]
+    return None
+
+
+def usage_tokens(usage):
+    """(input, cached input, output, reasoning) tokens from a Responses or Chat Completions usage object"""
+    if usage is None:
+        return 0, 0, 0, 0
+    if hasattr(usage, "input_tokens"):
+        input_details = getattr(usage, "input_tokens_details", None)
+        output_details = getattr(usage, "output_tokens_details", None)
+        input_tokens, output_tokens = usage.input_tokens, usage.output_tokens
+    else:
+        input_details = getattr(usage, "prompt_tokens_details", None)
+        output_details = getattr(usage, "completion_tokens_details", None)
+        # Embedding usage has no completion tokens
+        input_tokens, output_tokens = usage.prompt_tokens, getattr(usage, "completion_tokens", 0)
+    cached = getattr(input_details, "cached_tokens", 0) or 0
+    reasoning = getattr(output_details, "reasoning_tokens", 0) or 0
+    return input_tokens or 0, cached, output_tokens or 0, reasoning
+
+
+def cost(model, input_tokens, cached_tokens, output_tokens):
+    price = _price(model)
+    if price is None:
+        return 0.0
+    input_price, cached_price, output_price = price
+    return ((input_tokens - cached_tokens) * input_price + cached_tokens * cached_price + output_tokens * output_price) / 1e6
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class _Site:
+    def __init__(self, window):
+        self.latencies = deque(maxlen=window)
+        self.counts = defaultdict(int, calls=0, errors=0)
+        self.models = defaultdict(int)
+        self.cost_usd = 0.0
+
+
+class LLMTelemetry:
+    """Per call site model-call stats; latency percentiles cover the most recent `window` calls"""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def record(self, call_site, model, duration, usage=None, cache_status="miss", error=None):
+        input_tokens, cached_tokens, output_tokens, reasoning_tokens = usage_tokens(usage)
+        with self._lock:
+            site = self._sites.get(call_site)
+            if site is None:
+                site = self._sites[call_site] = _Site(self.window)
+            site.counts["calls"] += 1
+            site.counts[f"cache_{cache_status}"] += 1
+            site.models[model] += 1
+            if error is not None:
+                site.counts["errors"] += 1
+            site.counts["input_tokens"] += input_tokens
+            site.counts["cached_input_tokens"] += cached_tokens
+            site.counts["output_tokens"] += output_tokens
+            site.counts["reasoning_tokens"] += reasoning_tokens
+            site.cost_usd += cost(model, input_tokens, cached_tokens, output_tokens)
+            # Cache hits would drag the percentiles toward zero; track upstream latency only
+            if cache_status != "hit":
+                site.latencies.append(duration)
+
+    def latency(self, call_site, p, min_samples=1):
+        """Recent upstream latency percentile for a call site, or None with fewer than min_samples calls"""
+        with self._lock:
+            site = self._sites.get(call_site)
+            values = sorted(site.latencies) if site else []
+        return percentile(values, p) if len(values) >= min_samples else None
+
+    def summary(self):
+        with self._lock:
+            sites = {
+                name: (dict(site.counts), dict(site.models), site.cost_usd, sorted(site.latencies))
+                for name, site in self._sites.items()
+            }
+        report = {}
+        for name, (counts, models, cost_usd, latencies) in sites.items():
+            report[name] = {
+                **counts,
+                "models": models,
+                "cost_usd": round(cost_usd, 6),
+                "latency_seconds": {
+                    "count": len(latencies),
+                    "p50": percentile(latencies, 50),
+                    "p90": percentile(latencies, 90),
+                    "p95": percentile(latencies, 95),
+                    "p99": percentile(latencies, 99),
+                    "max": latencies[-1] if latencies else None,
+                },
+            }
+        return report
+
+
+llm_calls = LLMTelemetry()
@@ -0,0 +1,62 @@
+import os
+import uuid
+import pytest
+import db
+import jobs
+import singleflight
+import util
+from skills_index import SkillIndex
+
+SCHEMA_SQL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "schema.sql")
+
+
+@pytest.fixture(autouse=True)
+def _drain_log_writer():
+    """util's writer thread keeps the sys.stdout it started with, which pytest replaces per test"""
+    yield
+    util.flush()
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """db.connection() on a scratch schema created from benchmarks/schema.sql, dropped afterwards.
+
+    Returns run(steps), running db steps in a transaction. Skips the test without a Postgres
+    given by the PG* variables.
+    """
+    psycopg2 = pytest.importorskip("psycopg2")
+    if not (os.getenv("PGHOST") or os.getenv("PGDATABASE")):
+        pytest.skip("No database: set the PG* variables")
+    try:
+        admin = psycopg2.connect("")
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"No database: {e}")
+    admin.autocommit = True
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    cursor = admin.cursor()
+    cursor.execute(f"CREATE SCHEMA {schema}")
+    cursor.execute(f"SET search_path TO {schema}")
+    with open(SCHEMA_SQL) as file:
+        cursor.execute(file.read())
+
+    # Every connection the pool opens uses the scratch schema; ids restart there, so nothing cached
+    # in-process about another schema may leak in
+    monkeypatch.setenv("PGOPTIONS", f"-c search_path={schema}")
+    monkeypatch.setattr(db, "_pool", None)
+    monkeypatch.setattr(db, "skill_index", SkillIndex())
+    monkeypatch.setattr(jobs, "_schema_ready", False)
+    monkeypatch.setattr(singleflight, "_claims_ready", False)
+    for cached in (db._outlines, db._topic_orders, db._topic_outlines):
+        cached.clear()
+
+    def run(steps):
+        with db.connection() as conn:
+            return db.run_steps(conn.cursor(), steps)
+
+    try:
+        yield run
+    finally:
+        if db._pool is not None:
+            db._pool.closeall()
+        cursor.execute(f"DROP SCHEMA {schema} CASCADE")
+        admin.close()
@@ -0,0 +1,52 @@
+import httpx
+import openai
+import pytest
+import bulkgen
+import coe
+import resilience
+import semantic
+
+
+def rate_limit_error():
+    response = httpx.Response(429, headers={"retry-after": "0.01"}, request=httpx.Request("POST", "http://api"))
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """A model call through resilience.upstream that answers 429 once per subtopic, then succeeds"""
+    calls = []
+
+    def generate_learning_block(topic, subtopic):
+        def fn(timeout):
+            calls.append(subtopic)
+            if calls.count(subtopic) == 1:
+                raise rate_limit_error()
+            return {"topic": topic, "subtopic": subtopic, "blocks": []}
+        return resilience.upstream.call("bulk_test", "model", fn, hedge=False)
+
+    monkeypatch.setattr(coe, "generate_learning_block", generate_learning_block)
+    monkeypatch.setattr(semantic, "lookup_many", lambda namespace, keys: [None] * len(keys))
+    return calls
+
+
+OUTLINE = {"topics": [{"topic_name": "SQL", "subtopics": ["Joins", "Indexes"]}]}
+
+
+def test_rate_limits_are_retried_by_one_layer(upstream):
+    limiter = bulkgen.RateLimiter(requests_per_minute=6000, tokens_per_minute=10 ** 7)
+    results = bulkgen.generate_outline_blocks(OUTLINE, max_workers=2, limiter=limiter, tokens_per_call=100)
+    assert sorted(results) == ["SQL | Indexes", "SQL | Joins"]
+    # One 429 and one retry each; resilience leaves the 429 to bulkgen instead of retrying it too
+    assert sorted(upstream) == ["Indexes", "Indexes", "Joins", "Joins"]
+    # The 429s and the successes gave back the estimates they didn't use
+    assert limiter._tokens == pytest.approx(10 ** 7, rel=1e-3)
+
+
+def test_resilience_still_retries_rate_limits_elsewhere(upstream):
+    assert coe.generate_learning_block("SQL", "Joins")["subtopic"] == "Joins"
+    assert upstream == ["Joins", "Joins"]
+    with resilience.caller_retries_rate_limits():
+        with pytest.raises(openai.RateLimitError):
+            coe.generate_learning_block("SQL", "Views")
+    assert upstream.count("Views") == 1
@@ -0,0 +1,74 @@
+import pytest
+import cache
+from cache import LLMCache, LRUCache, SQLiteCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    monkeypatch.setattr(cache.time, "time", clock)
+    return clock
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(maxsize=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+    assert lru.get("b") is None
+    assert (lru.get("a"), lru.get("c")) == (1, 3)
+    assert lru.stats() == {"size": 2, "max_size": 2, "hits": 3, "misses": 1, "evictions": 1}
+
+
+def test_lru_ttl(clock):
+    lru = LRUCache(ttl=10)
+    lru.set("default", 1)
+    lru.set("longer", 2, ttl=60)
+    clock.now += 10
+    assert lru.get("default") is None
+    assert lru.get("longer") == 2
+    assert len(lru) == 1
+    clock.now += 50
+    assert lru.get("longer", "gone") == "gone"
+
+
+def test_sqlite_ttl_and_eviction(tmp_path, clock):
+    store = SQLiteCache(str(tmp_path / "cache.sqlite"), ttl=10, max_entries=2)
+    store.set("a", "1")
+    store.set("b", "2", ttl=100)
+    clock.now += 10
+    assert store.get("a") is None
+    assert store.get("b") == "2"
+    clock.now += 1
+    store.set("c", "3")
+    clock.now += 1
+    store.set("d", "4")
+    clock.now += 1
+    store.get("c")
+    store.evict()
+    # Over max_entries, the least recently read or written rows go
+    assert len(store) == 2
+    assert (store.get("b"), store.get("c"), store.get("d")) == (None, "3", "4")
+
+
+def test_llm_cache_tiers(tmp_path):
+    persistent = SQLiteCache(str(tmp_path / "llm.sqlite"))
+    persistent.set("k", "cached")
+    llm_cache = LLMCache(LRUCache(), persistent)
+    assert llm_cache.get("k") == "cached"
+    assert llm_cache.get("k") == "cached"
+    assert llm_cache.get("missing") is None
+    stats = llm_cache.stats()
+    assert (stats["persistent_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 1)
+    assert LLMCache.key("m", None, "s", "u", None) == LLMCache.key("m", None, "s", "u", None)
+    assert LLMCache.key("m", None, "s", "u", None) != LLMCache.key("m", "low", "s", "u", None)
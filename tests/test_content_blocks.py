@@ -0,0 +1,52 @@
+import pytest
+import content_blocks
+
+
+def test_cursor_round_trip():
+    cursor = content_blocks.encode_cursor(42, 7)
+    assert "=" not in cursor
+    assert content_blocks.decode_cursor(cursor) == (42, 7)
+
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", content_blocks.encode_cursor("a", 1), "NDI6"])
+def test_invalid_cursors(cursor):
+    with pytest.raises(ValueError):
+        content_blocks.decode_cursor(cursor)
+
+
+def test_page_params():
+    assert content_blocks.page_params(3, None, 10) == {"topic_id": 3, "revision": None, "after": -1, "limit": 11}
+    cursor = content_blocks.encode_cursor(5, 9)
+    assert content_blocks.page_params(3, cursor, 10) == {"topic_id": 3, "revision": 5, "after": 9, "limit": 11}
+
+
+def test_page_and_next_cursor():
+    rows = [(5, position, "text", f"block {position}") for position in range(3)]
+    first = content_blocks.page(3, rows, 2)
+    assert [block["id"] for block in first["blocks"]] == ["5-0", "5-1"]
+    assert content_blocks.decode_cursor(first["next_cursor"]) == (5, 1)
+    last = content_blocks.page(3, rows[2:], 2)
+    assert last["next_cursor"] is None and last["blocks"][0]["position"] == 2
+
+
+def test_page_without_blocks():
+    assert content_blocks.page(3, [], 2) is None
+    assert content_blocks.page(3, [(5, None, None, None)], 2) == {
+        "topic_id": 3, "revision": 5, "blocks": [], "next_cursor": None}
+    first_page = content_blocks.page_params(3, None, 2)
+    assert content_blocks.needs_blocks(first_page, [])
+    assert content_blocks.needs_blocks(first_page, [(5, None, None, None)])
+    assert not content_blocks.needs_blocks(first_page, [(5, 0, "text", "x")])
+    assert not content_blocks.needs_blocks(content_blocks.page_params(3, content_blocks.encode_cursor(5, 0), 2), [])
+
+
+def test_split_markdown():
+    content = "Intro\n\n## Setup\nInstall it.\n\n```\n# not a heading\n```\n\n![diagram](https://example.com/d.png)\n\n## Next\nMore."
+    assert content_blocks.split_markdown(content) == [
+        {"block_type": "text", "content": "Intro"},
+        {"block_type": "text", "content": "## Setup\nInstall it.\n\n```\n# not a heading\n```"},
+        {"block_type": "image", "content": "https://example.com/d.png"},
+        {"block_type": "text", "content": "## Next\nMore."},
+    ]
+    revision, positions, types, texts = content_blocks.insert_params(9, content)
+    assert (revision, positions, types) == (9, [0, 1, 2, 3], ["text", "text", "image", "text"])
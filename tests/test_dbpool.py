@@ -0,0 +1,151 @@
+import threading
+import time
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+import dbpool  # noqa: E402
+
+IDLE = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+IN_TRANSACTION = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.conn.status = IN_TRANSACTION
+
+
+class FakeConnection:
+    """What ConnectionPool uses of a PooledConnection"""
+
+    def __init__(self):
+        self.pool = None
+        self.last_used = 0.0
+        self.closed = 0
+        self.broken = False
+        self.status = IDLE
+        self.calls = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.calls.append("commit")
+        self.status = IDLE
+
+    def rollback(self):
+        self.calls.append("rollback")
+        if self.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.status = IDLE
+
+    def get_transaction_status(self):
+        return self.status
+
+    def discard(self):
+        self.pool = None
+        self.closed = 1
+
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    opened = []
+
+    def connect(pool):
+        conn = FakeConnection()
+        conn.pool = pool
+        conn.last_used = time.monotonic()
+        with pool._cond:
+            pool._stats["connections_opened"] += 1
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(dbpool.ConnectionPool, "_connect", connect)
+
+    def make(**kwargs):
+        pool = dbpool.ConnectionPool(**kwargs)
+        pool.opened = opened
+        return pool
+    return make
+
+
+def test_checkout_times_out_when_the_pool_is_exhausted(make_pool):
+    pool = make_pool(maxconn=1, timeout=0.05)
+    conn = pool.getconn()
+    with pytest.raises(dbpool.PoolTimeout):
+        pool.getconn()
+    stats = pool.stats()
+    assert (stats["waits"], stats["timeouts"], stats["in_use"]) == (1, 1, 1)
+
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+
+
+def test_waiter_gets_the_returned_connection(make_pool):
+    pool = make_pool(maxconn=1, timeout=5)
+    conn = pool.getconn()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+    waiter.start()
+    while pool.stats()["waits"] < 1:
+        time.sleep(0.01)
+    pool.putconn(conn)
+    waiter.join(5)
+    assert got == [conn] and len(pool.opened) == 1
+
+
+def test_unhealthy_connections_are_dropped(make_pool):
+    pool = make_pool(maxconn=2, health_check_after=60)
+    closed, stale = pool.getconn(), pool.getconn()
+    pool.putconn(closed)
+    pool.putconn(stale)
+    closed.closed = 1
+    # Idle past health_check_after, and the server has gone away
+    stale.last_used -= 120
+    stale.broken = True
+
+    conn = pool.getconn()
+    assert conn not in (closed, stale) and len(pool.opened) == 3
+    assert pool.stats()["connections_discarded"] == 2
+
+
+def test_putconn_rolls_back_an_open_transaction(make_pool):
+    pool = make_pool(maxconn=2)
+    conn = pool.getconn()
+    conn.status = IN_TRANSACTION
+    pool.putconn(conn)
+    assert conn.calls == ["rollback"] and pool.stats()["idle"] == 1
+
+    # A connection that cannot roll back is closed instead of pooled
+    conn = pool.getconn()
+    conn.status = IN_TRANSACTION
+    conn.broken = True
+    pool.putconn(conn)
+    assert conn.closed and pool.stats()["idle"] == 0
+    # Returning it twice does nothing
+    pool.putconn(conn)
+    assert pool.stats()["in_use"] == 0
+
+
+def test_connection_commits_or_rolls_back(make_pool):
+    pool = make_pool()
+    with pool.connection() as conn:
+        conn.cursor().execute("SELECT 1")
+    assert conn.calls == ["commit"]
+
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            conn.cursor().execute("SELECT 1")
+            raise ValueError("bad row")
+    assert conn.calls == ["commit", "rollback"]
+    assert pool.stats()["checkouts"] == 2 and pool.stats()["in_use"] == 0
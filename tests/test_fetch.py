@@ -0,0 +1,91 @@
+import ipaddress
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import fetch
+
+PAGE = b"<html><body><main>" + b"<p>Warehouse lead: WMS, forklifts, cycle counting and inbound inventory.</p>" * 5 + b"</main></body></html>"
+
+
+class Handler(BaseHTTPRequestHandler):
+    hosts = []
+
+    def do_GET(self):
+        Handler.hosts.append(self.headers["Host"])
+        if self.path == "/missing":
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.path == "/moved":
+            self.send_response(302)
+            self.send_header("Location", "http://elsewhere.test/posting")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(PAGE)))
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site(monkeypatch):
+    """posting.test and elsewhere.test resolve once, to a local server that counts as public here;
+    any further resolution fails, so only the checked address can be reached"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    answers = {"posting.test": ["127.0.0.1"], "elsewhere.test": ["10.0.0.1"]}
+    resolved = []
+    real_getaddrinfo = socket.getaddrinfo
+
+    def getaddrinfo(host, port_, *args, **kwargs):
+        try:
+            # Connecting to an address literal needs no DNS
+            ipaddress.ip_address(host)
+            return real_getaddrinfo(host, port_, *args, **kwargs)
+        except ValueError:
+            pass
+        if host in resolved or host not in answers:
+            raise socket.gaierror(f"{host} resolved again")
+        resolved.append(host)
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port_)) for address in answers[host]]
+
+    monkeypatch.setattr(fetch.socket, "getaddrinfo", getaddrinfo)
+    monkeypatch.setattr(fetch, "_public", lambda address: address == ipaddress.ip_address("127.0.0.1"))
+    monkeypatch.setattr(fetch, "_pages", fetch.cache.LRUCache())
+    Handler.hosts = []
+    yield f"http://posting.test:{port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_connects_to_the_checked_address(site):
+    assert "Warehouse lead" in fetch.job_text(f"{site}/posting")
+    assert Handler.hosts == [site.split("//")[1]]
+
+
+def test_http_errors_are_fetch_errors(site):
+    with pytest.raises(fetch.FetchError, match="HTTP 404"):
+        fetch.job_text(f"{site}/missing")
+
+
+def test_redirects_are_checked(site):
+    with pytest.raises(fetch.FetchError, match="non-public"):
+        fetch.job_text(f"{site}/moved")
+
+
+def test_unchecked_hosts_are_not_connected():
+    with pytest.raises(fetch.FetchError, match="not checked"):
+        fetch.get_session().get("http://posting.test/")
+
+
+def test_check_url_refuses_private_addresses():
+    with pytest.raises(fetch.FetchError, match="non-public"):
+        fetch.check_url("http://127.0.0.1/")
+    with pytest.raises(fetch.FetchError, match="http"):
+        fetch.check_url("file:///etc/passwd")
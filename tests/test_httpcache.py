@@ -0,0 +1,41 @@
+import gzip
+import httpcache
+
+BODY = b'{"content": "' + b"x" * 4096 + b'"}'
+
+
+def test_small_bodies_get_an_etag_and_are_not_compressed():
+    status, body, headers = httpcache.respond("GET", None, "gzip", b'{"a": 1}')
+    assert (status, body) == (200, b'{"a": 1}')
+    assert "Content-Encoding" not in headers
+    assert headers["ETag"].startswith('"') and "-" not in headers["ETag"]
+
+
+def test_large_bodies_are_compressed_for_clients_that_accept_it():
+    status, body, headers = httpcache.respond("GET", None, "gzip, deflate", BODY)
+    assert status == 200 and headers["Content-Encoding"] == "gzip"
+    assert headers["ETag"].endswith('-gzip"')
+    assert gzip.decompress(body) == BODY
+    assert httpcache.respond("GET", None, "gzip;q=0", BODY)[1] == BODY
+    assert httpcache.respond("GET", None, None, BODY)[1] == BODY
+
+
+def test_matching_etag_is_not_modified():
+    etag = httpcache.respond("GET", None, "gzip", BODY)[2]["ETag"]
+    plain_etag = httpcache.respond("GET", None, None, BODY)[2]["ETag"]
+    # Either representation's ETag, weak or strong, names the same body
+    for if_none_match in (etag, plain_etag, f"W/{etag}", f'"other", {etag}', "*"):
+        status, body, headers = httpcache.respond("GET", if_none_match, "gzip", BODY)
+        assert (status, body, headers["ETag"]) == (304, b"", etag)
+    assert httpcache.respond("HEAD", etag, "gzip", BODY)[0] == 304
+    assert httpcache.respond("GET", '"other"', "gzip", BODY)[0] == 200
+    assert httpcache.respond("POST", etag, "gzip", BODY)[0] == 200
+
+
+def test_compressed_bodies_are_reused():
+    body = b'{"reused": "' + b"y" * 4096 + b'"}'
+    before = httpcache.stats()["compressed_cache"]["hits"]
+    first = httpcache.respond("GET", None, "gzip", body)[1]
+    second = httpcache.respond("GET", None, "gzip", body)[1]
+    assert first == second
+    assert httpcache.stats()["compressed_cache"]["hits"] == before + 1
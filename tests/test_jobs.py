@@ -0,0 +1,46 @@
+import db
+import jobs
+
+
+def _set(job_id, assignments):
+    with db.connection() as conn:
+        conn.cursor().execute(f"UPDATE generation_jobs SET {assignments} WHERE id = %s", (job_id,))
+
+
+def test_jobs_are_scoped_to_their_owner(database):
+    job_id = jobs.enqueue("outline", {"skill_id": 1}, user_id=7)
+    job = jobs.get(job_id, 7)
+    assert (job["id"], job["kind"], job["status"], job["attempts"]) == (job_id, "outline", "queued", 0)
+    assert jobs.get(job_id, 8) is None
+
+
+def test_claim_skips_rows_locked_by_another_worker(database):
+    first = jobs.enqueue("outline", {"skill_id": 1}, user_id=7)
+    second = jobs.enqueue("topic_content", {"topic_id": 2}, user_id=7)
+    with db.connection() as conn:
+        # Another worker mid-claim holds the oldest queued row
+        conn.cursor().execute("SELECT id FROM generation_jobs WHERE id = %s FOR UPDATE", (first,))
+        assert jobs.claim("b") == (second, "topic_content", {"topic_id": 2})
+        assert jobs.claim("c") is None
+    assert jobs.claim("a") == (first, "outline", {"skill_id": 1})
+    assert jobs.claim("a") is None
+    assert jobs.get(first, 7)["status"] == "running" and jobs.get(first, 7)["attempts"] == 1
+
+
+def test_complete_fail_and_requeue(database):
+    done, failed, stale, dead = (jobs.enqueue("outline", {"skill_id": n}, user_id=7) for n in range(4))
+    for _ in range(4):
+        jobs.claim("worker")
+
+    jobs.complete(done, {"title": "Go"})
+    jobs.fail(failed, "model down")
+    assert (jobs.get(done, 7)["status"], jobs.get(done, 7)["result"]) == ("succeeded", {"title": "Go"})
+    assert (jobs.get(failed, 7)["status"], jobs.get(failed, 7)["error"]) == ("failed", "model down")
+
+    # Workers that died mid-run: retried, or given up on after max_attempts
+    _set(stale, "started_at = CURRENT_TIMESTAMP - interval '1 hour'")
+    _set(dead, "started_at = CURRENT_TIMESTAMP - interval '1 hour', attempts = 3")
+    assert jobs.requeue_stale(stale_after=60, max_attempts=3) == 2
+    assert jobs.get(stale, 7)["status"] == "queued"
+    assert jobs.get(dead, 7)["status"] == "failed" and jobs.get(dead, 7)["error"] == "Worker stopped before finishing"
+    assert jobs.claim("worker")[0] == stale
@@ -0,0 +1,38 @@
+import json
+from jsonstream import ArrayItemParser
+
+RESPONSE = {
+    "topic": "SQL [basics]",
+    "subtopic": "Joins {inner}",
+    "blocks": [
+        {"block_type": "text", "content": "Use \"JOIN\" with ON; braces } and [brackets] in strings are text"},
+        {"block_type": "image", "content": "https://example.com/a.png", "tags": [["x"], {"y": 1}]},
+        {"block_type": "text", "content": "café \\ done"},
+    ],
+}
+
+
+def feed_all(parser, text, size):
+    items = []
+    for start in range(0, len(text), size):
+        items.extend(parser.feed(text[start:start + size]))
+    return items
+
+
+def test_items_are_emitted_whole_at_any_chunk_size():
+    text = json.dumps(RESPONSE)
+    for size in (1, 2, 7, 64, len(text)):
+        assert feed_all(ArrayItemParser("blocks"), text, size) == RESPONSE["blocks"]
+
+
+def test_item_is_emitted_as_soon_as_it_closes():
+    parser = ArrayItemParser("blocks")
+    assert parser.feed('{"topic": "t", "blocks": [{"block_type": "text", "content": "a"}') == [
+        {"block_type": "text", "content": "a"}]
+    assert parser.feed(', {"block_type": "text", "con') == []
+    assert parser.feed('tent": "b"}]}') == [{"block_type": "text", "content": "b"}]
+
+
+def test_other_arrays_are_ignored():
+    text = json.dumps({"topics": [{"blocks": [1]}], "other": [{"a": 1}], "blocks": [{"a": 2}]})
+    assert ArrayItemParser("blocks").feed(text) == [{"a": 2}]
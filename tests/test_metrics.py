@@ -0,0 +1,29 @@
+import metrics
+
+
+def observe(count_connects, checkouts):
+    token = metrics.begin_request(count_connects=count_connects)
+    try:
+        for opened in checkouts:
+            metrics.record_checkout(opened)
+        metrics.observe_request("GET", f"/test/{count_connects}", 200, 0.01)
+    finally:
+        metrics.end_request(token)
+    return [line for line in metrics.render().splitlines() if f'route="/test/{count_connects}"' in line]
+
+
+def test_connects_are_counted_for_a_pool_that_reports_them():
+    lines = observe(True, [True, False, True])
+    assert 'db_connection_checkouts_per_request_sum{route="/test/True"} 3.0' in lines
+    assert 'db_connections_opened_per_request_sum{route="/test/True"} 2.0' in lines
+
+
+def test_connects_are_not_reported_for_a_background_pool():
+    lines = observe(False, [None, None])
+    assert 'db_connection_checkouts_per_request_sum{route="/test/False"} 2.0' in lines
+    assert not any(line.startswith("db_connections_opened_per_request") for line in lines)
+
+
+def test_statement_label():
+    assert metrics.statement_label("SELECT id FROM course_topics WHERE id = %s") == "SELECT course_topics"
+    assert metrics.statement_label("insert into skills (name) values (%s)") == "INSERT skills"
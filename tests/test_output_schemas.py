@@ -0,0 +1,61 @@
+import json
+import os
+import pytest
+import output_schemas
+from output_schemas import OutputError
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "samples")
+
+
+def sample_outline(name="outline-net_core.json"):
+    with open(os.path.join(SAMPLES_DIR, name), "r") as file:
+        result = json.load(file)
+    # The model's output is the stored outline without the topic ids generate_outline adds
+    return {**result, "topics": [{k: v for k, v in topic.items() if k != "id"} for topic in result["topics"]]}
+
+
+def mismatch(validator, value):
+    with pytest.raises(OutputError) as info:
+        validator.validate(value)
+    return str(info.value)
+
+
+def test_sample_outlines_are_valid():
+    for name in os.listdir(SAMPLES_DIR):
+        if name.startswith("outline-"):
+            outline = sample_outline(name)
+            assert output_schemas.OUTLINE.validate(outline) is outline
+
+
+def test_mismatch_names_the_path():
+    outline = sample_outline()
+    del outline["topics"][1]["hands_on_practice"][0]["description"]
+    assert mismatch(output_schemas.OUTLINE, outline) == \
+        "$.topics[1].hands_on_practice[0]: missing required property 'description'"
+
+
+def test_closed_objects_reject_unexpected_properties():
+    outline = sample_outline()
+    outline["topics"][0]["extra"] = 1
+    assert mismatch(output_schemas.OUTLINE, outline) == "$.topics[0]: unexpected property 'extra'"
+
+
+def test_types_and_enums():
+    assert mismatch(output_schemas.BLOCKS, {"topic": "t", "subtopic": "s", "blocks": [
+        {"block_type": "video", "content": "x"}]}) == "$.blocks[0].block_type: expected one of ['image', 'text'], got 'video'"
+    # true is not an integer in JSON
+    course = {"title": "t", "description": "d", "topics": [{"title": "a", "description": "b", "sequence_number": True}]}
+    assert mismatch(output_schemas.COURSE_OUTLINE, course) == "$.topics[0].sequence_number: expected integer, got boolean"
+
+
+def test_open_schemas_only_check_the_fields_read():
+    skills = {"skills": [{"skill": "SQL", "level": 3}], "summary": "anything"}
+    assert output_schemas.SKILLS.validate(skills) is skills
+    assert mismatch(output_schemas.SKILLS, {"skills": [{"category": "x"}]}) == "$.skills[0]: missing required property 'skill'"
+
+
+def test_parse_rejects_invalid_json():
+    with pytest.raises(OutputError) as info:
+        output_schemas.BLOCKS.parse('{"topic": ')
+    assert info.value.path == "$"
+    assert output_schemas.BLOCKS.parse('{"topic": "t", "subtopic": "s", "blocks": []}')["blocks"] == []
@@ -0,0 +1,164 @@
+import asyncio
+import threading
+import time
+import httpx
+import openai
+import pytest
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, Resilience
+
+
+def connection_error():
+    return openai.APIConnectionError(request=httpx.Request("POST", "http://api"))
+
+
+def upstream_down(timeout):
+    raise connection_error()
+
+
+@pytest.fixture(autouse=True)
+def _fast_backoff(monkeypatch):
+    monkeypatch.setattr(resilience, "BACKOFF_BASE", 0.001)
+
+
+def test_breaker_opens_then_lets_one_trial_through():
+    breaker = CircuitBreaker(failures=2, reset_after=0.05)
+    breaker.before_call()
+    # An answered bad request says nothing about the upstream's health
+    breaker.failure(unhealthy=False)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.failure(unhealthy=True)
+    assert breaker.state == "open" and not breaker.available()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    assert breaker.available()
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    # A failed trial opens it again, a successful one closes it
+    breaker.failure(unhealthy=True)
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.success()
+    assert breaker.stats() == {"state": "closed", "consecutive_failures": 0, "opened": 2, "rejected": 2}
+
+
+def test_cancelled_trial_frees_the_half_open_breaker():
+    breaker = CircuitBreaker(failures=1, reset_after=0)
+    breaker.before_call()
+    breaker.failure(unhealthy=True)
+    breaker.before_call()
+    breaker.cancelled()
+    breaker.before_call()
+    assert breaker.state == "half_open"
+
+
+def test_call_retries_upstream_failures_only():
+    upstream = Resilience(max_retries=2, hedged_call_sites=set())
+    attempts = []
+
+    def flaky(timeout):
+        attempts.append(timeout)
+        if len(attempts) < 3:
+            raise connection_error()
+        return "answer"
+
+    assert upstream.call("site", "model", flaky) == "answer"
+    assert len(attempts) == 3 and upstream.stats()["call_sites"]["site"]["retries"] == 2
+
+    def bad_request(timeout):
+        attempts.append(timeout)
+        raise ValueError("bad request")
+
+    attempts.clear()
+    with pytest.raises(ValueError):
+        upstream.call("site", "model", bad_request)
+    assert len(attempts) == 1
+
+    def down(timeout):
+        attempts.append(timeout)
+        upstream_down(timeout)
+
+    # Not idempotent: never retried
+    with pytest.raises(openai.APIConnectionError):
+        upstream.call("site", "model", down, idempotent=False)
+    assert len(attempts) == 2
+
+
+def test_open_breaker_fails_fast():
+    upstream = Resilience(max_retries=0, hedged_call_sites=set(), breaker_failures=2, breaker_reset=60)
+    for _ in range(2):
+        with pytest.raises(openai.APIConnectionError):
+            upstream.call("site", "model", upstream_down)
+    with pytest.raises(CircuitOpenError):
+        upstream.call("site", "model", lambda timeout: "never called")
+    assert upstream.stats()["call_sites"]["site"]["failed_fast"] == 1
+    # Breakers are per model
+    assert upstream.call("site", "other-model", lambda timeout: "ok") == "ok"
+
+
+def test_deadline_caps_timeouts_and_retries():
+    upstream = Resilience(max_retries=5, hedged_call_sites=set())
+    timeouts = []
+
+    with resilience.deadline(0.2):
+        assert upstream.call("site", "model", lambda timeout: timeouts.append(timeout) or "ok") == "ok"
+    assert 0 < timeouts[0] <= 0.2
+
+    with resilience.deadline(0):
+        with pytest.raises(DeadlineExceeded):
+            upstream.call("site", "model", lambda timeout: "never called")
+
+    def slow_failure(timeout):
+        time.sleep(0.03)
+        upstream_down(timeout)
+
+    with resilience.deadline(0.05):
+        with pytest.raises(DeadlineExceeded):
+            upstream.call("site", "model", slow_failure)
+    assert resilience.remaining() is None
+
+
+def test_hedge_races_a_slow_call(monkeypatch):
+    upstream = Resilience(max_retries=0, hedged_call_sites={"site"})
+    monkeypatch.setattr(upstream, "_hedge_delay", lambda call_site: 0.02)
+    first = threading.Event()
+
+    def fn(timeout):
+        if not first.is_set():
+            first.set()
+            time.sleep(0.3)
+            return "primary"
+        return "hedge"
+
+    assert upstream.call("site", "model", fn) == "hedge"
+    counts = upstream.stats()["call_sites"]["site"]
+    assert counts["hedges"] == 1 and counts["hedge_wins"] == 1 and counts["hedge_win_rate"] == 1.0
+
+
+def test_async_hedge_cancels_the_loser(monkeypatch):
+    upstream = Resilience(max_retries=0, hedged_call_sites={"site"})
+    monkeypatch.setattr(upstream, "_hedge_delay", lambda call_site: 0.02)
+    calls = []
+    cancelled = []
+
+    async def fn(timeout):
+        calls.append(timeout)
+        if len(calls) == 1:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            return "primary"
+        return "hedge"
+
+    assert asyncio.run(upstream.acall("site", "model", fn)) == "hedge"
+    assert cancelled == [True]
+    # The cancelled primary did not count against the breaker
+    assert upstream.breaker("model").stats()["consecutive_failures"] == 0
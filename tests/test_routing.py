@@ -0,0 +1,62 @@
+import pytest
+import resilience
+import routing
+from routing import Option, Policy, Router
+
+FAST, MEDIUM, SLOW = ("fast-model", None), ("o3-mini", "low"), ("o3-mini", "high")
+
+
+@pytest.fixture
+def router():
+    return Router({"site": Policy([SLOW, MEDIUM, FAST], budget=10)}, min_samples=3, probe_rate=0)
+
+
+def observe(router, option, duration, times=3):
+    route = routing.Route(*option, "primary", [])
+    for _ in range(times):
+        router.observe("site", route, duration)
+
+
+def test_primary_until_it_is_over_budget(router):
+    assert router.choose("site")[:3] == ("o3-mini", "high", "primary")
+    observe(router, SLOW, 20, times=2)
+    # Too few samples to judge
+    assert router.choose("site").reason == "primary"
+    observe(router, SLOW, 20, times=1)
+    route = router.choose("site")
+    assert route[:3] == ("o3-mini", "low", "over_budget")
+    assert route.preferred == [Option(*SLOW)]
+
+
+def test_fastest_when_nothing_fits(router):
+    for option in (SLOW, MEDIUM, FAST):
+        observe(router, option, 30)
+    assert router.choose("site")[:3] == ("fast-model", None, "fastest")
+
+
+def test_request_budget_and_deadline_tighten_the_policy(router):
+    observe(router, SLOW, 5)
+    assert router.choose("site").reason == "primary"
+    with routing.latency_budget(2):
+        assert router.budget("site") == 2
+        assert router.choose("site").model == "o3-mini" and router.choose("site").effort == "low"
+    with resilience.deadline(1):
+        assert router.budget("site") <= 1
+    assert router.budget("site") == 10
+
+
+def test_pinned_and_unknown_call_sites(router):
+    assert router.choose("site", model="gpt-4o-mini")[:3] == ("gpt-4o-mini", None, "pinned")
+    with pytest.raises(ValueError):
+        router.choose("unknown")
+    assert router.decision_counts() == {("site", "gpt-4o-mini", None, "pinned"): 1}
+
+
+def test_stats(router):
+    observe(router, FAST, 1)
+    router.choose("site")
+    stats = router.stats()["site"]
+    assert stats["budget"] == 10
+    assert stats["decisions"] == [{"model": "o3-mini", "effort": "high", "reason": "primary", "count": 1}]
+    options = {option["model"]: option for option in stats["options"]}
+    assert options["fast-model"] == {"model": "fast-model", "effort": None, "samples": 3, "p50": 1, "p95": 1}
@@ -0,0 +1,37 @@
+import numpy as np
+import semantic
+from semantic_index import HashingEmbedder, LocalIndex, SemanticReuse
+
+
+def test_hashing_embedder():
+    embedder = HashingEmbedder(dim=128)
+    vectors = embedder.embed(["Kubernetes administration", "kubernetes  Administration!", "Kubernetes adminstration",
+                              "Pastry baking", ""])
+    assert vectors.shape == (5, 128) and vectors.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(vectors[:4], axis=1), 1, rtol=1e-5)
+    # The empty text stays a zero vector instead of dividing by zero
+    assert not vectors[4].any()
+    same, typo, other = vectors[1:4] @ vectors[0]
+    assert abs(same - 1) < 1e-6
+    assert typo > 0.7 > other
+    np.testing.assert_array_equal(HashingEmbedder(dim=128).embed(["Kubernetes administration"])[0], vectors[0])
+
+
+def test_reuse_is_off_unless_configured(monkeypatch):
+    monkeypatch.delenv("SEMANTIC_INDEX", raising=False)
+    assert semantic._build_reuse() is None
+
+
+def test_reuse_refuses_different_numbers_and_directions(tmp_path):
+    embedder = HashingEmbedder()
+    reuse = SemanticReuse(embedder, LocalIndex(str(tmp_path / "index.npz"), embedder.dim, save_delay=0), threshold=0.9)
+    reuse.store("skills", "Windows Server 2016 Administration", skill_id=1)
+    reuse.store("skills", "Cycle counting procedures for inbound inventory", skill_id=2)
+
+    # Both score above the threshold on spelling alone
+    assert reuse.embed(["Windows Server 2019 Administration"])[0] @ reuse.embed(["Windows Server 2016 Administration"])[0] > 0.9
+    assert reuse.find("skills", ["Windows Server 2019 Administration",
+                                 "Cycle counting procedures for outbound inventory",
+                                 "windows server 2016 administration!"]) == [None, None, {"text": "Windows Server 2016 Administration", "skill_id": 1}]
+    counts = reuse.stats()["namespaces"]["skills"]
+    assert (counts["hits"], counts["refused"]) == (1, 2)
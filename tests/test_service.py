@@ -0,0 +1,119 @@
+import asyncio
+import pytest
+import adb
+import db
+import queries
+import service
+
+
+class FakeCursor:
+    """Records statements and answers fetches from a list of canned results"""
+
+    def __init__(self, results=()):
+        self.results = list(results)
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+
+    def fetchone(self):
+        return self.results.pop(0)
+
+    fetchall = fetchone
+
+
+class AsyncFakeCursor(FakeCursor):
+    async def execute(self, sql, params=None):
+        super().execute(sql, params)
+
+    async def fetchone(self):
+        return super().fetchone()
+
+    fetchall = fetchone
+
+
+def test_advance_topic_with_cached_order():
+    db.cache_topic_order(900, [901, 902, 903, 904])
+    cursor = FakeCursor()
+    report, topic_ids = db.run_steps(cursor, service.advance_topic(7, 902))
+    assert report == {"course_outline_id": 900, "completion_percentage": 50, "current_topic_id": 902, "next_topic_id": 903}
+    assert topic_ids == (901, 902, 903, 904)
+    assert cursor.statements == [(queries.SAVE_PROGRESS, (7, 900, 903, 50))]
+
+
+def test_advance_unknown_topic():
+    cursor = FakeCursor([None])
+    with pytest.raises(service.NotFound):
+        db.run_steps(cursor, service.advance_topic(7, 123456))
+    assert service.error_status(service.NotFound()) == 404
+
+
+def test_both_drivers_run_the_same_statements():
+    assessments = [{"topic_id": 1, "proficiency_level": 2}, {"topic_id": 2, "proficiency_level": 3},
+                   {"topic_id": 1, "proficiency_level": 4}, {"topic_id": 99, "proficiency_level": 1}]
+    rows = [(1, 10), (2, 20)]
+    cursor = FakeCursor([rows])
+    db.run_steps(cursor, service.store_assessments(7, assessments))
+    async_cursor = AsyncFakeCursor([rows])
+    asyncio.run(adb.run_steps(async_cursor, service.store_assessments(7, assessments)))
+
+    assert cursor.statements == async_cursor.statements
+    # The last rating of a skill wins; the unknown topic is skipped
+    assert cursor.statements[-1] == (queries.UPSERT_ASSESSMENTS, (7, [10, 20], [4, 3]))
+
+
+def _progress(user_id):
+    return (yield db.fetch_all(
+        "SELECT course_outline_id, current_topic_id, completion_percentage FROM user_course_progress WHERE user_id = %s",
+        (user_id,)))
+
+
+@pytest.fixture
+def course(database):
+    """A stored outline of three topics, written out of sequence order; returns (skill id, ordered topic ids)"""
+    skill_ids = database(db.upsert_skill_steps(["Python"]))
+    topics = [{"title": f"Topic {n}", "description": "", "sequence_number": n} for n in (2, 1, 3)]
+    outline, _ = database(service.store_outline(skill_ids["Python"], {"title": "Python", "description": "", "topics": topics}))
+    ordered = [topic["id"] for topic in sorted(outline["topics"], key=lambda topic: topic["sequence_number"])]
+    return skill_ids["Python"], ordered
+
+
+def test_advance_topic_in_one_statement(database, course):
+    _, (first, second, last) = course
+    report, topic_ids = database(service.advance_topic(7, first))
+    outline_id = report["course_outline_id"]
+    assert list(topic_ids) == [first, second, last] and db.topic_order(outline_id) == (first, second, last)
+    assert report["next_topic_id"] == second and report["completion_percentage"] == pytest.approx(100 / 3)
+    assert database(_progress(7)) == [(outline_id, second, pytest.approx(100 / 3))]
+
+    # Uncached again, the last topic finishes the course and updates the same row
+    db._topic_orders.clear()
+    db._topic_outlines.clear()
+    report, _ = database(service.advance_topic(7, last))
+    assert (report["next_topic_id"], report["completion_percentage"]) == (None, 100)
+    assert database(_progress(7)) == [(outline_id, None, 100)]
+
+    with pytest.raises(service.NotFound):
+        database(service.advance_topic(7, last + 100))
+
+
+def test_store_assessments_keeps_one_rating_per_skill(database, course):
+    python_id, (first, second, _) = course
+    sql_id = database(db.upsert_skill_steps(["SQL"]))["SQL"]
+    outline, _ = database(service.store_outline(sql_id, {"title": "SQL", "description": "", "topics": [
+        {"title": "Joins", "description": "", "sequence_number": 1}]}))
+    sql_topic = outline["topics"][0]["id"]
+
+    def ratings():
+        return (yield db.fetch_all(
+            "SELECT skill_id, proficiency_level FROM user_skill_assessments WHERE user_id = %s ORDER BY skill_id", (7,)))
+
+    # Two topics of one skill: the last rating in the payload wins
+    database(service.store_assessments(7, [{"topic_id": first, "proficiency_level": 2},
+                                           {"topic_id": sql_topic, "proficiency_level": 1},
+                                           {"topic_id": second, "proficiency_level": 4}]))
+    assert database(ratings()) == sorted([(python_id, 4), (sql_id, 1)])
+
+    # Rating again updates the stored row
+    database(service.store_assessments(7, [{"topic_id": sql_topic, "proficiency_level": 5}]))
+    assert database(ratings()) == sorted([(python_id, 4), (sql_id, 5)])
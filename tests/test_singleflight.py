@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+import pytest
+import db
+import resilience
+import singleflight
+from singleflight import SingleFlight
+
+
+def test_do_runs_once_for_concurrent_callers():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "outline"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do(("outline", 1), work)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flights.do(("outline", 1), work))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    while flights.stats().get("outline", {}).get("coalesced", 0) < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert results == ["outline"] * 4 and calls == [1]
+    assert flights.stats()["outline"] == {"leaders": 1, "coalesced": 3, "coalesced_db": 0}
+    assert flights.in_flight() == []
+
+
+def test_do_shares_the_leaders_error():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise ValueError("model down")
+
+    errors = []
+
+    def call():
+        try:
+            flights.do(("topic_content", 1), fail)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    while flights.stats()["topic_content"]["coalesced"] < 1:
+        time.sleep(0.01)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert len(errors) == 2 and errors[0] is errors[1]
+
+
+def test_ado_runs_once_and_survives_a_cancelled_follower():
+    flights = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "content"
+
+    async def main():
+        leader = asyncio.create_task(flights.ado(("topic_content", 2), work))
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(flights.ado(("topic_content", 2), work))
+        follower = asyncio.create_task(flights.ado(("topic_content", 2), work))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        return await leader, await follower
+
+    assert asyncio.run(main()) == ("content", "content")
+    assert calls == [1]
+    assert flights.stats()["topic_content"]["coalesced"] == 2
+
+
+def _statement(statement):
+    return (yield statement)
+
+
+def _load(name):
+    """Steps reading a stored generation result from a scratch table"""
+    row = yield db.fetch_one("SELECT result FROM generated WHERE name = %s", (name,))
+    return row and row[0]
+
+
+def _store(name, result):
+    yield db.execute("INSERT INTO generated (name, result) VALUES (%s, %s)", (name, result))
+    return result, True
+
+
+@pytest.fixture
+def claims(database, monkeypatch):
+    database(_statement(db.execute("CREATE TABLE generated (name TEXT PRIMARY KEY, result TEXT)")))
+    singleflight.ensure_schema()
+    monkeypatch.setattr(singleflight, "flights", SingleFlight())
+    return database
+
+
+def test_generate_once_across_workers(claims):
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def generate():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "outline"
+
+    def worker():
+        results.append(singleflight.generate_once(claims, "outline", 1, lambda: _load("a"), generate,
+                                                  lambda result: _store("a", result), poll_interval=0.01))
+
+    results = []
+    first = threading.Thread(target=worker)
+    first.start()
+    started.wait(5)
+    # A worker in another process: not coalesced in-process, it finds the claim and waits
+    second = threading.Thread(target=worker)
+    second.start()
+    time.sleep(0.1)
+    release.set()
+    first.join(5)
+    second.join(5)
+
+    assert calls == [1]
+    assert sorted(results) == [("outline", False), ("outline", True)]
+    # Only the worker that skipped generation counts as coalesced, and the claim is gone
+    assert singleflight.flights.stats()["outline"]["coalesced_db"] == 1
+    assert claims(_statement(db.fetch_one("SELECT count(*) FROM generation_claims"))) == (0,)
+
+
+def test_failed_generation_hands_the_claim_on(claims):
+    def fail():
+        raise resilience.CircuitOpenError("model down")
+
+    with pytest.raises(resilience.CircuitOpenError):
+        singleflight.generate_once(claims, "outline", 2, lambda: _load("b"), fail, lambda result: _store("b", result))
+    assert singleflight.generate_once(claims, "outline", 2, lambda: _load("b"), lambda: "retried",
+                                      lambda result: _store("b", result)) == ("retried", True)
+
+
+def test_waiting_on_a_live_claim_keeps_the_deadline(claims):
+    assert claims(singleflight.claim("topic_content", 4, lambda: _load("d"), 60)) == (None, True)
+    with resilience.deadline(0.05), pytest.raises(resilience.DeadlineExceeded):
+        singleflight.generate_once(claims, "topic_content", 4, lambda: _load("d"), lambda: "never",
+                                   lambda result: _store("d", result), poll_interval=0.01)
+
+
+def test_expired_claim_is_taken_over(claims):
+    # A worker that crashed while holding the claim
+    assert claims(singleflight.claim("outline", 3, lambda: _load("c"), 0.05)) == (None, True)
+    assert claims(singleflight.claim("outline", 3, lambda: _load("c"), 60)) == (None, False)
+    time.sleep(0.1)
+    assert singleflight.generate_once(claims, "outline", 3, lambda: _load("c"), lambda: "taken over",
+                                      lambda result: _store("c", result)) == ("taken over", True)
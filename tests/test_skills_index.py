@@ -0,0 +1,108 @@
+import db
+from skills_index import SkillIndex, canonical_key, distinguishing_terms
+
+
+def test_canonical_key():
+    assert canonical_key("SQL Server Performance Tuning") == canonical_key("  sql server performance-tuning ")
+    assert canonical_key("Café & Bar") == "cafe and bar"
+    assert len({canonical_key(name) for name in ("C", "C++", "C#")}) == 3
+
+
+def test_distinguishing_terms():
+    assert distinguishing_terms(canonical_key("Windows Server 2016 Administration")) == {"2016"}
+    assert distinguishing_terms(canonical_key("Cycle counting for inbound inventory")) == {"inbound"}
+    assert distinguishing_terms(canonical_key("Testing without mocks")) == {"without"}
+    assert not distinguishing_terms(canonical_key("Kubernetes Administration"))
+
+
+def test_match():
+    index = SkillIndex(threshold=0.75)
+    index.add(1, "Kubernetes Administration")
+    index.add(2, "Python 3")
+    index.add(3, "kubernetes administration")  # same key: the first id is kept
+
+    assert index.match("KUBERNETES administration") == (1, "exact", 1.0)
+    # Look-alikes are never merged
+    assert index.match("Kubernetes Administraton") is None
+    assert index.match("Python 2") is None
+    assert index.match("Kubernetes Administration", exclude=1) is None
+    assert index.match("Welding") is None
+    assert index.stats() == {"lookups": 5, "exact": 1, "new": 4, "similar": 0, "indexed": 2, "reuse_rate": 0.2}
+
+
+def test_similar_reports_candidates_only():
+    index = SkillIndex(threshold=0.75)
+    index.add(1, "Kubernetes Administration")
+    index.add(2, "Python 3")
+    index.add(3, "SQL Server Performance Tuning")
+    index.add(4, "Inbound Inventory Management")
+
+    skill_id, key, score = index.similar("Kubernetes Administraton")
+    assert (skill_id, key) == (1, "kubernetes administration") and 0.75 <= score < 1
+    # Different numbers are different skills
+    assert index.similar("Python 2") is None
+    # A same-key name is a match, not a candidate
+    assert index.similar("kubernetes administration") is None
+    # Distinct skills that look alike are candidates, and match() keeps them apart
+    assert index.similar("MySQL Server Performance Tuning")[0] == 3
+    # Opposite directions are not even candidates
+    assert index.similar("Outbound Inventory Management") is None
+    assert index.match("MySQL Server Performance Tuning") is None
+    assert index.match("Outbound Inventory Management") is None
+
+
+def test_plan_skills_merges_canonical_names_only(monkeypatch):
+    index = SkillIndex()
+    index.add(7, "SQL Server Performance Tuning")
+    monkeypatch.setattr(db, "skill_index", index)
+
+    names = ["sql server performance-tuning", "MySQL Server Performance Tuning", "Go", "GO", "Outbound Inventory Management"]
+    skill_ids, aliases, new_names = db.plan_skills(names)
+    assert skill_ids == {"sql server performance-tuning": 7}
+    assert aliases == {"GO": "Go"}
+    assert new_names == ["MySQL Server Performance Tuning", "Go", "Outbound Inventory Management"]
+
+
+def test_load_watermark_ignores_local_adds():
+    index = SkillIndex()
+    assert index.needs_load()
+    assert index.load_query()[1] == (0,)
+    index.load_rows([(1500, "Rust"), (1200, "Go")])
+    assert not index.needs_load() and index.needs_load(refresh_after=0)
+    # Rows committed later with lower ids are read again within the overlap
+    assert index.load_query()[1] == (500,)
+    assert index.load_query(overlap=10)[1] == (1490,)
+    index.add(9000, "Zig")
+    assert index.load_query()[1] == (500,)
+    index.load_rows([])
+    assert index.load_query()[1] == (500,)
+
+
+def _linked(job_id):
+    return (yield db.fetch_all("SELECT skill_id FROM job_skills WHERE job_id = %s", (job_id,)))
+
+
+def test_upsert_skills(database):
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        first = db.upsert_skills(cursor, ["Go", "Rust", "Go"])
+        assert sorted(first) == ["Go", "Rust"]
+        # Existing names keep their ids, new ones are inserted once
+        again = db.upsert_skills(cursor, ["Rust", "Zig", "Go"])
+        assert again == {**first, "Zig": again["Zig"]} and again["Zig"] not in first.values()
+        assert db.upsert_skills(cursor, []) == {}
+        cursor.execute("SELECT count(*) FROM skills")
+        assert cursor.fetchone() == (3,)
+
+
+def test_resolve_skills_upserts_new_canonical_keys_only(database):
+    stored = database(db.upsert_skill_steps(["SQL Server Performance Tuning"]))
+    skill_ids, inserted = database(db.resolve_skill_steps(
+        ["sql server performance-tuning", "Go", "GO", "MySQL Server Performance Tuning"]))
+    assert skill_ids["sql server performance-tuning"] == stored["SQL Server Performance Tuning"]
+    assert skill_ids["GO"] == skill_ids["Go"]
+    assert sorted(inserted) == ["Go", "MySQL Server Performance Tuning"]
+
+    # Linked to a posting once per skill
+    assert db.save_skills_list(["Go", "go", "Rust"], job_id=5)["skills"][1]["id"] == skill_ids["Go"]
+    assert len(database(_linked(5))) == 2
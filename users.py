@@ -0,0 +1,4 @@
+# Simple user authentication (for demo purposes), shared by app.py and asgi.py
+USERS = {
+    'test_token': {'id': 1, 'username': 'test_user'}
+}
@@ -1,26 +1,119 @@
 import os
 import json
+import sys
+import time
+import atexit
+import queue
+import threading
+from contextvars import ContextVar
+from dotenv import load_dotenv
 
 from enum import Enum
 
+# Settings come from the environment or .env. Loaded once, here: every module imports util before reading them
+load_dotenv()
+
 class LogLevel(Enum):
     Verbose = 1
     Info = 2
     Warning = 3
     Error = 4
 
-def log(level:LogLevel, message):
-    print(f"{level}: {message}")
+def _level_from_env():
+    name = os.getenv('LOG_LEVEL', 'Info').capitalize()
+    return LogLevel[name] if name in LogLevel.__members__ else LogLevel.Info
+
+_min_level = _level_from_env().value
+_request_id = ContextVar('request_id', default=None)
+
+# Records are serialized and written by a background thread so a request never waits on stdout
+_queue = queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+_writer = None
+_writer_lock = threading.Lock()
+_dropped = 0
+_STOP = object()
+
+def set_min_level(level:LogLevel):
+    global _min_level
+    _min_level = level.value
+
+def is_enabled(level:LogLevel):
+    return level.value >= _min_level
+
+def set_request_id(request_id):
+    """Tag records logged from the current context; returns a token for reset_request_id"""
+    return _request_id.set(request_id)
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+def _write(stream):
+    while True:
+        record = _queue.get()
+        if record is _STOP:
+            break
+        stream.write(json.dumps(record, default=str) + "\n")
+        if _queue.empty():
+            stream.flush()
+    stream.flush()
+
+def _ensure_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write, args=(sys.stdout,), name="log-writer", daemon=True)
+            _writer.start()
+            atexit.register(flush)
+
+def flush(timeout=2.0):
+    """Stop the writer after draining queued records (called at exit)"""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        _queue.put(_STOP)
+        writer.join(timeout)
+
+def log(level:LogLevel, message, *args, **fields):
+    """Log a JSON record if level is enabled.
+
+    Nothing is formatted below the minimum level: pass %-style args, or a callable
+    as message, instead of pre-formatting expensive values. Extra keyword arguments
+    become fields of the record.
+    """
+    global _dropped
+    if level.value < _min_level:
+        return
+    if callable(message):
+        message = message()
+    elif args:
+        message = message % args
+    record = {
+        "ts": time.time(),
+        "level": level.name,
+        "message": message if isinstance(message, str) else str(message),
+        "request_id": _request_id.get(),
+        **fields,
+    }
+    if _writer is None:
+        _ensure_writer()
+    try:
+        _queue.put_nowait(record)
+    except queue.Full:
+        _dropped += 1
+
+def dropped_records():
+    return _dropped
 
 
-def log_info(message):
-    log(LogLevel.Info,message)    
+def log_info(message, *args, **fields):
+    log(LogLevel.Info, message, *args, **fields)
 
-def log_warning(message):
-    log(LogLevel.Warning,message)    
+def log_warning(message, *args, **fields):
+    log(LogLevel.Warning, message, *args, **fields)
 
-def log_verbose(message):
-    log(LogLevel.Verbose,message)    
+def log_verbose(message, *args, **fields):
+    log(LogLevel.Verbose, message, *args, **fields)
 
-def log_error(message):
-    log(LogLevel.Error,message)    
\ No newline at end of file
+def log_error(message, *args, **fields):
+    log(LogLevel.Error, message, *args, **fields)
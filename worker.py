@@ -0,0 +1,21 @@
+"""Background worker for queued generation jobs: `python worker.py [--threads N]`"""
+import argparse
+import threading
+import jobs
+from app import JOB_HANDLERS
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run queued generation jobs")
+    parser.add_argument("--threads", type=int, default=1, help="jobs to run concurrently in this process")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    threads = [
+        threading.Thread(target=jobs.run_worker, args=(JOB_HANDLERS, args.poll_interval), daemon=True)
+        for _ in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()